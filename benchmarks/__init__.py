@@ -0,0 +1,14 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+"""
+ppytty kernel benchmarks
+
+Run with `python -m benchmarks --help` from the repository root.
+"""
+
+# ----------------------------------------------------------------------------
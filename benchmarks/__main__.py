@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import argparse
+import gc
+import json
+import platform
+import sys
+
+from . cases import CASES
+
+
+
+def parse_arguments(argv=sys.argv):
+
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    arg_parser.add_argument('cases', nargs='*', metavar='case',
+                            help=f'cases to run, default all: {", ".join(CASES)}')
+    arg_parser.add_argument('-s', '--scale', type=float, default=1.0,
+                            help='operation count multiplier, default 1.0')
+    arg_parser.add_argument('-o', '--save', metavar='<json-filename>',
+                            help='save results, to be used as a baseline')
+    arg_parser.add_argument('-c', '--compare', metavar='<json-filename>',
+                            help='compare results with a saved baseline')
+    arg_parser.add_argument('-t', '--threshold', type=float, default=0.10,
+                            help="""ops/sec relative drop, versus the baseline,
+                            considered a regression, default 0.10""")
+
+    args = arg_parser.parse_args(argv[1:])
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        arg_parser.error(f'unknown cases: {", ".join(sorted(unknown))}')
+    return args
+
+
+
+def percentile(sorted_values, fraction):
+
+    # Nearest-rank percentile.
+    index = max(0, min(len(sorted_values)-1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+
+def run_case(name, ops):
+
+    function, _ = CASES[name]
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        durations = function(ops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    durations.sort()
+    total = sum(durations)
+    return {
+        'ops': len(durations),
+        'ops_per_sec': len(durations) / total if total else float('inf'),
+        'p50_us': percentile(durations, 0.50) * 1e6,
+        'p90_us': percentile(durations, 0.90) * 1e6,
+        'p99_us': percentile(durations, 0.99) * 1e6,
+        'max_us': durations[-1] * 1e6,
+    }
+
+
+
+def print_result(name, result, baseline_result=None):
+
+    line = (
+        f'{name:<22} {result["ops"]:>7} ops {result["ops_per_sec"]:>12.1f} ops/s '
+        f'p50={result["p50_us"]:>9.2f}us p90={result["p90_us"]:>9.2f}us '
+        f'p99={result["p99_us"]:>9.2f}us max={result["max_us"]:>10.2f}us'
+    )
+    if baseline_result:
+        change = result['ops_per_sec'] / baseline_result['ops_per_sec'] - 1
+        line += f' {change:>+8.1%}'
+    print(line, flush=True)
+
+
+
+def main():
+
+    args = parse_arguments()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['cases']
+
+    results = {}
+    regressions = []
+    for name in (args.cases or CASES):
+        _, default_ops = CASES[name]
+        ops = max(1, int(default_ops * args.scale))
+        result = run_case(name, ops)
+        results[name] = result
+        baseline_result = baseline.get(name)
+        print_result(name, result, baseline_result)
+        if baseline_result:
+            change = result['ops_per_sec'] / baseline_result['ops_per_sec'] - 1
+            if change < -args.threshold:
+                regressions.append(name)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cases': results,
+            }, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print(f'regressions over {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+
+    return 0
+
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
+
+# ----------------------------------------------------------------------------
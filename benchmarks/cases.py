@@ -0,0 +1,318 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+"""
+Benchmark cases
+
+Each case is a function taking the number of operations to time and returning
+a list with each operation's duration, in seconds. Kernel based cases run on a
+HeadlessTerminal, requiring no TTYs.
+"""
+
+import random
+import time
+
+from ppytty.kernel import run, api, HeadlessTerminal
+from ppytty.kernel import loop
+from ppytty.kernel import traps
+from ppytty.kernel import window
+
+
+
+WIDTH = 80
+HEIGHT = 25
+
+
+# Keys: case names, Values: (case function, default operation count)
+
+CASES = {}
+
+
+def case(name, ops):
+
+    def decorator(function):
+        CASES[name] = (function, ops)
+        return function
+
+    return decorator
+
+
+
+def _run_in_kernel(task, frame_interval=loop.FRAME_INTERVAL):
+
+    terminal = HeadlessTerminal(WIDTH, HEIGHT, capture_screen=False)
+    success, result = run(task, terminal=terminal, frame_interval=frame_interval)
+    if not success:
+        raise RuntimeError(f'benchmark task failed: {result!r}')
+    return result
+
+
+
+def _fill_window(w, seed=42):
+
+    rng = random.Random(seed)
+    words = ('ppytty', 'kernel', 'window', 'render', 'trap', 'task', 'pty')
+    for y in range(w.height):
+        line = ' '.join(rng.choice(words) for _ in range(w.width // 6))
+        w.print(line[:w.width], x=0, y=y, fg=rng.randrange(8), bg=rng.randrange(8))
+
+
+
+def _process_output_chunk(size, seed=42):
+
+    # Colored lines of text, like the ones produced by `ls --color`.
+    rng = random.Random(seed)
+    chunk = bytearray()
+    while len(chunk) < size:
+        color = rng.randrange(31, 38)
+        chunk += b'\x1b[%dmfile-%06d\x1b[0m  ' % (color, rng.randrange(10**6))
+        if rng.random() < 0.2:
+            chunk += b'\r\n'
+    return bytes(chunk[:size])
+
+
+
+@case('trap_round_trip', ops=20000)
+def trap_round_trip(ops):
+
+    async def task():
+        durations = []
+        for _ in range(ops):
+            start = time.perf_counter()
+            await api.sleep(0)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task)
+
+
+
+@case('message_ping_pong', ops=10000)
+def message_ping_pong(ops):
+
+    async def ponger():
+        while True:
+            sender, message = await api.message_wait()
+            await api.message_send(sender, message)
+
+    async def task():
+        await api.task_spawn(ponger)
+        durations = []
+        for n in range(ops):
+            start = time.perf_counter()
+            await api.message_send(ponger, n)
+            await api.message_wait()
+            durations.append(time.perf_counter() - start)
+        await api.task_destroy(ponger)
+        await api.task_wait()
+        return durations
+
+    return _run_in_kernel(task)
+
+
+
+@case('task_spawn_wait', ops=5000)
+def task_spawn_wait(ops):
+
+    async def child():
+        return 42
+
+    async def task():
+        durations = []
+        for _ in range(ops):
+            start = time.perf_counter()
+            await api.task_spawn(child)
+            await api.task_wait()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task)
+
+
+
+@case('window_render_full', ops=500)
+def window_render_full(ops):
+
+    terminal = HeadlessTerminal(WIDTH, HEIGHT, capture_screen=False)
+    w = window.Window(terminal.window, 0, 0, WIDTH, HEIGHT)
+    _fill_window(w)
+    durations = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        w.render(full=True)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+
+@case('window_render_line', ops=5000)
+def window_render_line(ops):
+
+    terminal = HeadlessTerminal(WIDTH, HEIGHT, capture_screen=False)
+    w = window.Window(terminal.window, 0, 0, WIDTH, HEIGHT)
+    _fill_window(w)
+    w.render(full=True)
+    durations = []
+    for n in range(ops):
+        w.print(f'{n:>10}', x=0, y=n % HEIGHT)
+        start = time.perf_counter()
+        w.render()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+
+@case('overlapping_render', ops=1000)
+def overlapping_render(ops):
+
+    async def task():
+        windows = []
+        for n in range(8):
+            w = await api.window_create(n*4, n*2, 40, 12, bg=n)
+            _fill_window(w, seed=n)
+            windows.append(w)
+        await api.window_render(windows[-1], full=True)
+        middle = windows[len(windows) // 2]
+        durations = []
+        for n in range(ops):
+            middle.print(f'{n:>10}', x=0, y=n % middle.height)
+            start = time.perf_counter()
+            traps._do_window_render(middle, full=True)
+            loop.process_terminal_render()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task)
+
+
+
+@case('window_drag', ops=2000)
+def window_drag(ops):
+
+    # Like examples/move_windows.py: each operation moves a window, rendering
+    # the whole terminal frame, with no frame pacing.
+    async def task():
+        back = await api.window_create(0, 0, WIDTH, HEIGHT, bg=4)
+        _fill_window(back)
+        w = await api.window_create(0, 0, 30, 12, bg=2)
+        _fill_window(w, seed=1)
+        await api.window_render(back)
+        durations = []
+        for n in range(ops):
+            start = time.perf_counter()
+            w.move(dx=1 if (n // 40) % 2 == 0 else -1, dy=0)
+            await api.window_render(w)
+            await api.frame_wait()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task, frame_interval=0)
+
+
+
+@case('tiled_windows_render', ops=2000)
+def tiled_windows_render(ops):
+
+    # Monitoring like layout: 120 small windows, each operation nudging one
+    # of them back and forth, rendering it.
+    async def task():
+        windows = []
+        for y in range(0, HEIGHT - 1, 2):
+            for x in range(0, WIDTH, 8):
+                w = await api.window_create(x, y, 8, 2, bg=(x + y) % 8)
+                w.print(f'{x:>3},{y:<3}', x=0, y=0)
+                windows.append(w)
+                await api.window_render(w)
+        await api.frame_wait()
+        durations = []
+        for n in range(ops):
+            w = windows[n % len(windows)]
+            start = time.perf_counter()
+            w.move(dx=1 if (n // len(windows)) % 2 == 0 else -1)
+            traps._do_window_render(w)
+            loop.process_terminal_render()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task, frame_interval=0)
+
+
+
+@case('popup_toggle', ops=2000)
+def popup_toggle(ops):
+
+    # Like a speaker notes popup: each operation hides or shows a window on
+    # top of a full terminal one, rendering the whole terminal frame.
+    async def task():
+        back = await api.window_create(0, 0, WIDTH, HEIGHT, bg=4)
+        _fill_window(back)
+        await api.window_render(back)
+        popup = await api.window_create(10, 5, 60, 10, bg=2)
+        _fill_window(popup, seed=1)
+        await api.window_render(popup)
+        await api.frame_wait()
+        durations = []
+        for n in range(ops):
+            start = time.perf_counter()
+            if n % 2:
+                await api.window_show(popup)
+            else:
+                await api.window_hide(popup)
+            await api.frame_wait()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task, frame_interval=0)
+
+
+
+@case('log_tail_render', ops=2000)
+def log_tail_render(ops):
+
+    # Tailing logs in a full-width bottom pane: each operation scrolls in one
+    # new line, rendering the whole terminal frame.
+    async def task():
+        top = await api.window_create(0, 0, WIDTH, HEIGHT // 2, bg=4)
+        _fill_window(top)
+        await api.window_render(top)
+        w = await api.window_create(0, HEIGHT // 2, WIDTH, HEIGHT - HEIGHT // 2)
+        _fill_window(w, seed=1)
+        await api.window_render(w)
+        await api.frame_wait()
+        durations = []
+        for n in range(ops):
+            start = time.perf_counter()
+            w.feed(f'\r\n{n:>8} ppytty kernel log line'.encode())
+            traps._do_window_render(w)
+            loop.process_terminal_render()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task, frame_interval=0)
+
+
+
+@case('pty_ingest_4k', ops=2000)
+def pty_ingest_4k(ops):
+
+    chunk = _process_output_chunk(4096)
+
+    async def task():
+        w = await api.window_create(0, 0, WIDTH, HEIGHT)
+        durations = []
+        for _ in range(ops):
+            start = time.perf_counter()
+            traps._render_process_output(w, chunk)
+            # Kernel loop iteration in between PTY reads: may render a frame.
+            await api.sleep(0)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    return _run_in_kernel(task)
+
+
+# ----------------------------------------------------------------------------
@@ -21,8 +21,9 @@ async def window_moves():
     await api.key_read()
 
     for _ in range(15):
+        # Both windows reach the output TTY in one go, at the end of the tick.
         w2.move(dx=-2, dy=-1 if random.random()<0.4 else 0)
-        await api.window_render(w2, terminal_render=False)
+        await api.window_render(w2)
         w1.move(dx=2, dy=1 if random.random()<0.5 else 0)
         await api.window_render(w1)
         await api.sleep(0.02)
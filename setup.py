@@ -26,6 +26,7 @@ CLASSIFIERS = [
 INSTALL_REQUIRES = [
     "blessings",
     "pyte",
+    "wcwidth",
 ]
 EXTRAS_REQUIRE = {
     "docs": [
@@ -10,10 +10,12 @@ import logging
 import os
 import runpy
 import sys
+import time
 
 import ppytty
 
 from . import default
+from . kernel import HeadlessTerminal
 
 
 
@@ -50,6 +52,18 @@ def setup_logging(log_filename, log_level_specs):
 
 
 
+def headless_geometry(text):
+
+    try:
+        width, height = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid geometry {text!r}: use <width>x<height>')
+    if width < 1 or height < 1:
+        raise argparse.ArgumentTypeError(f'invalid geometry {text!r}: must be positive')
+    return width, height
+
+
+
 def parse_arguments(argv=sys.argv, env=os.environ):
 
     arg_list = env.get('PPYTTY', '').split()
@@ -63,6 +77,15 @@ def parse_arguments(argv=sys.argv, env=os.environ):
                             dest='log_level_specs', help="""<log-level-spec> is
                             [<logger-name>:]<level>, <level> is
                             [debug|info|warn|error|critical]""")
+    arg_parser.add_argument('--headless', metavar='<width>x<height>',
+                            type=headless_geometry, help="""run on an
+                            in-memory terminal and print timing and output
+                            size; keyboard input is limited to --keys, after
+                            which key reads fail, ending scripts that wait for
+                            more""")
+    arg_parser.add_argument('--keys', metavar='<keys>', default='',
+                            help="""with --headless, the keys read, one per
+                            character""")
     arg_parser.add_argument('script', nargs='?')
 
     return arg_parser.parse_args(arg_list)
@@ -113,7 +136,18 @@ def main():
         print(e)
         return -2
 
-    ppytty.run(task, post_prompt='[COMPLETED]')
+    if args.headless:
+        terminal = HeadlessTerminal(*args.headless, capture_screen=False)
+        # One key per input buffer entry: fed as input, they could be read together.
+        terminal.input_buffer.extend(key.encode('utf8') for key in args.keys)
+        terminal.close_input()
+        start = time.perf_counter()
+        success, result = ppytty.run(task, terminal=terminal)
+        elapsed = time.perf_counter() - start
+        print(f'success={success!r} result={result!r}')
+        print(f'elapsed={elapsed:.6f}s output={len(terminal.output)} bytes')
+    else:
+        ppytty.run(task, post_prompt='[COMPLETED]')
 
     return 0
 
@@ -6,7 +6,9 @@
 # ----------------------------------------------------------------------------
 
 from . loop import run
+from . aioloop import run as run_async
 from . import api
 from . import exceptions
+from . terminal import HeadlessTerminal
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,213 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+"""
+Asyncio Kernel Loop
+
+Runs the kernel as a coroutine on top of a running asyncio event loop, such
+that ppytty tasks and other asyncio code can share the same process: input
+FDs are watched with `add_reader`, output FDs with `add_writer`, sleeps are
+scheduled with `call_at` and signals are handled with `add_signal_handler`.
+"""
+
+import asyncio
+import logging
+import selectors
+
+from . import hw
+from . import loop as _loop
+from . import signals
+from . state import state
+from . terminal import Terminal
+
+
+
+log = logging.getLogger(__name__)
+
+
+
+class AsyncioSelector(object):
+
+    # Selector look-alike, used as the kernel's state.selector, backed by the
+    # asyncio event loop's FD readers and writers. Readiness is collected by
+    # their callbacks and handed over when the kernel loop awaits `select`.
+
+    def __init__(self, aio_loop):
+
+        self._aio_loop = aio_loop
+        self._keys = {}
+        self._ready = {}
+        self._wakeup = asyncio.Event()
+
+
+    def register(self, fd, events, data=None):
+
+        key = selectors.SelectorKey(fd, fd, events, data)
+        self._keys[fd] = key
+        self._watch(fd, 0, events)
+        return key
+
+
+    def modify(self, fd, events, data=None):
+
+        old_key = self._keys[fd]
+        key = selectors.SelectorKey(fd, fd, events, data)
+        self._keys[fd] = key
+        self._watch(fd, old_key.events, events)
+        if fd in self._ready:
+            ready_events = self._ready[fd][1] & events
+            if ready_events:
+                self._ready[fd] = (key, ready_events)
+            else:
+                del self._ready[fd]
+        return key
+
+
+    def unregister(self, fd):
+
+        key = self._keys.pop(fd)
+        self._watch(fd, key.events, 0)
+        self._ready.pop(fd, None)
+        return key
+
+
+    def close(self):
+
+        for fd, key in self._keys.items():
+            self._watch(fd, key.events, 0)
+        self._keys.clear()
+        self._ready.clear()
+
+
+    def _watch(self, fd, old_events, new_events):
+
+        # Adds/removes asyncio readers/writers as per events changes.
+        changed = old_events ^ new_events
+        if changed & selectors.EVENT_READ:
+            if new_events & selectors.EVENT_READ:
+                self._aio_loop.add_reader(fd, self._ready_callback, fd, selectors.EVENT_READ)
+            else:
+                self._aio_loop.remove_reader(fd)
+        if changed & selectors.EVENT_WRITE:
+            if new_events & selectors.EVENT_WRITE:
+                self._aio_loop.add_writer(fd, self._ready_callback, fd, selectors.EVENT_WRITE)
+            else:
+                self._aio_loop.remove_writer(fd)
+
+
+    def _ready_callback(self, fd, event):
+
+        # Level triggered: called again while fd remains readable/writable.
+        try:
+            _, events = self._ready[fd]
+        except KeyError:
+            events = 0
+        self._ready[fd] = (self._keys[fd], events | event)
+        self._wakeup.set()
+
+
+    def wakeup(self):
+
+        self._wakeup.set()
+
+
+    async def select(self, timeout=None):
+
+        if self._ready:
+            pass
+        elif timeout == 0:
+            # Let other asyncio code run in between kernel iterations.
+            await asyncio.sleep(0)
+        else:
+            self._wakeup.clear()
+            if timeout is None:
+                await self._wakeup.wait()
+            else:
+                deadline = self._aio_loop.time() + timeout
+                handle = self._aio_loop.call_at(deadline, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    handle.cancel()
+        events = list(self._ready.values())
+        self._ready.clear()
+        return events
+
+
+    def ensure_future(self, awaitable, done_callback):
+
+        future = asyncio.ensure_future(awaitable, loop=self._aio_loop)
+
+        def callback(future):
+            done_callback(future)
+            self._wakeup.set()
+
+        future.add_done_callback(callback)
+        return future
+
+
+
+async def run(task, post_prompt=None, slice_tasks=_loop.SLICE_TASKS,
+              slice_seconds=_loop.SLICE_SECONDS, terminal=None,
+              frame_interval=_loop.FRAME_INTERVAL):
+
+    aio_loop = asyncio.get_running_loop()
+    installed_signals = []
+
+    def install_handler(signum, handler):
+        aio_loop.add_signal_handler(signum, handler, signum, None)
+        installed_signals.append(signum)
+
+    # A given `terminal`, like a HeadlessTerminal, is used instead of the TTY.
+    with (Terminal() if terminal is None else terminal) as t:
+        state.prepare_to_run(task, t, selector=AsyncioSelector(aio_loop),
+                             frame_interval=frame_interval)
+        signals.track_output_terminal_resizes(install_handler)
+        signals.track_child_process_termination(install_handler)
+        try:
+            success, result = await loop(slice_tasks=slice_tasks,
+                                         slice_seconds=slice_seconds)
+            while post_prompt:
+                await process_lowlevel_io(prompt=post_prompt)
+        except _loop._ForcedStop as e:
+            success, result = None, e
+        finally:
+            for signum in installed_signals:
+                aio_loop.remove_signal_handler(signum)
+            _loop.close_pending_fds()
+
+    return success, result
+
+
+
+async def loop(once=False, slice_tasks=1, slice_seconds=None):
+
+    while _loop.have_tasks():
+        state.now = hw.time_monotonic()
+        await process_lowlevel_io()
+        _loop.process_tasks(slice_tasks, slice_seconds)
+        if once:
+            break
+
+    return state.top_task_success, state.top_task_result
+
+
+
+async def process_lowlevel_io(prompt=None):
+
+    io = _loop.lowlevel_io()
+    timeout = next(io)
+    while True:
+        with _loop._prompt_context(prompt):
+            events = await state.selector.select(timeout)
+        try:
+            timeout = io.send(events)
+        except StopIteration:
+            break
+
+
+# ----------------------------------------------------------------------------
@@ -49,9 +49,10 @@ def window_create(x, y, w, h, dx=0, dy=0, dw=0, dh=0, bg=None):
 def window_destroy(window, terminal_render=True, clear_buffer=False):
     """
     Destroys `window`. If `terminal_render` is True, the output terminal will be
-    updated to reflect its destruction; otherwise, if `clear_buffer` is True,
-    the output terminal buffer will be cleared. In any case, if `terminal_render`
-    is False, no rendering occurs and the output TTY is not affected.
+    updated to reflect its destruction, at the end of the kernel loop tick;
+    otherwise, if `clear_buffer` is True, the output terminal buffer will be
+    cleared. In any case, if `terminal_render` is False, no rendering occurs
+    and the output TTY is not affected.
 
     Raises TrapException if `window` is not a caller task created window.
     """
@@ -65,14 +66,72 @@ def window_render(window, full=False, terminal_render=True):
     Renders `window` onto the output terminal.
     If `full` is True, the whole window contents is rendered; otherwise, only
     the lines that changed since the previous render will be rendered.
-    If `terminal_render` is True, the terminal is rendered to the output TTY;
-    this allows tasks to optimize rendering multiple windows to the terminal
-    while only triggering the final terminal to TTY rendering at the end.
+    If `terminal_render` is True, the terminal is rendered to the output TTY
+    at the end of the kernel loop tick, once, whatever the number of windows
+    rendered until then: see `frame_wait`.
     """
     yield Trap.WINDOW_RENDER, window, full, terminal_render
 
 
 
+@types.coroutine
+def window_raise(window):
+    """
+    Stacks `window` on top of all other windows. Like the other stacking and
+    visibility changes, window contents are kept, and only the terminal area
+    `window` covers is updated, at the end of the kernel loop tick.
+
+    Raises TrapException if `window` is not a caller task created window.
+    """
+    yield Trap.WINDOW_RAISE, window
+
+
+
+@types.coroutine
+def window_lower(window):
+    """
+    Stacks `window` below all other windows.
+
+    Raises TrapException if `window` is not a caller task created window.
+    """
+    yield Trap.WINDOW_LOWER, window
+
+
+
+@types.coroutine
+def window_hide(window):
+    """
+    Hides `window`, keeping its contents and stacking position: it can still
+    be printed to and rendered, with no visible effect until shown again.
+
+    Raises TrapException if `window` is not a caller task created window.
+    """
+    yield Trap.WINDOW_HIDE, window
+
+
+
+@types.coroutine
+def window_show(window):
+    """
+    Shows `window`, hidden by `window_hide`, rendering its full contents.
+
+    Raises TrapException if `window` is not a caller task created window.
+    """
+    yield Trap.WINDOW_SHOW, window
+
+
+
+@types.coroutine
+def frame_wait():
+    """
+    Blocks caller task until the next terminal render to the output TTY, at the
+    end of the kernel loop tick. Frames waited on are paced by the kernel frame
+    interval: animations should render their windows and wait for frames.
+    """
+    yield Trap.FRAME_WAIT,
+
+
+
 @types.coroutine
 def sleep(seconds):
     """
@@ -82,6 +141,17 @@ def sleep(seconds):
 
 
 
+@types.coroutine
+def sleep_until(monotonic_time):
+    """
+    Sleep caller until the `monotonic_time` deadline, in `time.monotonic()`
+    terms. Unlike repeated `sleep` calls, periodic wake ups based on absolute
+    deadlines do not accumulate drift.
+    """
+    yield Trap.SLEEP_UNTIL, monotonic_time
+
+
+
 @types.coroutine
 def key_read():
     """
@@ -175,6 +245,36 @@ def process_wait():
     return (yield Trap.PROCESS_WAIT,)
 
 
+@types.coroutine
+def future_wait(awaitable):
+    """
+    Waits for `awaitable`, an asyncio future, task or coroutine, to complete.
+    Returns its result or raises its exception.
+
+    Only available when running under the asyncio kernel loop: raises
+    TrapException otherwise.
+    """
+    return (yield Trap.FUTURE_WAIT, awaitable)
+
+
+@types.coroutine
+def batch(*calls):
+    """
+    Runs the given kernel calls, in order, with a single kernel round-trip.
+    Each of `calls` should be a non-awaited call to a non-blocking function in
+    this module, like `window_create`, `window_render` or `message_send`.
+
+    Returns a list with each call's result; calls that fail produce the
+    exception they would otherwise raise, instead of raising it.
+    """
+    traps = []
+    for call in calls:
+        traps.append(call.send(None))
+        call.close()
+    return (yield Trap.BATCH, traps)
+
+
+
 @types.coroutine
 def state_dump(tag=''):
     """
@@ -23,43 +23,180 @@ def update_terminal_cursor_from_focus():
 
 
 
+def window_visibility():
+
+    # Returns a dict mapping each window to its visible spans: a dict mapping
+    # window line numbers to lists of (from, to) window column ranges, with
+    # `to` excluded, that are within the terminal and not covered by windows
+    # above. Fully covered lines are not included; hidden windows have none.
+    # Cached until window geometry or z-order changes: only windows above and
+    # overlapping each window, per the window store spatial index, are checked.
+
+    all_windows = state.all_windows
+    terminal = state.terminal
+    t_width = terminal.width
+    t_height = terminal.height
+    key = (t_width, t_height, all_windows.version)
+    if key == state.window_visibility_key:
+        return state.window_visibility
+
+    visibility = {}
+    for w in reversed(all_windows):
+        left = w.left
+        top = w.top
+        min_x = max(0, left)
+        max_x = min(t_width, left + w.width)
+        min_y = max(0, top)
+        max_y = min(t_height, top + w.height)
+        spans = {}
+        if min_x < max_x and min_y < max_y and not all_windows.is_hidden(w):
+            # (min_x, max_x, min_y, max_y) terminal geometry, max excluded.
+            rects_above = [
+                (a.left, a.left + a.width, a.top, a.top + a.height)
+                for a in all_windows.overlapping(min_x, max_x-1, min_y, max_y-1)
+                if all_windows.is_above(a, w)
+            ]
+            for y in range(min_y, max_y):
+                line_spans = [(min_x, max_x)]
+                for a_min_x, a_max_x, a_min_y, a_max_y in rects_above:
+                    if a_min_y <= y < a_max_y:
+                        line_spans = _subtract_span(line_spans, a_min_x, a_max_x)
+                        if not line_spans:
+                            break
+                if line_spans:
+                    spans[y-top] = [(x0-left, x1-left) for x0, x1 in line_spans]
+        visibility[w] = spans
+
+    state.window_visibility = visibility
+    state.window_visibility_key = key
+    return visibility
+
+
+
+def _subtract_span(spans, from_x, to_x):
+
+    result = []
+    for x0, x1 in spans:
+        if to_x <= x0 or from_x >= x1:
+            result.append((x0, x1))
+            continue
+        if x0 < from_x:
+            result.append((x0, from_x))
+        if to_x < x1:
+            result.append((to_x, x1))
+    return result
+
+
+
+def clip_spans(spans, window, min_x, max_x, min_y, max_y):
+
+    # Returns the `window` visible `spans` clipped to the given terminal
+    # geometry, max values included, like Window.uncovered_geometry returns.
+
+    left = window.left
+    top = window.top
+    from_column = min_x - left
+    to_column = max_x + 1 - left
+    clipped = {}
+    for line_no, line_spans in spans.items():
+        if not min_y <= top + line_no <= max_y:
+            continue
+        clipped_line_spans = [
+            (max(x0, from_column), min(x1, to_column)) for x0, x1 in line_spans
+            if x0 < to_column and x1 > from_column
+        ]
+        if clipped_line_spans:
+            clipped[line_no] = clipped_line_spans
+    return clipped
+
+
+
+def recompose_geometry(min_x, max_x, min_y, max_y, exclude=None):
+
+    # Erases the given terminal geometry, max values included, like
+    # Window.uncovered_geometry returns, re-composing the visible parts of the
+    # windows within it, other than `exclude`. Rendering is up to callers.
+
+    state.terminal.window.erase_geometry(min_x, max_x, min_y, max_y)
+    visibility = window_visibility()
+    for w in state.all_windows.overlapping(min_x, max_x, min_y, max_y):
+        if w is exclude:
+            continue
+        spans = clip_spans(visibility[w], w, min_x, max_x, min_y, max_y)
+        if spans:
+            w.compose(full=True, spans=spans)
+
+
+
 def highlight_focused_window(clear=False):
 
+    # Highlight overlays only touch the window's last line: composing the
+    # window's dirty lines, if any, and rendering the terminal is enough.
     window = state.focused_window
     if window is None:
-        window = state.terminal.window
-
-    window.highlight(clear=clear)
+        state.terminal.window.highlight(clear=clear)
+    else:
+        window.highlight(clear=clear)
+        window.compose(spans=window_visibility().get(window, {}))
 
-    rerender_all_windows(clear=clear)
+    update_terminal_cursor_from_focus()
+    state.terminal.render()
 
 
 
 def destroy_task_windows(task):
 
-    need_rerender = bool(state.task_windows[task])
+    task_windows = state.tasks[task].windows
+    need_rerender = bool(task_windows)
 
-    for window in state.task_windows[task]:
+    for window in task_windows:
         state.all_windows.remove(window)
+        state.dirty_windows.pop(window, None)
         state.cleanup_focusable_window_process(window)
-    del state.task_windows[task]
+    task_windows.clear()
 
     if need_rerender:
-        rerender_all_windows()
+        rerender_all_windows(defer=True)
+
+
+
+def resize_terminal():
+
+    # Updates the output terminal geometry, re-rendering everything. Windows,
+    # and the processes running in them, are only resized if their geometry,
+    # possibly relative to the terminal's, changed.
+
+    state_terminal = state.terminal
+    size = (state_terminal.width, state_terminal.height)
+    state_terminal.resize()
+    if (state_terminal.width, state_terminal.height) != size:
+        for w in state.all_windows:
+            w.resize()
+    rerender_all_windows(defer=True)
+
 
 
+def rerender_all_windows(clear=True, defer=False):
 
-def rerender_all_windows(clear=True):
+    # If `defer` is True, the output TTY is updated at the end of the kernel
+    # loop tick, along with whatever else is rendered until then.
 
-    # Speed up attribute access
     state_terminal = state.terminal
-    state_terminal_feed = state_terminal.feed
 
     if clear:
         state_terminal.clear()
 
+    # Hidden, fully covered and off-terminal windows have nothing to compose.
+    visibility = window_visibility()
     for w in state.all_windows:
-        state_terminal_feed(w.render(full=True))
+        spans = visibility[w]
+        if spans:
+            w.compose(full=True, spans=spans)
+    state.dirty_windows.clear()
+
+    if defer:
+        state.terminal_render_pending = True
+        return
 
     update_terminal_cursor_from_focus()
     state_terminal.render()
@@ -15,6 +15,7 @@ attributes.
 
 import os as _os
 import select as _select
+import selectors as _selectors
 import sys as _sys
 import termios as _termios
 import time as _time
@@ -24,6 +25,11 @@ os_read = _os.read
 os_write = _os.write
 os_close = _os.close
 os_ttyname = _os.ttyname
+os_open = _os.open
+os_O_WRONLY = _os.O_WRONLY
+os_O_NOCTTY = _os.O_NOCTTY
+os_O_NONBLOCK = _os.O_NONBLOCK
+os_environ = _os.environ
 
 def os_write_all(fd, data):
     mv = memoryview(data)
@@ -32,7 +38,12 @@ def os_write_all(fd, data):
         mv = mv[written:]
 
 
-select_select = _select.select
+select_poll = _select.poll
+select_POLLIN = _select.POLLIN
+
+selectors_DefaultSelector = _selectors.DefaultSelector
+selectors_EVENT_READ = _selectors.EVENT_READ
+selectors_EVENT_WRITE = _selectors.EVENT_WRITE
 
 sys_stdin = _sys.stdin
 sys_stdout = _sys.stdout
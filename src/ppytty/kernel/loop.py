@@ -6,7 +6,6 @@
 # ----------------------------------------------------------------------------
 
 import contextlib
-import heapq
 import inspect
 import logging
 import os
@@ -14,10 +13,11 @@ import signal
 
 from . import hw
 from . import exceptions
+from . import traps
 from . traps import handlers as trap_handlers, Trap
 from . import common
 from . import signals
-from . state import state
+from . state import state, TaskStatus
 from . terminal import Terminal
 
 
@@ -32,46 +32,59 @@ class _ForcedStop(Exception):
 
 
 
-def run(task, post_prompt=None):
+# Scheduling slice defaults: at most this many runnable task steps will run
+# for at most these many seconds, in between low level I/O polls.
 
-    with Terminal() as t:
-        state.prepare_to_run(task, t)
-        signals.track_output_terminal_resizes()
-        signals.track_child_process_termination()
+SLICE_TASKS = 64
+SLICE_SECONDS = 0.01
+
+# Process output is rendered at most once per this many seconds.
+
+FRAME_INTERVAL = 1 / 60
+
+
+
+def run(task, post_prompt=None, slice_tasks=SLICE_TASKS,
+        slice_seconds=SLICE_SECONDS, terminal=None,
+        frame_interval=FRAME_INTERVAL):
+
+    previous_handlers = {}
+
+    def install_handler(signum, handler):
+        previous_handlers[signum] = signal.signal(signum, handler)
+
+    # A given `terminal`, like a HeadlessTerminal, is used instead of the TTY.
+    with (Terminal() if terminal is None else terminal) as t:
+        state.prepare_to_run(task, t, frame_interval=frame_interval)
+        signals.track_output_terminal_resizes(install_handler)
+        signals.track_child_process_termination(install_handler)
         try:
-            success, result = loop()
+            success, result = loop(slice_tasks=slice_tasks,
+                                   slice_seconds=slice_seconds)
             while post_prompt:
                 process_lowlevel_io(prompt=post_prompt)
         except _ForcedStop as e:
             success, result = None, e
         finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
             close_pending_fds()
 
     return success, result
 
 
 
-def loop(once=False):
+def loop(once=False, slice_tasks=1, slice_seconds=None):
+
+    # Each iteration polls low level I/O once and then runs a slice of up to
+    # `slice_tasks` runnable tasks, stopping early once `slice_seconds` have
+    # passed, if not None. This amortizes the polling cost across many trap
+    # round-trips when lots of tasks are runnable.
 
-    while (state.runnable_tasks or state.tasks_waiting_child or state.tasks_waiting_inbox or
-           state.tasks_waiting_key or state.tasks_waiting_time or state.completed_tasks or
-           state.tasks_waiting_processes):
+    while have_tasks():
         state.now = hw.time_monotonic()
         process_lowlevel_io()
-        process_tasks_waiting_key()
-        process_tasks_waiting_time()
-        if state.runnable_tasks:
-            task = state.runnable_tasks.popleft()
-            try:
-                trap = run_task_until_trap(task)
-            except StopIteration as return_:
-                log.info('%r completed with %r', task, return_.value)
-                process_task_completion(task, success=True, result=return_.value)
-            except Exception as e:
-                log.warning('%r crashed with %r', task, e)
-                process_task_completion(task, success=False, result=e)
-            else:
-                process_task_trap(task, trap)
+        process_tasks(slice_tasks, slice_seconds)
         if once:
             break
 
@@ -79,10 +92,62 @@ def loop(once=False):
 
 
 
+def have_tasks():
+
+    return bool(
+        state.runnable_tasks or state.tasks_waiting_child or state.tasks_waiting_inbox or
+        state.tasks_waiting_key or state.tasks_waiting_time or state.completed_tasks or
+        state.tasks_waiting_processes or state.tasks_waiting_future or
+        state.tasks_waiting_frame
+    )
+
+
+
+def process_tasks(slice_tasks, slice_seconds):
+
+    process_terminal_resize()
+    process_dirty_windows()
+    process_tasks_waiting_key()
+    process_tasks_waiting_time()
+    run_runnable_tasks(slice_tasks, slice_seconds)
+    process_terminal_render()
+
+
+
+def run_runnable_tasks(max_tasks, max_seconds):
+
+    # state.now was sampled before low level I/O, which may have blocked: the
+    # slice deadline counts from now.
+    runnable_tasks = state.runnable_tasks
+    deadline = None if max_seconds is None else hw.time_monotonic() + max_seconds
+    for _ in range(max_tasks):
+        if not runnable_tasks:
+            break
+        run_task_step(runnable_tasks.popleft())
+        if deadline is not None and hw.time_monotonic() >= deadline:
+            break
+
+
+
+def run_task_step(task):
+
+    try:
+        trap = run_task_until_trap(task)
+    except StopIteration as return_:
+        log.info('%r completed with %r', task, return_.value)
+        process_task_completion(task, success=True, result=return_.value)
+    except Exception as e:
+        log.warning('%r crashed with %r', task, e)
+        process_task_completion(task, success=False, result=e)
+    else:
+        process_task_trap(task, trap)
+
+
+
 def process_task_trap(task, trap):
 
     log.debug('%r trap: %r', task, trap)
-    state.trap_call[task] = trap
+    state.tasks[task].trap_call = trap
     trap_id, *trap_args = trap
     try:
         trap_handler = trap_handlers[trap_id]
@@ -112,9 +177,11 @@ def process_task_trap(task, trap):
 
 def run_task_until_trap(task):
 
-    prev_trap_call = state.trap_call.get(task)
-    prev_trap_success = state.trap_success.get(task)
-    prev_trap_result = state.trap_result.get(task)
+    tcb = state.tasks[task]
+    tcb.status = TaskStatus.RUNNING
+    prev_trap_call = tcb.trap_call
+    prev_trap_success = tcb.trap_success
+    prev_trap_result = tcb.trap_result
     if prev_trap_call is not None:
         log.debug('%r trap %r result: %r', task, prev_trap_call, prev_trap_result)
     elif prev_trap_result is not None:
@@ -125,7 +192,57 @@ def run_task_until_trap(task):
         run_task = task.throw if prev_trap_success is False else task.send
         return run_task(prev_trap_result)
     finally:
-        state.clear_trap_info(task)
+        tcb.trap_call = None
+        tcb.trap_success = None
+        tcb.trap_result = None
+
+
+
+def process_terminal_resize():
+
+    resize_time = state.terminal_resize_time
+    if resize_time is not None and hw.time_monotonic() >= resize_time:
+        state.terminal_resize_time = None
+        common.resize_terminal()
+
+
+
+def process_dirty_windows():
+
+    if state.dirty_windows:
+        now = hw.time_monotonic()
+        if now >= state.next_frame_time:
+            traps.render_dirty_windows()
+
+
+
+def process_terminal_render():
+
+    # Renders the terminal to the output TTY at most once per tick, however
+    # many windows were rendered, and wakes up tasks waiting on frames. While
+    # there are any, rendering waits for the frame interval to elapse: this
+    # paces animations. The only place frames are written and timed: process
+    # output composing waits for the next frame time, too, thus dirty windows
+    # are composed into each frame, never starved by frequent renders.
+
+    tasks_waiting_frame = state.tasks_waiting_frame
+    if not (tasks_waiting_frame or state.terminal_render_pending):
+        return
+    now = hw.time_monotonic()
+    if tasks_waiting_frame and now < state.next_frame_time:
+        return
+    state.next_frame_time = now + state.frame_interval
+    if state.dirty_windows:
+        traps.render_dirty_windows()
+    if state.terminal_render_pending:
+        state.terminal_render_pending = False
+        # Cursor moves with no other visible output must be rendered.
+        common.update_terminal_cursor_from_focus()
+        state.terminal.render(do_cursor=True)
+    while tasks_waiting_frame:
+        frame_waiter = tasks_waiting_frame.popleft()
+        state.runnable_tasks.append(frame_waiter)
+        log.info('%r getting frame', frame_waiter)
 
 
 
@@ -138,18 +255,20 @@ def process_tasks_waiting_key():
         state.runnable_tasks.append(key_waiter)
         log.info('%r getting key %r', key_waiter, keyboard_bytes)
 
+    if state.terminal_input_closed:
+        # No more keys will come: key waiters would block forever.
+        while state.tasks_waiting_key:
+            key_waiter = state.tasks_waiting_key.popleft()
+            state.trap_will_throw(key_waiter, exceptions.TrapException('terminal input closed'))
+            state.runnable_tasks.append(key_waiter)
+
 
 
 def process_tasks_waiting_time():
 
-    if state.tasks_waiting_time:
-        while state.tasks_waiting_time_hq and state.tasks_waiting_time_hq[0][0] <= state.now:
-            _, _, time_waiter = heapq.heappop(state.tasks_waiting_time_hq)
-            if time_waiter in state.tasks_waiting_time:
-                state.tasks_waiting_time.remove(time_waiter)
-                state.cleanup_tasks_waiting_time_hq()
-                state.runnable_tasks.append(time_waiter)
-                log.info('%r waking up', time_waiter)
+    for time_waiter in state.tasks_waiting_time.pop_expired(state.now):
+        state.runnable_tasks.append(time_waiter)
+        log.info('%r waking up', time_waiter)
 
 
 
@@ -157,35 +276,45 @@ _NOT_THERE = object()
 
 def process_task_completion(task, success, result):
 
-    candidate_parent = state.parent_task.get(task)
+    tcb = state.tasks[task]
+    tcb.status = TaskStatus.COMPLETED
+    candidate_parent = tcb.parent
     if not candidate_parent and task is not state.top_task:
         log.error('%r completed with no parent', task)
+    # Completed tasks kept around for their parent to wait on, and the top
+    # task, keep their control block; others have theirs released.
+    keep_tcb = True
     if candidate_parent in state.tasks_waiting_child:
-        user_space_task = state.user_space_tasks[task]
-        state.trap_will_return(candidate_parent, (user_space_task, success, result))
-        state.clear_kernel_task_mapping(task)
-        del state.parent_task[task]
-        state.child_tasks[candidate_parent].remove(task)
-        state.cleanup_child_tasks(candidate_parent)
+        state.trap_will_return(candidate_parent, (tcb.user_task, success, result))
+        state.tasks[candidate_parent].children.remove(task)
         state.tasks_waiting_child.remove(candidate_parent)
         state.runnable_tasks.append(candidate_parent)
-    elif task is not state.top_task and task in state.parent_task:
+        keep_tcb = False
+    elif task is not state.top_task and candidate_parent is not None:
         state.completed_tasks[task] = (success, result)
     elif task is state.top_task:
         state.top_task_success = success
         state.top_task_result = result
+    else:
+        keep_tcb = False
+    dropped_children = []
     if success is False:
         # Prevent kernel hang by cleaning up completed child results, if any.
         # We no longer have a parent to wait for them.
-        for child_task in state.child_tasks[task]:
+        for child_task in tcb.children:
             child_result = state.completed_tasks.pop(child_task, _NOT_THERE)
             if child_result is not _NOT_THERE:
                 log.warning('%r dropping completed child result: %r', task, child_result)
+                dropped_children.append(child_task)
     state.clear_task_parenthood(task)
+    for child_task in dropped_children:
+        state.clear_kernel_task_mapping(child_task)
     state.clear_trap_info(task)
     common.destroy_task_windows(task)
-    if task in state.task_processes:
-        log.warning('%r did not wait for spawned processes: %r', task, state.task_processes[task])
+    if tcb.processes:
+        log.warning('%r did not wait for spawned processes: %r', task, tcb.processes)
+    if not keep_tcb:
+        state.clear_kernel_task_mapping(task)
 
 
 
@@ -207,8 +336,6 @@ def _prompt_context(prompt):
 
 
 
-_NO_FDS = []
-
 _KEY_GRAB = b'\x06'     # CTRL-F
 _KEY_STOP = b'.'
 _KEY_DUMP = b'd'
@@ -216,6 +343,24 @@ _KEY_FOCUS = b'fb'      # next/prev
 
 def process_lowlevel_io(prompt=None):
 
+    io = lowlevel_io()
+    timeout = next(io)
+    while True:
+        with _prompt_context(prompt):
+            events = state.selector.select(timeout)
+        try:
+            timeout = io.send(events)
+        except StopIteration:
+            break
+
+
+
+def lowlevel_io():
+
+    # Handles low level I/O independently of how input FDs are waited on:
+    # yields selector timeouts and expects to be sent the resulting events.
+    # Driven by process_lowlevel_io and by the asyncio based kernel loop.
+
     def forward_keybard_input(process, keyboard_bytes):
         if process:
             hw.os_write_all(process.pty_master_fd, keyboard_bytes)
@@ -226,20 +371,43 @@ def process_lowlevel_io(prompt=None):
     focus_changed = False
     focused_process = state.focused_process
 
-    if state.runnable_tasks:
+    key_ready = state.terminal.input_buffer or state.terminal_input_closed
+    if state.runnable_tasks or (key_ready and state.tasks_waiting_key):
         timeout = 0
-    elif state.tasks_waiting_time:
-        timeout = max(state.tasks_waiting_time_hq[0][0] - state.now, 0)
     else:
-        timeout = None
+        deadline = state.tasks_waiting_time.next_deadline
+        frame_pending = state.dirty_windows or state.tasks_waiting_frame
+        if frame_pending and (deadline is None or state.next_frame_time < deadline):
+            deadline = state.next_frame_time
+        resize_time = state.terminal_resize_time
+        if resize_time is not None and (deadline is None or resize_time < deadline):
+            deadline = resize_time
+        timeout = None if deadline is None else max(deadline - state.now, 0)
     save_timeout = timeout
     while True:
-        with _prompt_context(prompt):
-            fds, _, _ = hw.select_select(state.in_fds, _NO_FDS, _NO_FDS, timeout)
-        for fd in fds:
-            in_fd_callable = state.in_fds[fd]
+        _track_terminal_output()
+        events = yield timeout
+        for key, mask in events:
+            fd = key.fd
+            if mask & hw.selectors_EVENT_WRITE:
+                out_fd_callable = state.out_fds.get(fd)
+                if out_fd_callable is not None:
+                    out_fd_callable()
+                if not mask & hw.selectors_EVENT_READ:
+                    continue
+            try:
+                in_fd_callable = state.in_fds[fd]
+            except KeyError:
+                # Discarded while handling a previous FD in this iteration.
+                continue
             if in_fd_callable is None:
                 keyboard_bytes = hw.os_read(fd, 8)
+                if not keyboard_bytes:
+                    # EOF: terminal input closed, see HeadlessTerminal.close_input.
+                    state.discard_input_fd(fd)
+                    state.terminal_input_closed = True
+                    grab_terminal_input = False
+                    continue
                 if grab_terminal_input:
                     grab_terminal_input = False
                     timeout = save_timeout
@@ -283,8 +451,22 @@ def process_lowlevel_io(prompt=None):
 
 
 
+def _track_terminal_output():
+
+    # Pending terminal output is written once the output FD is writable.
+    terminal = state.terminal
+    out_fd = terminal.out_fd
+    if terminal.output_pending:
+        if out_fd not in state.out_fds:
+            state.track_output_fd(out_fd, terminal.flush_output)
+    elif out_fd in state.out_fds:
+        state.discard_output_fd(out_fd)
+
+
+
 def close_pending_fds():
 
+    state.close_selector()
     while state.close_when_done_fds:
         fd = state.close_when_done_fds.pop()
         try:
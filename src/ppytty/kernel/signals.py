@@ -11,11 +11,11 @@ Signals
 This module brings 
 """
 
+import collections
 import logging
 import os
 import signal
 
-from . import common
 from . import hw
 from . state import state
 
@@ -25,9 +25,14 @@ log = logging.getLogger(__name__)
 
 
 
-_NO_FDS = []
+# Output terminal resizes are applied at most once per this many seconds: the
+# SIGWINCH storms produced by dragging terminal window edges are coalesced.
 
-def track_child_process_termination():
+RESIZE_SETTLE_SECONDS = 0.05
+
+
+
+def track_child_process_termination(install_handler=signal.signal):
 
     read_fd, write_fd = os.pipe()
     state.close_when_done_fds.extend((read_fd, write_fd))
@@ -40,13 +45,18 @@ def track_child_process_termination():
         os.read(read_fd, 1)
 
     def signal_handler(_signal, _frame):
-        pid, status = os.wait()
-        log.info('SIGCHLD from pid=%r, status=%r', pid, status)
-        try:
-            process = state.all_processes[pid]
-        except KeyError:
-            log.error('SIGCHLD child process not found')
-        else:
+        # Reap tracked processes only: other code, like asyncio's subprocess
+        # support, may be waiting on its own child processes. Signals may also
+        # coalesce, so check all of them.
+        for pid, process in list(state.all_processes.items()):
+            try:
+                wait_pid, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                # Already reaped.
+                continue
+            if not wait_pid:
+                continue
+            log.info('SIGCHLD from pid=%r, status=%r', pid, status)
             try:
                 task = state.process_task[process]
             except KeyError:
@@ -57,7 +67,10 @@ def track_child_process_termination():
 
     def pending_read(fd):
 
-        return hw.select_select([fd], _NO_FDS, _NO_FDS, 0)[0]
+        # poll, unlike select, is not limited to FDs below FD_SETSIZE.
+        poller = hw.select_poll()
+        poller.register(fd, hw.select_POLLIN)
+        return poller.poll(0)
 
     def handle_process_termination(task, process, status):
 
@@ -93,14 +106,21 @@ def track_child_process_termination():
             state.trap_will_return(task, process)
             state.runnable_tasks.append(task)
         else:
-            state.completed_processes[task].append(process)
+            tcb = state.tasks.get(task)
+            if tcb is None:
+                # Task completed without waiting for its processes.
+                state.cleanup_task_process(task, process)
+                return
+            if tcb.completed_processes is None:
+                tcb.completed_processes = collections.deque()
+            tcb.completed_processes.append(process)
 
     state.track_input_fd(read_fd, consume_wakeup_byte)
-    signal.signal(signal.SIGCHLD, signal_handler)
+    install_handler(signal.SIGCHLD, signal_handler)
 
 
 
-def track_output_terminal_resizes():
+def track_output_terminal_resizes(install_handler=signal.signal):
 
     read_fd, write_fd = os.pipe()
     state.close_when_done_fds.extend((read_fd, write_fd))
@@ -109,12 +129,11 @@ def track_output_terminal_resizes():
         # TODO: Just one byte, will this need confirmation / retrying?
         os.write(write_fd, b'!')
 
-    def consume_wakeup_byte():
-        os.read(read_fd, 1)
-        state.terminal.resize()
-        for w in state.all_windows:
-            w.resize()
-        common.rerender_all_windows()
+    def consume_wakeup_bytes():
+        # One byte per signal: consume them all, resizing once they settle.
+        os.read(read_fd, 4096)
+        if state.terminal_resize_time is None:
+            state.terminal_resize_time = hw.time_monotonic() + RESIZE_SETTLE_SECONDS
 
     def signal_handler(_signal, _frame):
         state_terminal = state.terminal
@@ -123,8 +142,8 @@ def track_output_terminal_resizes():
         log.info('SIGWINCH width=%r, heigth=%r', w, h)
         wakeup_lowlevel_io()
 
-    state.track_input_fd(read_fd, consume_wakeup_byte)
-    signal.signal(signal.SIGWINCH, signal_handler)
+    state.track_input_fd(read_fd, consume_wakeup_bytes)
+    install_handler(signal.SIGWINCH, signal_handler)
 
 
 # ----------------------------------------------------------------------------
@@ -6,6 +6,145 @@
 # ----------------------------------------------------------------------------
 
 import collections
+import enum
+
+from . import hw
+from . timers import Timers
+from . window_store import WindowStore
+
+
+
+class TaskStatus(enum.Enum):
+
+    # Values are the short codes used in state dumps.
+
+    RUNNING = 'RR'
+    RUNNABLE = 'RN'
+    WAITING_CHILD = 'WC'
+    WAITING_INBOX = 'WM'
+    WAITING_KEY = 'WK'
+    WAITING_TIME = 'WT'
+    WAITING_PROCESSES = 'WP'
+    WAITING_FUTURE = 'WF'
+    WAITING_FRAME = 'WR'
+    COMPLETED = 'CC'
+
+
+
+class TaskQueue(object):
+
+    # Insertion ordered set of tasks supporting O(1) append, popleft, remove
+    # and membership tests. Appending a task updates its control block status
+    # to the queue's status, keeping both in sync.
+
+    def __init__(self, status, tasks):
+
+        self._status = status
+        self._tasks = tasks
+        self._queue = collections.OrderedDict()
+
+
+    def __repr__(self):
+
+        return f'TaskQueue({list(self._queue)!r})'
+
+
+    @property
+    def status(self):
+
+        return self._status
+
+
+    def __len__(self):
+
+        return len(self._queue)
+
+
+    def __iter__(self):
+
+        return iter(self._queue)
+
+
+    def __contains__(self, task):
+
+        return task in self._queue
+
+
+    def append(self, task):
+
+        self._tasks[task].status = self._status
+        self._queue[task] = None
+
+
+    def popleft(self):
+
+        task, _ = self._queue.popitem(last=False)
+        return task
+
+
+    def remove(self, task):
+
+        del self._queue[task]
+
+
+    def clear(self):
+
+        self._queue.clear()
+
+
+
+class TaskControlBlock(object):
+
+    # Kernel side per-task information: one instance per spawned task, held
+    # in _State.tasks, keyed by the running (kernel space) task.
+
+    __slots__ = (
+        # The object passed to loop.run / task-spawn.
+        'user_task',
+        # A TaskStatus: running, runnable, waiting on something or completed.
+        'status',
+        # Current trap, if any.
+        'trap_call',
+        # True means trap completed, False means trap failed.
+        'trap_success',
+        # Return value if success, Exception to throw otherwise.
+        'trap_result',
+        # Parent Task, if any.
+        'parent',
+        # List of child Tasks.
+        'children',
+        # Ordered queue of (user space sender, message) tuples, created lazily.
+        'inbox',
+        # List of Task created Windows.
+        'windows',
+        # List of Task spawned Processes.
+        'processes',
+        # Ordered queue of completed Processes, created lazily.
+        'completed_processes',
+    )
+
+    def __init__(self, user_task):
+
+        self.user_task = user_task
+        self.status = None
+        self.trap_call = None
+        self.trap_success = None
+        self.trap_result = None
+        self.parent = None
+        self.children = []
+        self.inbox = None
+        self.windows = []
+        self.processes = []
+        self.completed_processes = None
+
+
+    def __repr__(self):
+
+        fields = ' '.join(
+            f'{name}={getattr(self, name)!r}' for name in self.__slots__
+            if getattr(self, name)
+        )
+        return f'<TCB {fields}>'
 
 
 
@@ -25,88 +164,110 @@ class _State(object):
         # Exception if top_task_success is False, else whatever top_task returned.
         self.top_task_result = None
 
+        # Keys: running (kernel space) Tasks, Values: TaskControlBlocks.
+        self.tasks = {}
+
         # Runnable tasks queue.
-        self.runnable_tasks = collections.deque()
+        self.runnable_tasks = TaskQueue(TaskStatus.RUNNABLE, self.tasks)
 
         # Completed tasks will be here until their parent task waits on them.
         # Keys: Tasks, Values: (success, result) tuple.
         self.completed_tasks = {}
 
-        # Keys: Tasks, Values: Their parent Task.
-        self.parent_task = {}
-        # Keys: Tasks, Values: List of child Tasks, if any.
-        self.child_tasks = collections.defaultdict(list)
-
         # Tasks waiting on children.
-        self.tasks_waiting_child = []
+        self.tasks_waiting_child = TaskQueue(TaskStatus.WAITING_CHILD, self.tasks)
 
         # Tasks waiting on their inbox.
-        self.tasks_waiting_inbox = []
+        self.tasks_waiting_inbox = TaskQueue(TaskStatus.WAITING_INBOX, self.tasks)
 
         # Tasks waiting on keyboard input.
-        self.tasks_waiting_key = collections.deque()
+        self.tasks_waiting_key = TaskQueue(TaskStatus.WAITING_KEY, self.tasks)
 
-        # Tasks sleeping, and the associated priority queue.
-        self.tasks_waiting_time = []
-        self.tasks_waiting_time_hq = []
+        # Tasks sleeping, ordered by wake up time.
+        self.tasks_waiting_time = Timers()
 
         # Tasks waiting on spawned processes.
-        self.tasks_waiting_processes = set()
+        self.tasks_waiting_processes = TaskQueue(TaskStatus.WAITING_PROCESSES, self.tasks)
+
+        # Tasks waiting on asyncio futures, under the asyncio kernel loop.
+        self.tasks_waiting_future = TaskQueue(TaskStatus.WAITING_FUTURE, self.tasks)
+        # Keys: Tasks, Values: the asyncio futures they are waiting on.
+        self.task_futures = {}
+
+        # Tasks waiting on the next terminal render to the output TTY.
+        self.tasks_waiting_frame = TaskQueue(TaskStatus.WAITING_FRAME, self.tasks)
+
+        # Keys: TaskStatus, Values: the queue holding tasks with that status.
+        self._status_queues = {
+            queue.status: queue for queue in (
+                self.runnable_tasks,
+                self.tasks_waiting_child,
+                self.tasks_waiting_inbox,
+                self.tasks_waiting_key,
+                self.tasks_waiting_processes,
+                self.tasks_waiting_future,
+                self.tasks_waiting_frame,
+            )
+        }
 
         # ---------------------------------------------------------------------
         # Spawned objects
 
-        # Maps running tasks to objects passed to loop.run / task-spawn.
-        self.user_space_tasks = {}
-
         # Maps user space tasks (passed to run/task-spawn) to running tasks.
         self.kernel_space_tasks = {}
 
-        # ---------------------------------------------------------------------
-        # Task trap tracking.
-
-        # The self.trap_... dicts have Tasks as their keys.
-
-        # Values: Current trap, if any.
-        self.trap_call = {}
-        # Values: True means trap completed, False means trap failed.
-        self.trap_success = {}
-        # Values: Return values if success, Exception to throw otherwise.
-        self.trap_result = {}
-
         # ---------------------------------------------------------------------
         # Task owned objects.
 
-        # Keys: Tasks, Values: Ordered queue of (sender, message) tuples.
-        self.task_inbox = collections.defaultdict(collections.deque)
-
-        # Keys: Tasks, Values: List of Task created Windows.
-        self.task_windows = collections.defaultdict(list)
-        # Task created Window list in back to front rendering order.
-        self.all_windows = []
+        # Task created Windows in back to front rendering order, spatially
+        # indexed: see WindowStore.
+        self.all_windows = WindowStore()
+        # Keys: Windows, Values: visible spans, see common.window_visibility.
+        self.window_visibility = {}
+        # Geometry and z-order the visibility map was computed for.
+        self.window_visibility_key = None
         # Windows that can get input focus.
         self.focusable_windows = []
         # Window with input focus.
         self.focused_window = None
+        # Windows with pending process output, in no particular order: values
+        # are always None. Rendered at most once per frame interval.
+        self.dirty_windows = {}
+        # Pending output terminal resizes are applied once this monotonic time
+        # is reached, None if there are none: see signals.RESIZE_SETTLE_SECONDS.
+        self.terminal_resize_time = None
+        # True once the terminal input FD reaches EOF, like HeadlessTerminal
+        # input can: key reads then fail, see loop.process_tasks_waiting_key.
+        self.terminal_input_closed = False
+        # True if the terminal needs rendering to the output TTY: done once, at
+        # the end of each kernel loop tick, see loop.process_terminal_render.
+        self.terminal_render_pending = False
+        # Minimum seconds between process output renders and frames waited on
+        # by tasks, and the earliest time at which the next one can happen.
+        self.frame_interval = None
+        self.next_frame_time = None
         # Keys: Windows, Values: Processes
         self.window_process = {None: None}
         # Keys: Processes, Values: Windows
         self.process_window = {}
 
-        # Keys: Tasks, Values: List of Task spawned Processes.
-        self.task_processes = collections.defaultdict(list)
         # Keys: Processes, Values: Tasks
         self.process_task = {}
         # Keys: PIDs, Values: Processes
         self.all_processes = {}
-        # Keys: Tasks, Values: List of completed Processes.
-        self.completed_processes = collections.defaultdict(collections.deque)
 
         # ---------------------------------------------------------------------
         # I/O file descriptors.
 
+        # Keys: FDs, Values: Callables or None, for the terminal input FD.
         self.in_fds = {}
-        self.out_fds = []
+        # Keys: FDs, Values: Callables, called when the FD is writable; only
+        # tracked while there is pending output.
+        self.out_fds = {}
+
+        # Persistent I/O multiplexer, created by prepare_to_run: tracked input
+        # FDs are registered/unregistered as they come and go.
+        self.selector = None
 
         # Used for deferred closing of process PTY FDs.
         self.close_fd_callables = []
@@ -129,26 +290,70 @@ class _State(object):
         self.__init__()
 
 
-    def prepare_to_run(self, task, terminal):
+    def prepare_to_run(self, task, terminal, selector=None, frame_interval=0):
 
+        self.close_selector()
         self.__init__()
+        self.selector = hw.selectors_DefaultSelector() if selector is None else selector
+        self.frame_interval = frame_interval
+        self.next_frame_time = 0
 
         self.top_task = self.get_mapped_kernel_task(task)
         self.runnable_tasks.append(self.top_task)
 
         self.terminal = terminal
         self.track_input_fd(terminal.in_fd, callback=None)
-        self.out_fds.append(terminal.out_fd)
+
+
+    def _selector_update(self, fd, was_tracked):
+
+        # Late SIGCHLD handling may get here after the selector is closed.
+        if self.selector is None:
+            return
+        events = 0
+        if fd in self.in_fds:
+            events |= hw.selectors_EVENT_READ
+        if fd in self.out_fds:
+            events |= hw.selectors_EVENT_WRITE
+        if not events:
+            self.selector.unregister(fd)
+        elif was_tracked:
+            self.selector.modify(fd, events, self.in_fds.get(fd))
+        else:
+            self.selector.register(fd, events, self.in_fds.get(fd))
 
 
     def track_input_fd(self, fd, callback):
 
+        was_tracked = fd in self.in_fds or fd in self.out_fds
         self.in_fds[fd] = callback
+        self._selector_update(fd, was_tracked)
 
 
     def discard_input_fd(self, fd):
 
         del self.in_fds[fd]
+        self._selector_update(fd, was_tracked=True)
+
+
+    def track_output_fd(self, fd, callback):
+
+        was_tracked = fd in self.in_fds or fd in self.out_fds
+        self.out_fds[fd] = callback
+        self._selector_update(fd, was_tracked)
+
+
+    def discard_output_fd(self, fd):
+
+        del self.out_fds[fd]
+        self._selector_update(fd, was_tracked=True)
+
+
+    def close_selector(self):
+
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
 
 
     def get_mapped_kernel_task(self, user_task):
@@ -157,53 +362,65 @@ class _State(object):
             kernel_task = self.kernel_space_tasks[user_task]
         except KeyError:
             kernel_task = user_task() if callable(user_task) else user_task
-            self.user_space_tasks[kernel_task] = user_task
+            self.tasks[kernel_task] = TaskControlBlock(user_task)
             self.kernel_space_tasks[user_task] = kernel_task
         return kernel_task
 
 
     def clear_kernel_task_mapping(self, kernel_task):
 
-        user_task = self.user_space_tasks[kernel_task]
-        del self.user_space_tasks[kernel_task]
-        del self.kernel_space_tasks[user_task]
+        tcb = self.tasks.pop(kernel_task)
+        del self.kernel_space_tasks[tcb.user_task]
 
 
     def trap_will_return(self, task, result):
 
-        self.trap_success[task] = True
-        self.trap_result[task] = result
+        tcb = self.tasks[task]
+        tcb.trap_success = True
+        tcb.trap_result = result
 
 
     def trap_will_throw(self, task, exception):
 
-        self.trap_success[task] = False
-        self.trap_result[task] = exception
+        tcb = self.tasks[task]
+        tcb.trap_success = False
+        tcb.trap_result = exception
 
 
     def clear_trap_info(self, task):
 
-        for target in (self.trap_call, self.trap_success, self.trap_result):
-            if task in target:
-                del target[task]
+        tcb = self.tasks[task]
+        tcb.trap_call = None
+        tcb.trap_success = None
+        tcb.trap_result = None
 
 
-    def cleanup_child_tasks(self, task):
+    def dequeue_task(self, task):
 
-        if not self.child_tasks[task]:
-            del self.child_tasks[task]
+        # Removes `task` from whatever queue its status says it is in.
+        # Returns its previous status.
 
+        tcb = self.tasks[task]
+        status = tcb.status
+        if status is TaskStatus.COMPLETED:
+            del self.completed_tasks[task]
+        elif status is TaskStatus.WAITING_TIME:
+            self.tasks_waiting_time.cancel(task)
+        elif status in self._status_queues:
+            self._status_queues[status].remove(task)
+            if status is TaskStatus.WAITING_FUTURE:
+                self.task_futures.pop(task).cancel()
+        tcb.status = None
+        return status
 
-    def clear_task_parenthood(self, parent_task):
-
-        for child_task in self.child_tasks[parent_task]:
-            del self.parent_task[child_task]
 
+    def clear_task_parenthood(self, parent_task):
 
-    def cleanup_tasks_waiting_time_hq(self):
-
-        if not self.tasks_waiting_time:
-            self.tasks_waiting_time_hq.clear()
+        tasks = self.tasks
+        parent_tcb = tasks[parent_task]
+        for child_task in parent_tcb.children:
+            tasks[child_task].parent = None
+        parent_tcb.children.clear()
 
 
     def track_focusable_window_process(self, window, process):
@@ -261,21 +478,19 @@ class _State(object):
 
     def track_task_process(self, task, process):
 
-        self.task_processes[task].append(process)
+        self.tasks[task].processes.append(process)
         self.process_task[process] = task
         self.all_processes[process.pid] = process
 
 
     def cleanup_task_process(self, task, process):
 
-        task_processes = self.task_processes[task]
-        task_processes.remove(process)
-        if not task_processes:
-            del self.task_processes[task]
+        # The task may be gone, having completed before its processes did.
+        tcb = self.tasks.get(task)
+        if tcb is not None:
+            tcb.processes.remove(process)
         del self.process_task[process]
         del self.all_processes[process.pid]
-        if not self.completed_processes[task]:
-            del self.completed_processes[task]
 
 
 
@@ -6,18 +6,47 @@
 # ----------------------------------------------------------------------------
 
 import collections
-import functools
+import io
+import os
 
 import blessings
+import pyte
 
 from . import hw
 from . import window
 
 
+# Synchronized output mode (DEC private mode 2026) set/reset sequences, used
+# when terminfo has no `Sync` capability.
+
+_SYNC_BEGIN = '\x1b[?2026h'
+_SYNC_END = '\x1b[?2026l'
+
+# Terminals known to support synchronized output, whose terminfo may lack the
+# `Sync` capability: (environment variable, value prefix) tuples.
+
+_SYNC_OUTPUT_ENVIRON = (
+    ('TERM', 'xterm-kitty'),
+    ('TERM', 'foot'),
+    ('TERM', 'alacritty'),
+    ('TERM', 'contour'),
+    ('TERM', 'wezterm'),
+    ('TERM_PROGRAM', 'WezTerm'),
+    ('TERM_PROGRAM', 'iTerm.app'),
+    ('TERM_PROGRAM', 'ghostty'),
+    ('WT_SESSION', ''),
+)
+
+
+
 class Terminal(object):
 
+    # If `sync_output` is True, rendered frames are wrapped in synchronized
+    # output updates, such that the output TTY paints them as a whole, with no
+    # tearing; if None, that depends on it being supported.
+
     def __init__(self, in_file=None, out_file=None, kind=None, bg=None,
-                 encoding='UTF-8'):
+                 encoding='UTF-8', sync_output=None):
 
         in_file = hw.sys_stdin if in_file is None else in_file
         out_file = hw.sys_stdout if out_file is None else out_file
@@ -26,7 +55,22 @@ class Terminal(object):
         self._out_fd = out_file.fileno()
         self._ttyname = self._common_tty_name(self._in_fd, self._out_fd)
 
-        self._bt = blessings.Terminal(kind=kind, stream=out_file)
+        bt = blessings.Terminal(kind=kind, stream=out_file)
+        if sync_output is None:
+            environ = hw.os_environ
+            sync_output = bool(bt.Sync) or any(
+                name in environ and environ[name].startswith(prefix)
+                for name, prefix in _SYNC_OUTPUT_ENVIRON
+            )
+        # Output is written to this FD: see _blocking_settings.
+        self._write_fd = self._out_fd
+
+        self._setup(bt, encoding, bg, self._os_write, sync_output)
+
+
+    def _setup(self, bt, encoding, bg, write_out, sync_output):
+
+        self._bt = bt
         self._encoding = encoding
 
         self._width = None
@@ -38,6 +82,16 @@ class Terminal(object):
 
         self.input_buffer = collections.deque()
 
+        # Render repeated characters with REP, if supported.
+        self._rep = bool(self._bt.rep)
+
+        # Move scrolled lines with a scroll region, if supported.
+        self._scroll = bool(self._bt.csr and self._bt.ind and self._bt.ri)
+
+        # Model of the output TTY contents: see Window.render's `front`.
+        self._front = None
+        self._reset_front()
+
         # Speed up sub-attribute access with these attributes.
         self._bt_clear = self._bt.clear
         self._bt_save = self._bt.save
@@ -46,7 +100,26 @@ class Terminal(object):
         self._window_clear = self._window.clear
         self._window_feed = self._window.feed
         self._window_render = self._window.render
-        self._os_write_out_fd = functools.partial(hw.os_write_all, self._out_fd)
+        self._os_write_out_fd = write_out
+
+        # Output is non-blocking: whatever can't be written right away waits
+        # in this queue of [data, is_frame] entries, written by flush_output,
+        # once the output TTY is writable; the first may be partially written.
+        self._output_queue = collections.deque()
+        self._output_partial = False
+
+        # Reused by render, such that frames don't need per-frame allocations.
+        self._frame = bytearray()
+
+        # Prepended/appended to each frame: empty if not synchronizing output.
+        if not sync_output:
+            sync_begin = sync_end = ''
+        elif bt.Sync:
+            sync_begin, sync_end = bt.Sync(1), bt.Sync(2)
+        else:
+            sync_begin, sync_end = _SYNC_BEGIN, _SYNC_END
+        self._sync_begin = sync_begin.encode(encoding)
+        self._sync_end = sync_end.encode(encoding)
 
 
     def _common_tty_name(self, *fds):
@@ -105,15 +178,96 @@ class Terminal(object):
         hw.termios_tcsetattr(self._out_fd, hw.termios_TCSANOW, tc_attrs)
 
 
+    def _blocking_settings(self, activate=True):
+
+        # Activating makes output non-blocking: a stalled output TTY must not
+        # block the kernel. The output FD's non-blocking flag is not changed:
+        # it is shared by all FDs on the same open file description, such as
+        # stdin and stderr, likely dup'ed from it, which would then fail with
+        # BlockingIOError, for example. Instead, output is written to another
+        # FD, opened non-blocking on the same TTY; deactivating closes it.
+        if activate:
+            flags = hw.os_O_WRONLY | hw.os_O_NOCTTY | hw.os_O_NONBLOCK
+            self._write_fd = hw.os_open(self._ttyname, flags)
+        elif self._write_fd != self._out_fd:
+            hw.os_close(self._write_fd)
+            self._write_fd = self._out_fd
+
+
+    def _os_write(self, data):
+
+        return hw.os_write(self._write_fd, data)
+
+
     def _write(self, *text):
 
-        self._os_write_out_fd(''.join(text).encode(self._encoding))
+        self._write_out(''.join(text).encode(self._encoding))
+
+
+    def _write_out(self, data, is_frame=False):
+
+        # Written right away, if nothing is queued; otherwise, or if not fully
+        # written, the remaining data is queued as a copy: callers may reuse it.
+        queue = self._output_queue
+        if not queue:
+            try:
+                written = self._os_write_out_fd(data)
+            except BlockingIOError:
+                written = 0
+            if written == len(data):
+                return
+            self._output_partial = written > 0
+            if written:
+                data = data[written:]
+        queue.append([bytes(data), is_frame])
+        self.flush_output()
+
+
+    @property
+    def output_pending(self):
+
+        return bool(self._output_queue)
+
+
+    def flush_output(self):
+
+        # Writes queued output until done or the output TTY would block.
+        queue = self._output_queue
+        while queue:
+            entry = queue[0]
+            data = entry[0]
+            try:
+                written = self._os_write_out_fd(data)
+            except BlockingIOError:
+                return
+            if written < len(data):
+                entry[0] = data[written:]
+                self._output_partial = True
+                continue
+            queue.popleft()
+            self._output_partial = False
+
+
+    def _drop_queued_frames(self):
+
+        # Returns whether any queued frames not partially written were dropped.
+        queue = self._output_queue
+        keep = [
+            entry for index, entry in enumerate(queue)
+            if not entry[1] or (index == 0 and self._output_partial)
+        ]
+        if len(keep) == len(queue):
+            return False
+        queue.clear()
+        queue.extend(keep)
+        return True
 
 
     def __enter__(self):
 
         self._write(self._bt.enter_fullscreen, self._bt.hide_cursor)
         self._termios_settings(activate=True)
+        self._blocking_settings(activate=True)
         return self
 
 
@@ -121,6 +275,9 @@ class Terminal(object):
 
         self._termios_settings(activate=False)
         self._write(self._bt.normal_cursor, self._bt.exit_fullscreen)
+        # Blocking, again: flushing writes all queued output.
+        self._blocking_settings(activate=False)
+        self.flush_output()
         # TODO: Reset colors?
         # TODO: Handle exceptions or let them through?
 
@@ -149,15 +306,23 @@ class Terminal(object):
         return self._window.cursor
 
 
+    def _reset_front(self):
+
+        # Output TTY contents unknown: the next render writes whole lines.
+        self._front = [None] * self._height
+
+
     def resize(self):
 
         self._update_geometry()
         self._window.resize()
+        self._reset_front()
 
 
     def direct_clear(self):
 
         self._write(self._bt_clear)
+        self._reset_front()
 
 
     def direct_print(self, text, x=None, y=None, save_location=False):
@@ -170,6 +335,8 @@ class Terminal(object):
             '\n' if not positioning else '',
             self._bt_restore if save_location else '',
         )
+        self._reset_front()
+
 
     def clear(self):
 
@@ -183,9 +350,124 @@ class Terminal(object):
 
     def render(self, full=False, cursor_only=False, do_cursor=False):
 
-        data = self._window_render(full=full, encoding=self._encoding,
-                                   cursor_only=cursor_only, do_cursor=do_cursor)
-        self._os_write_out_fd(data)
+        if self._drop_queued_frames():
+            # The output TTY is not keeping up: supersede the dropped frames
+            # with a complete one.
+            self._reset_front()
+            full = True
+            cursor_only = False
+        frame = self._frame
+        del frame[:]
+        frame += self._sync_begin
+        sync_begin_length = len(frame)
+        self._window_render(full=full, encoding=self._encoding,
+                            cursor_only=cursor_only, do_cursor=do_cursor,
+                            front=self._front, rep=self._rep, scroll=self._scroll,
+                            out=frame)
+        if len(frame) > sync_begin_length:
+            frame += self._sync_end
+            self._write_out(frame, is_frame=True)
+
+
+
+class HeadlessTerminal(Terminal):
+
+    # In-memory terminal with a fixed `width` x `height` geometry, requiring
+    # no TTYs: useful for benchmarking and testing. All output is appended to
+    # the `output` bytearray and, if `capture_screen` is True, fed to an
+    # emulated screen whose contents are available via `display`. Keyboard
+    # input can be simulated with `feed_input`, until `close_input` is called:
+    # once all fed input is read, key reads fail instead of blocking forever.
+
+    def __init__(self, width=80, height=25, kind='xterm-256color', bg=None,
+                 encoding='UTF-8', capture_screen=True, sync_output=None):
+
+        self._in_fd, self._input_write_fd = os.pipe()
+        self._out_fd = None
+        self._ttyname = 'headless'
+
+        self._fixed_width = width
+        self._fixed_height = height
+
+        self.output = bytearray()
+        if capture_screen:
+            self._screen = pyte.Screen(width, height)
+            self._screen_feed = pyte.ByteStream(self._screen).feed
+        else:
+            self._screen = None
+            self._screen_feed = None
+
+        bt = blessings.Terminal(kind=kind, stream=io.StringIO(), force_styling=True)
+        if sync_output is None:
+            sync_output = bool(bt.Sync)
+        self._setup(bt, encoding, bg, self._capture_output, sync_output)
+
+        # pyte does not support REP.
+        if capture_screen:
+            self._rep = False
+
+
+    def _capture_output(self, data):
+
+        self.output.extend(data)
+        if self._screen_feed:
+            self._screen_feed(data)
+        return len(data)
+
+
+    def _termios_settings(self, activate=True):
+
+        pass
+
+
+    def _blocking_settings(self, activate=True):
+
+        pass
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        super().__exit__(exc_type, exc_value, traceback)
+        os.close(self._in_fd)
+        self.close_input()
+
+
+    def _update_geometry(self):
+
+        self._width = self._fixed_width
+        self._height = self._fixed_height
+
+
+    def resize(self, width=None, height=None):
+
+        if width is not None:
+            self._fixed_width = width
+        if height is not None:
+            self._fixed_height = height
+        if self._screen:
+            self._screen.resize(self._fixed_height, self._fixed_width)
+        super().resize()
+
+
+    def feed_input(self, data):
+
+        hw.os_write_all(self._input_write_fd, data)
+
+
+    def close_input(self):
+
+        if self._input_write_fd is not None:
+            os.close(self._input_write_fd)
+            self._input_write_fd = None
+
+
+    @property
+    def display(self):
+
+        # Emulated screen contents, a list of strings, one per line.
+        if self._screen is None:
+            raise RuntimeError('screen not captured')
+        return self._screen.display
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+"""
+Timers
+
+Deadline ordered waiters supporting O(log n) insertion and O(1) cancellation.
+"""
+
+import heapq
+import itertools
+
+
+
+# Marks cancelled heap entries: these are skipped when popped.
+_CANCELLED = object()
+
+# Cancelled entries are compacted away once they are both more than this and
+# more than half of the heap entries.
+_COMPACT_THRESHOLD = 64
+
+
+
+class Timers(object):
+
+    def __init__(self):
+
+        # Heap of [deadline, sequence, waiter] entries; the sequence number
+        # breaks ties in insertion order and avoids comparing waiters.
+        self._heap = []
+        self._sequence = itertools.count()
+
+        # Keys: Waiters, Values: Their heap entry.
+        self._entries = {}
+
+        # How many entries in the heap are cancelled.
+        self._cancelled = 0
+
+
+    def __repr__(self):
+
+        return f'Timers({list(self._entries)!r})'
+
+
+    def __len__(self):
+
+        return len(self._entries)
+
+
+    def __iter__(self):
+
+        return iter(self._entries)
+
+
+    def __contains__(self, waiter):
+
+        return waiter in self._entries
+
+
+    def add(self, waiter, deadline):
+
+        if waiter in self._entries:
+            self.cancel(waiter)
+        entry = [deadline, next(self._sequence), waiter]
+        self._entries[waiter] = entry
+        heapq.heappush(self._heap, entry)
+
+
+    def cancel(self, waiter):
+
+        entry = self._entries.pop(waiter)
+        entry[-1] = _CANCELLED
+        self._cancelled += 1
+        self._compact()
+
+
+    def _compact(self):
+
+        heap = self._heap
+        if not self._entries:
+            heap.clear()
+            self._cancelled = 0
+        elif self._cancelled > _COMPACT_THRESHOLD and self._cancelled * 2 > len(heap):
+            heap[:] = [entry for entry in heap if entry[-1] is not _CANCELLED]
+            heapq.heapify(heap)
+            self._cancelled = 0
+
+
+    def _discard_cancelled_head(self):
+
+        heap = self._heap
+        while heap and heap[0][-1] is _CANCELLED:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+
+
+    @property
+    def next_deadline(self):
+
+        # The earliest deadline, if any, else None.
+
+        self._discard_cancelled_head()
+        heap = self._heap
+        return heap[0][0] if heap else None
+
+
+    def pop_expired(self, now):
+
+        # Removes and returns, in deadline order, the waiters whose deadline
+        # is not later than `now`.
+
+        heap = self._heap
+        entries = self._entries
+        expired = []
+        while heap and heap[0][0] <= now:
+            _, _, waiter = heapq.heappop(heap)
+            if waiter is _CANCELLED:
+                self._cancelled -= 1
+                continue
+            del entries[waiter]
+            expired.append(waiter)
+        return expired
+
+
+    def clear(self):
+
+        self._heap.clear()
+        self._entries.clear()
+        self._cancelled = 0
+
+
+# ----------------------------------------------------------------------------
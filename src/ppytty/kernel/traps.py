@@ -7,14 +7,15 @@
 
 import enum
 import collections
-import heapq
+import inspect
 import logging
 import os
 
 from . import exceptions
 from . import common
+from . import hw
 from . import loop
-from . state import state
+from . state import state, TaskStatus
 from . window import Window
 from . process import Process
 
@@ -35,8 +36,15 @@ class Trap(enum.Enum):
     WINDOW_CREATE = enum.auto()
     WINDOW_RENDER = enum.auto()
     WINDOW_DESTROY = enum.auto()
+    WINDOW_RAISE = enum.auto()
+    WINDOW_LOWER = enum.auto()
+    WINDOW_HIDE = enum.auto()
+    WINDOW_SHOW = enum.auto()
+
+    FRAME_WAIT = enum.auto()
 
     SLEEP = enum.auto()
+    SLEEP_UNTIL = enum.auto()
 
     KEY_READ = enum.auto()
     KEY_UNREAD = enum.auto()
@@ -51,8 +59,12 @@ class Trap(enum.Enum):
     PROCESS_SPAWN = enum.auto()
     PROCESS_WAIT = enum.auto()
 
+    FUTURE_WAIT = enum.auto()
+
     STATE_DUMP = enum.auto()
 
+    BATCH = enum.auto()
+
 
 
 # ----------------------------------------------------------------------------
@@ -110,7 +122,7 @@ def window_create(task, x, y, w, h, dx, dy, dw, dh, bg):
         w = None
     else:
         state.focused_window = None
-        state.task_windows[task].append(w)
+        state.tasks[task].windows.append(w)
         state.all_windows.append(w)
 
     state.trap_will_return(task, w)
@@ -121,13 +133,15 @@ def window_create(task, x, y, w, h, dx, dy, dw, dh, bg):
 @handler_for(Trap.WINDOW_DESTROY)
 def window_destroy(task, window, terminal_render, clear_buffer):
 
-    if not window in state.task_windows[task]:
+    task_windows = state.tasks[task].windows
+    if not window in task_windows:
         state.trap_will_throw(task, exceptions.TrapException('no such window'))
         state.runnable_tasks.append(task)
         return
 
-    state.task_windows[task].remove(window)
+    task_windows.remove(window)
     state.all_windows.remove(window)
+    state.dirty_windows.pop(window, None)
     state.cleanup_focusable_window_process(window)
 
     # The `terminal_render` and `clear_buffer` flags support a rendering
@@ -144,7 +158,7 @@ def window_destroy(task, window, terminal_render, clear_buffer):
         # Possible optimizations:
         # - If completely within another window, just re-render that window.
         # - Just clear needed terminal lines and rerender overlapping windows.
-        common.rerender_all_windows()
+        common.rerender_all_windows(defer=True)
     elif clear_buffer is True:
         state.terminal.clear()
 
@@ -155,7 +169,7 @@ def window_destroy(task, window, terminal_render, clear_buffer):
 @handler_for(Trap.WINDOW_RENDER)
 def window_render(task, window, full=False, terminal_render=True):
 
-    if not window in state.task_windows[task]:
+    if not window in state.tasks[task].windows:
         state.trap_will_throw(task, exceptions.TrapException('no such window'))
         state.runnable_tasks.append(task)
         return
@@ -169,57 +183,105 @@ def window_render(task, window, full=False, terminal_render=True):
 def _do_window_render(window, full=False, terminal_render=True):
 
     # General rendering strategy:
-    # - Find out if `window`` left any uncovered geometry since last render.
+    # - Find out if `window` left any uncovered geometry since last render.
     #   (due to moving or resizing)
     # - If there is any uncovered geometry:
     #   - Erase it in the destination terminal.
-    #   - Re-render all windows below `window` starting with the first that
-    #     overlaps with that geometry.
-    # - Then render the actual `window`.
-    # - Finally, re-render all windows on top of `window`, skipping:
-    #   - The ones that do not overlap with it...
-    #   - ...and that do not overlap with the uncovered geometry (if any).
+    #   - Re-render the visible parts of all windows within that geometry.
+    # - Then render the visible parts of the actual `window`.
+    # Windows on top of `window` need no re-rendering: only cells not covered
+    # by them are touched, per the cached window visibility map.
 
-    try:
-        window_index = state.all_windows.index(window)
-    except ValueError:
+    state.dirty_windows.pop(window, None)
+
+    visibility = common.window_visibility()
+    if window not in visibility:
         # Example: window destroyed but process still running.
         log.error('cannot render, window gone: %r', window)
         return
 
-    # Speed up attribute access
-    state_terminal = state.terminal
-    state_terminal_feed = state_terminal.feed
-    state_all_windows = state.all_windows
-
     uncovered = window.uncovered_geometry()
     if uncovered:
-        state_terminal.window.erase_geometry(*uncovered)
-        # Re-render windows below `window`, as needed.
-        render_remaining = False
-        for w in state_all_windows[:window_index]:
-            if not w.overlaps_geometry(*uncovered) and not render_remaining:
-                continue
-            state_terminal_feed(w.render(full=True))
-            render_remaining = True
+        # Re-render windows within the uncovered geometry, as needed.
+        common.recompose_geometry(*uncovered, exclude=window)
         # Uncovered means move/resize: a full render is needed.
         full = True
 
     # Render the actual window.
-    state_terminal_feed(window.render(full=full))
-
-    # Re-render windows on top of `window`, as needed.
-    for w in state_all_windows[window_index+1:]:
-        if not uncovered:
-            if not w.overlaps(window):
-                continue
-        elif not w.overlaps(window) and not w.overlaps_geometry(*uncovered):
-            continue
-        state_terminal_feed(w.render(full=True))
+    window.compose(full=full, spans=visibility[window])
 
     if terminal_render:
-        common.update_terminal_cursor_from_focus()
-        state_terminal.render()
+        # Once, at the end of the kernel loop tick.
+        state.terminal_render_pending = True
+
+
+
+@handler_for(Trap.WINDOW_RAISE)
+def window_raise(task, window):
+
+    _window_restack(task, window, state.all_windows.move_to_top, reveals=True)
+
+
+
+@handler_for(Trap.WINDOW_LOWER)
+def window_lower(task, window):
+
+    _window_restack(task, window, state.all_windows.move_to_bottom, reveals=False)
+
+
+
+@handler_for(Trap.WINDOW_HIDE)
+def window_hide(task, window):
+
+    _window_restack(task, window, state.all_windows.hide, reveals=False)
+
+
+
+@handler_for(Trap.WINDOW_SHOW)
+def window_show(task, window):
+
+    _window_restack(task, window, state.all_windows.show, reveals=True)
+
+
+
+def _window_restack(task, window, restack, reveals):
+
+    # Changes `window`'s z-order or visibility via the `restack` WindowStore
+    # method, keeping all window contents: only the terminal geometry it
+    # covers, or last covered, needs re-composing. If `reveals` is True, only
+    # more of `window` can become visible: rendering it is enough; otherwise,
+    # windows below it may be revealed.
+
+    if not window in state.tasks[task].windows:
+        state.trap_will_throw(task, exceptions.TrapException('no such window'))
+        state.runnable_tasks.append(task)
+        return
+
+    version = state.all_windows.version
+    restack(window)
+    if state.all_windows.version == version:
+        # Already stacked/shown/hidden as requested: nothing changed.
+        pass
+    elif reveals:
+        _do_window_render(window, full=True)
+    else:
+        uncovered = window.uncovered_geometry()
+        if uncovered:
+            # Moved/resized since last rendered.
+            common.recompose_geometry(*uncovered)
+        left = window.left
+        top = window.top
+        common.recompose_geometry(left, left + window.width - 1, top, top + window.height - 1)
+        state.terminal_render_pending = True
+
+    state.runnable_tasks.append(task)
+
+
+
+@handler_for(Trap.FRAME_WAIT)
+def frame_wait(task):
+
+    state.tasks_waiting_frame.append(task)
 
 
 
@@ -230,9 +292,19 @@ def sleep(task, seconds):
         state.runnable_tasks.append(task)
         return
 
-    wake_at = state.now + seconds
-    state.tasks_waiting_time.append(task)
-    heapq.heappush(state.tasks_waiting_time_hq, (wake_at, id(task), task))
+    sleep_until(task, state.now + seconds)
+
+
+
+@handler_for(Trap.SLEEP_UNTIL)
+def sleep_until(task, wake_at):
+
+    if wake_at <= state.now:
+        state.runnable_tasks.append(task)
+        return
+
+    state.tasks[task].status = TaskStatus.WAITING_TIME
+    state.tasks_waiting_time.add(task, wake_at)
 
 
 
@@ -260,8 +332,8 @@ def key_unread(task, pushed_back_bytes):
 def task_spawn(task, user_child_task):
 
     child_task = state.get_mapped_kernel_task(user_child_task)
-    state.parent_task[child_task] = task
-    state.child_tasks[task].append(child_task)
+    state.tasks[child_task].parent = task
+    state.tasks[task].children.append(child_task)
     state.runnable_tasks.append(child_task)
     state.runnable_tasks.append(task)
 
@@ -272,20 +344,16 @@ def task_wait(task):
 
     child = None
     for candidate in state.completed_tasks:
-        if state.parent_task[candidate] is task:
+        if state.tasks[candidate].parent is task:
             child = candidate
-            success, result = state.completed_tasks[child]
             break
     if child is not None:
-        user_space_task = state.user_space_tasks[child]
+        success, result = state.completed_tasks.pop(child)
+        user_space_task = state.tasks[child].user_task
         state.trap_will_return(task, (user_space_task, success, result))
         state.clear_kernel_task_mapping(child)
-        del state.parent_task[child]
-        state.child_tasks[task].remove(child)
-        state.cleanup_child_tasks(task)
+        state.tasks[task].children.remove(child)
         state.runnable_tasks.append(task)
-        del state.completed_tasks[child]
-        state.clear_trap_info(child)
     else:
         state.tasks_waiting_child.append(task)
 
@@ -301,49 +369,36 @@ def task_destroy(task, user_child_task, keep_running=True):
         state.runnable_tasks.append(task)
         return
 
-    if state.parent_task[child_task] is not task:
+    child_tcb = state.tasks[child_task]
+    if child_tcb.parent is not task:
         exc = exceptions.TrapException('cannot destroy non-child tasks')
         state.trap_will_throw(task, exc)
         state.runnable_tasks.append(task)
         return
 
-    if child_task in state.child_tasks:
-        for grand_child_task in state.child_tasks[child_task]:
-            user_grand_child_task = state.user_space_tasks[grand_child_task]
-            task_destroy(child_task, user_grand_child_task, keep_running=False)
-            del state.parent_task[grand_child_task]
-        del state.child_tasks[child_task]
-
-    if child_task in state.runnable_tasks:
-        state.runnable_tasks.remove(child_task)
-    elif child_task in state.tasks_waiting_child:
-        state.tasks_waiting_child.remove(child_task)
-    elif child_task in state.tasks_waiting_key:
-        state.tasks_waiting_key.remove(child_task)
-    elif child_task in state.tasks_waiting_time:
-        state.tasks_waiting_time.remove(child_task)
-        state.cleanup_tasks_waiting_time_hq()
-    elif child_task in state.tasks_waiting_inbox:
-        state.tasks_waiting_inbox.remove(child_task)
-    elif child_task in state.tasks_waiting_processes:
-        state.tasks_waiting_processes.remove(child_task)
-    elif child_task in state.completed_tasks:
-        del state.completed_tasks[child_task]
-    else:
+    for grand_child_task in list(child_tcb.children):
+        user_grand_child_task = state.tasks[grand_child_task].user_task
+        task_destroy(child_task, user_grand_child_task, keep_running=False)
+    child_tcb.children.clear()
+
+    if state.dequeue_task(child_task) in (None, TaskStatus.RUNNING):
         # TODO: Should not happen. Should the kernel panic?
         log.error('%r cannot destroy non-found task %r', task, child_task)
         return
 
     state.clear_trap_info(child_task)
     common.destroy_task_windows(child_task)
-    if child_task in state.task_processes:
+    if child_tcb.processes:
         log.warning('%r did not wait for spawned processes: %r',
-                    child_task, state.task_processes[child_task])
+                    child_task, child_tcb.processes)
     if keep_running:
+        child_tcb.status = TaskStatus.COMPLETED
         state.completed_tasks[child_task]  = (False, exceptions.TrapDestroyed(task))
         state.runnable_tasks.append(task)
         log.info('%r destroyed by %r', child_task, task)
     else:
+        # Nobody will wait on destroyed grand children: release them.
+        state.clear_kernel_task_mapping(child_task)
         log.info('%r destroyed from parent %r destroy', child_task, task)
 
 
@@ -351,10 +406,10 @@ def task_destroy(task, user_child_task, keep_running=True):
 @handler_for(Trap.MESSAGE_SEND)
 def message_send(task, to_user_task, message):
 
+    tcb = state.tasks[task]
     if to_user_task is None:
-        try:
-            to_task = state.parent_task[task]
-        except KeyError:
+        to_task = tcb.parent
+        if to_task is None:
             exc = exceptions.TrapException('no parent task for message send')
             state.trap_will_throw(task, exc)
             state.runnable_tasks.append(task)
@@ -364,11 +419,13 @@ def message_send(task, to_user_task, message):
 
     if to_task in state.tasks_waiting_inbox:
         state.tasks_waiting_inbox.remove(to_task)
-        user_space_task = state.user_space_tasks[task]
-        state.trap_will_return(to_task, (user_space_task, message))
+        state.trap_will_return(to_task, (tcb.user_task, message))
         state.runnable_tasks.append(to_task)
     else:
-        state.task_inbox[to_task].append((task, message))
+        to_tcb = state.tasks[to_task]
+        if to_tcb.inbox is None:
+            to_tcb.inbox = collections.deque()
+        to_tcb.inbox.append((tcb.user_task, message))
 
     state.runnable_tasks.append(task)
 
@@ -377,17 +434,48 @@ def message_send(task, to_user_task, message):
 @handler_for(Trap.MESSAGE_WAIT)
 def message_wait(task):
 
-    task_inbox = state.task_inbox[task]
+    task_inbox = state.tasks[task].inbox
     if task_inbox:
-        sender_task, message = task_inbox.popleft()
-        user_space_task = state.user_space_tasks[sender_task]
-        state.trap_will_return(task, (user_space_task, message))
+        state.trap_will_return(task, task_inbox.popleft())
         state.runnable_tasks.append(task)
     else:
         state.tasks_waiting_inbox.append(task)
 
 
 
+# Process output up to this size is rendered right away, unless a frame was
+# rendered less than a frame interval ago: keeps interactive echoes snappy.
+
+_ECHO_MAX_BYTES = 64
+
+def _render_process_output(window, data):
+
+    # Feeds `window` and marks it dirty: composing happens at most once per
+    # frame interval, here or via render_dirty_windows, from the kernel loop.
+    # Processes flooding their output this way cost one render per frame,
+    # instead of one per read.
+
+    window.feed(data)
+    state.dirty_windows[window] = None
+    if len(data) <= _ECHO_MAX_BYTES:
+        # A frame already pending takes this frame interval, if there is one.
+        if state.terminal_render_pending and state.frame_interval:
+            return
+        now = hw.time_monotonic()
+        if now >= state.next_frame_time:
+            render_dirty_windows()
+
+
+
+def render_dirty_windows():
+
+    # The output TTY is updated once, at the end of the kernel loop tick, which
+    # also sets the next frame time: see loop.process_terminal_render.
+    for window in list(state.dirty_windows):
+        _do_window_render(window)
+
+
+
 @handler_for(Trap.PROCESS_SPAWN)
 def process_spawn(task, window, args, buffer_size=4096):
 
@@ -396,11 +484,7 @@ def process_spawn(task, window, args, buffer_size=4096):
         def callback():
             data = os.read(from_fd, buffer_size)
             if data:
-                window.feed(data)
-                _do_window_render(window, terminal_render=False)
-                # Cursor moves with no other visible output must be rendered.
-                common.update_terminal_cursor_from_focus()
-                state.terminal.render(do_cursor=True)
+                _render_process_output(window, data)
             # Let caller know whether we pushed data or from_fd is at EOF.
             return data
 
@@ -426,14 +510,127 @@ def process_spawn(task, window, args, buffer_size=4096):
 @handler_for(Trap.PROCESS_WAIT)
 def process_wait(task):
 
-    completed_processes = state.completed_processes.get(task)
+    completed_processes = state.tasks[task].completed_processes
     if completed_processes:
         process = completed_processes.popleft()
         state.cleanup_task_process(task, process)
         state.trap_will_return(task, process)
         state.runnable_tasks.append(task)
     else:
-        state.tasks_waiting_processes.add(task)
+        state.tasks_waiting_processes.append(task)
+
+
+
+@handler_for(Trap.FUTURE_WAIT)
+def future_wait(task, awaitable):
+
+    # Only the asyncio kernel loop selector can track futures.
+    ensure_future = getattr(state.selector, 'ensure_future', None)
+    if ensure_future is None:
+        exc = exceptions.TrapException('future waiting needs the asyncio kernel loop')
+        state.trap_will_throw(task, exc)
+        state.runnable_tasks.append(task)
+        return
+
+    def done_callback(future):
+        if state.task_futures.get(task) is not future:
+            # Waiting task was destroyed.
+            return
+        del state.task_futures[task]
+        state.tasks_waiting_future.remove(task)
+        if future.cancelled():
+            exc = exceptions.TrapException('future cancelled', future)
+            state.trap_will_throw(task, exc)
+        elif future.exception() is not None:
+            state.trap_will_throw(task, future.exception())
+        else:
+            state.trap_will_return(task, future.result())
+        state.runnable_tasks.append(task)
+
+    try:
+        future = ensure_future(awaitable, done_callback)
+    except TypeError as e:
+        exc = exceptions.TrapException('not awaitable', e)
+        state.trap_will_throw(task, exc)
+        state.runnable_tasks.append(task)
+    else:
+        state.task_futures[task] = future
+        state.tasks_waiting_future.append(task)
+
+
+
+# Traps that never block the calling task can be batched.
+
+_BATCHABLE_TRAPS = {
+    Trap.DIRECT_CLEAR,
+    Trap.DIRECT_PRINT,
+    Trap.WINDOW_CREATE,
+    Trap.WINDOW_RENDER,
+    Trap.WINDOW_DESTROY,
+    Trap.WINDOW_RAISE,
+    Trap.WINDOW_LOWER,
+    Trap.WINDOW_HIDE,
+    Trap.WINDOW_SHOW,
+    Trap.KEY_UNREAD,
+    Trap.TASK_SPAWN,
+    Trap.TASK_DESTROY,
+    Trap.MESSAGE_SEND,
+    Trap.PROCESS_SPAWN,
+    Trap.STATE_DUMP,
+}
+
+@handler_for(Trap.BATCH)
+def batch(task, traps):
+
+    # Each sub-trap handler makes `task` runnable after storing its result in
+    # the task's control block: collect that and take `task` back out of the
+    # runnable queue before moving on to the next sub-trap.
+
+    # Malformed sub-traps produce per-item TrapExceptions: the handler must
+    # not fail, otherwise `task` would never be resumed.
+
+    tcb = state.tasks[task]
+    runnable_tasks = state.runnable_tasks
+    try:
+        traps = list(traps)
+    except TypeError:
+        state.trap_will_throw(task, exceptions.TrapException('traps not iterable', traps))
+        runnable_tasks.append(task)
+        return
+    results = []
+    for trap in traps:
+        if not isinstance(trap, tuple) or not trap:
+            results.append(exceptions.TrapException('not a trap', trap))
+            continue
+        trap_id, *trap_args = trap
+        if not isinstance(trap_id, Trap):
+            results.append(exceptions.TrapDoesNotExist(trap_id))
+            continue
+        if trap_id not in _BATCHABLE_TRAPS:
+            results.append(exceptions.TrapException('trap cannot be batched', trap_id))
+            continue
+        trap_handler = handlers[trap_id]
+        try:
+            inspect.signature(trap_handler).bind(task, *trap_args)
+        except TypeError as e:
+            log.error('%r bad batched trap args: %r', task, trap)
+            results.append(exceptions.TrapArgCountWrong(*e.args))
+            continue
+        try:
+            trap_handler(task, *trap_args)
+        except Exception as e:
+            log.error('%r batched trap %r execution failed', task, trap, exc_info=True)
+            result = exceptions.TrapException('trap execution failed', e)
+        else:
+            result = tcb.trap_result
+        if task in runnable_tasks:
+            runnable_tasks.remove(task)
+        tcb.trap_success = None
+        tcb.trap_result = None
+        results.append(result)
+
+    state.trap_will_return(task, results)
+    runnable_tasks.append(task)
 
 
 
@@ -443,30 +640,16 @@ _SEPARATOR = '-' * 60
 def state_dump(task, tag=''):
 
     def _task_status(task):
-        if task in state.runnable_tasks:
-            return 'RN'
-        if task in state.tasks_waiting_child:
-            return 'WC'
-        if task in state.tasks_waiting_inbox:
-            return 'WM'
-        if task in state.tasks_waiting_key:
-            return 'WK'
-        if task in state.tasks_waiting_time:
-            return 'WT'
-        if task in state.tasks_waiting_processes:
-            return 'WP'
-        if task in state.completed_tasks:
-            return 'CC'
-        return 'RR'
+        status = state.tasks[task].status
+        return status.value if status is not None else '??'
 
     def _log_task_lines(task, level=0):
         indent = ' ' * 4 * level
         status = _task_status(task)
-        user_space_task = state.user_space_tasks[task]
-        log.critical(f'{status} {indent}{user_space_task}')
-        if task in state.child_tasks:
-            for child in state.child_tasks[task]:
-                _log_task_lines(child, level+1)
+        tcb = state.tasks[task]
+        log.critical(f'{status} {indent}{tcb.user_task}')
+        for child in tcb.children:
+            _log_task_lines(child, level+1)
 
     def _log_object_vars(name, obj):
         for k, v in vars(obj).items():
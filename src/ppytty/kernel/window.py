@@ -5,10 +5,10 @@
 # See LICENSE for details.
 # ----------------------------------------------------------------------------
 
-import copy
 import functools
 
 import pyte
+from wcwidth import wcwidth
 
 
 
@@ -77,10 +77,18 @@ class _SelfBlessingsTerminal(object):
     bold = '\x1b[1m'
     reverse = '\x1b[7m'
 
+    cr = '\r'
+    move_down = '\n'
+    clear_eol = '\x1b[K'
+
     @staticmethod
     def move(line, column):
         return f'\x1b[{line+1};{column+1}H'
 
+    @staticmethod
+    def cuf(columns):
+        return f'\x1b[{columns}C'
+
     @staticmethod
     def color(fg_color):
         if fg_color < 8:
@@ -114,6 +122,7 @@ class Window(object):
         # attribute so that we can:
         # - Get the parent's width/height.
         # - Produce the correct escape sequences when rendering.
+        # Composing, instead, requires the parent to be a Window.
         self._parent = parent
 
         # Used in focus highlights.
@@ -140,6 +149,9 @@ class Window(object):
         self._dy = dy
         self._dw = dw
         self._dh = dh
+        # Called after geometry changes and passed a single argument: self.
+        self._geometry_callbacks = []
+        self._left = self._top = self._width = self._height = None
         self._update_geometry()
 
         # Track "uncovered" parent geometry after moves/resizes.
@@ -155,8 +167,15 @@ class Window(object):
 
         self._screen.cursor.hidden = no_cursor
 
-        # Save the screen buffer to support highlight.
-        self._save_buffer = None
+        # Focus highlight overlay, drawn over the screen contents when rendered
+        # or composed: None or a (line number, cells) tuple, where cells maps
+        # column numbers to characters; see highlight.
+        self._overlay = None
+        self._overlay_cursor_hidden = None
+
+        # Keys: line numbers, Values: (first column, cells, first format, text,
+        # last format) tuples, caching whole line renders; see self.render().
+        self._line_cache = {}
 
         # My public `bt` so others can produce the correct escape sequences to
         # be processed by self.feed().
@@ -175,11 +194,17 @@ class Window(object):
         parent_width = self._parent.width
         parent_height = self._parent.height
 
+        geometry = (self._left, self._top, self._width, self._height)
+
         self._left = _rel_to_abs(self._x, parent_width, self._dx)
         self._top =  _rel_to_abs(self._y, parent_height, self._dy)
         self._width = _rel_to_abs(self._w, parent_width, self._dw)
         self._height = _rel_to_abs(self._h, parent_height, self._dh)
 
+        if geometry != (self._left, self._top, self._width, self._height):
+            for callback in self._geometry_callbacks:
+                callback(self)
+
 
     def _update_last_render_geometry(self):
 
@@ -302,24 +327,36 @@ class Window(object):
         to_y = min(self._height, max_y+1)
 
         for y in range(from_y, to_y):
+            line = self_screen_buffer[y]
             for x in range(from_x, to_x):
-                del self_screen_buffer[y][x]
+                # Cells never written to are not in the line.
+                line.pop(x, None)
             self_screen_dirty.add(y)
 
 
     def highlight(self, clear=False):
 
+        # Overlays the title on the last line, leaving the screen contents
+        # untouched: only that line needs rendering/composing.
+        screen = self._screen
         if not clear:
-            self._save_buffer = copy.deepcopy(self._screen.buffer)
-            self._screen.save_cursor()
-            self._screen.cursor.hidden = True
-            text = str(self.title or self)
-            self.print(text, x=0, y=self._height-1, fg=0, bg=255)
+            if self._overlay is None:
+                self._overlay_cursor_hidden = screen.cursor.hidden
+            line_no = self._height - 1
+            # No auto-wrap: overflowing text is cut at the right edge.
+            overlay_screen = pyte.Screen(self._width, 1)
+            pyte.ByteStream(overlay_screen).feed(
+                b'\x1b[?7l\x1b[38;5;0;48;5;255m' + str(self.title or self).encode('utf8')
+            )
+            self._overlay = (line_no, dict(overlay_screen.buffer[0]))
+            screen.cursor.hidden = True
+        elif self._overlay is not None:
+            line_no = self._overlay[0]
+            self._overlay = None
+            screen.cursor.hidden = self._overlay_cursor_hidden
         else:
-            self._screen.select_graphic_rendition()
-            self._screen.restore_cursor()
-            self._screen.buffer = self._save_buffer
-            self._save_buffer = None
+            return
+        screen.dirty.add(line_no)
 
 
     def print(self, text, x=None, y=None, fg=None, bg=None):
@@ -360,8 +397,13 @@ class Window(object):
             self._h = h
         self._dw += dw
         self._dh += dh
+        size = (self._width, self._height)
         self._update_geometry()
+        if (self._width, self._height) == size:
+            # Moved, maybe, but not resized.
+            return
         self._screen.resize(self._height, self._width)
+        self._line_cache.clear()
         for callback in self._resize_callbacks:
             # TODO: Handle exceptions? Remove failing? Log and ignore/re-raise?
             callback(self)
@@ -372,16 +414,39 @@ class Window(object):
         self._resize_callbacks.append(callback)
 
 
+    def add_geometry_callback(self, callback):
+
+        self._geometry_callbacks.append(callback)
+
+
+    def remove_geometry_callback(self, callback):
+
+        self._geometry_callbacks.remove(callback)
+
+
     def feed(self, data):
 
         self._stream.feed(data)
 
 
-    def render(self, full=False, encoding='utf8', cursor_only=False, do_cursor=False):
+    def render(self, full=False, encoding='utf8', cursor_only=False, do_cursor=False,
+               front=None, rep=False, scroll=False, out=None):
 
         # full: if True, renders all lines; otherwise, renders changed lines.
         # cursor_only: if True, renders no lines, but renders the cursor.
         # do_cursor: if True, cursor is rendered with or without rendered lines.
+        # front: if not None, a list with one entry per parent line holding the
+        # cells last rendered there, or None if unknown; only cells that differ
+        # from those are rendered, and it is updated. Used by Terminal, keeping
+        # track of the output TTY contents, whose Window never moves.
+        # rep: if True, repeated characters are rendered with the parent `bt`
+        # REP escape sequence, which pyte does not support.
+        # scroll: if True, with `front` given, and the window spanning the
+        # whole parent width, lines that scrolled since last rendered are moved
+        # in the parent with a scroll region and index/reverse index, such that
+        # only newly exposed lines are rendered.
+        # out: if not None, a bytearray the encoded output is appended to, and
+        # returned; otherwise, returns bytes. Terminal reuses one per frame.
 
         self_parent = self._parent
         screen = self._screen
@@ -391,14 +456,15 @@ class Window(object):
         left = self._left
         render_left = max(0, left)
         top = self._top
-        window_bg = self._bg
 
         bt = self_parent.bt
-        bt_move = bt.move
-        self_char_format = self._char_format
+        encoded_control = _encoded_control
+        encoded_sgr_transition = _encoded_sgr_transition
+        self_render_cells = self._render_cells
+        line_cache = self._line_cache
 
-        payload = []
-        payload_append = payload.append
+        payload = bytearray() if out is None else out
+        payload_append = payload.extend
 
         if cursor_only:
             line_numbers = ()
@@ -409,45 +475,343 @@ class Window(object):
                 max_line = min(self._height, self_parent.height - top)
                 line_numbers = range(min_line, max_line)
             else:
-                line_numbers = {
+                line_numbers = sorted(
                     line_no for line_no in screen_dirty
                     if -top <= line_no < self_parent.height - top
-                }
+                )
 
         if line_numbers or cursor_only or do_cursor:
-            payload_append(bt.hide_cursor)
+            payload_append(encoded_control(bt, encoding, 'hide_cursor'))
 
         # Do not render columns outside of parent geometry
         min_column = max(0, -left)
         max_column = min(self._width, self_parent.width - left)
         column_numbers = range(min_column, max_column)
 
-        prev_char_format = ''
+        # Trailing blanks can be erased to the end of the line if we reach it.
+        erase_tail = left + max_column == self_parent.width
+        line_key = (min_column, erase_tail, rep, encoding)
+
+        # Moving to the start of the next line is shorter with CR + LF.
+        next_line_move = (encoded_control(bt, encoding, 'cr') +
+                          encoded_control(bt, encoding, 'move_down'))
+
+        overlay_line_no, overlay_cells = self._overlay or (None, None)
+
+        # Keys: parent line numbers, Values: cells; only computed up front when
+        # looking for scrolled lines.
+        line_cells = None
+        if (scroll and front is not None and len(line_numbers) >= _SCROLL_MIN_LINES and
+            left + min_column == 0 and erase_tail):
+            line_cells = {}
+            changed = []
+            for line_no in line_numbers:
+                line_data = screen_buffer[line_no]
+                if line_no == overlay_line_no:
+                    line_data = _overlaid(line_data, overlay_cells)
+                cells = [line_data[column_no] for column_no in column_numbers]
+                line_cells[top+line_no] = cells
+                if cells != front[top+line_no]:
+                    changed.append(top+line_no)
+            region = _scroll_region(line_cells, changed, front)
+            if region is None:
+                # Unchanged lines need no rendering: don't compare them again.
+                line_numbers = [parent_line - top for parent_line in changed]
+            else:
+                # Scrolling moves the cursor: index/reverse index from the
+                # bottom/top scroll region line; exposed lines are unknown.
+                first, last, shift = region
+                payload_append(encoded_control(bt, encoding, 'csr', first, last))
+                if shift > 0:
+                    payload_append(encoded_control(bt, encoding, 'move', last, 0))
+                    payload_append(encoded_control(bt, encoding, 'ind') * shift)
+                    front[first:last+1-shift] = front[first+shift:last+1]
+                    front[last+1-shift:last+1] = [None] * shift
+                else:
+                    payload_append(encoded_control(bt, encoding, 'move', first, 0))
+                    payload_append(encoded_control(bt, encoding, 'ri') * -shift)
+                    front[first-shift:last+1] = front[first:last+1+shift]
+                    front[first:first-shift] = [None] * -shift
+                payload_append(encoded_control(bt, encoding, 'csr', 0, self_parent.height-1))
+
+        prev_state = None
+        cursor_line = None
         for line_no in line_numbers:
             line_data = screen_buffer[line_no]
-            payload_append(bt_move(top+line_no, render_left))
-            for column_no in column_numbers:
-                char_data, fg, bg, bold, _, _, _, reverse = line_data[column_no]
-                default_bg = window_bg
-                if hasattr(window_bg, '__getitem__'):
-                    default_bg = window_bg[line_no][column_no]
-                char_format = self_char_format(bt, fg, bg, bold, reverse, default_bg)
-                if char_format != prev_char_format:
-                    payload_append(char_format)
-                    prev_char_format = char_format
-                payload_append(char_data)
+            if line_no == overlay_line_no:
+                line_data = _overlaid(line_data, overlay_cells)
+            parent_line = top + line_no
+            if line_cells is None:
+                cells = [line_data[column_no] for column_no in column_numbers]
+            else:
+                cells = line_cells[parent_line]
+            runs = None
+            if front is not None:
+                front_cells = front[parent_line]
+                if cells == front_cells:
+                    continue
+                front[parent_line] = cells
+                if front_cells is not None and len(front_cells) == len(cells):
+                    runs = _changed_runs(cells, front_cells, min_column)
+            if runs is None:
+                # Whole line: reuse the cached text if its cells are unchanged.
+                cached = line_cache.get(line_no)
+                if cached is not None and cached[0] == line_key and cached[1] == cells:
+                    _, _, first_state, text, last_state = cached
+                else:
+                    first_state, text, last_state = self_render_cells(
+                        bt, line_no, line_data, min_column, max_column,
+                        erase_tail, rep, encoding,
+                    )
+                    line_cache[line_no] = (line_key, cells, first_state, text, last_state)
+                texts = ((min_column, max_column, first_state, text, last_state),)
+            else:
+                texts = [
+                    (from_column, to_column) + self_render_cells(
+                        bt, line_no, line_data, from_column, to_column,
+                        erase_tail and to_column == max_column, rep, encoding,
+                    )
+                    for from_column, to_column in runs
+                ]
+            prev_to_column = None
+            for from_column, to_column, first_state, text, last_state in texts:
+                if first_state is None:
+                    # No columns within parent geometry.
+                    continue
+                if prev_to_column is not None:
+                    payload_append(encoded_control(bt, encoding, 'cuf', from_column-prev_to_column))
+                elif cursor_line == parent_line - 1 and left + from_column == 0:
+                    payload_append(next_line_move)
+                else:
+                    payload_append(encoded_control(
+                        bt, encoding, 'move', parent_line, left+from_column,
+                    ))
+                if first_state != prev_state:
+                    payload_append(encoded_sgr_transition(bt, encoding, prev_state, first_state))
+                payload_append(text)
+                prev_state = last_state
+                prev_to_column = to_column
+                cursor_line = parent_line
 
         if line_numbers or cursor_only or do_cursor:
-            payload_append(bt.normal)
+            if prev_state != _NORMAL_STATE:
+                payload_append(encoded_control(bt, encoding, 'normal'))
             # TODO: Improve cursor handling if outside parent geometry.
-            payload_append(bt_move(max(0, top+screen_cursor.y), render_left+screen_cursor.x))
+            payload_append(encoded_control(
+                bt, encoding, 'move', max(0, top+screen_cursor.y), render_left+screen_cursor.x,
+            ))
             if not screen_cursor.hidden:
-                payload_append(bt.normal_cursor)
+                payload_append(encoded_control(bt, encoding, 'normal_cursor'))
 
         screen_dirty.clear()
         self._update_last_render_geometry()
 
-        return ''.join(payload).encode(encoding)
+        return bytes(payload) if out is None else payload
+
+
+    def _render_cells(self, bt, line_no, line_data, from_column, to_column,
+                      erase_tail=False, rep=False, encoding='utf8'):
+
+        # Renders the `line_data` cells from `from_column` to `to_column`,
+        # excluded, returning a (first state, text, last state) tuple, where
+        # text is encoded and excludes the transition into the first character
+        # state; states are None if there are no cells to render. If
+        # `erase_tail` is True, trailing blanks with no background are erased
+        # to the end of the line instead; if `rep` is True, repeated characters
+        # use REP.
+
+        window_bg = self._bg
+        per_cell_bg = hasattr(window_bg, '__getitem__')
+        char_state = _char_state
+        sgr_transition = _sgr_transition
+        wide_chars_start = _WIDE_CHARS_START
+
+        # Erased cells get the current character state: trailing blanks must
+        # all be the same, with no background or reverse video.
+        tail_column = to_column
+        tail_state = None
+        if erase_tail and to_column - from_column >= _ERASE_MIN_COUNT:
+            last_column = to_column - 1
+            last_cell = line_data[last_column]
+            char_data, fg, bg, bold, _, _, _, reverse = last_cell
+            default_bg = window_bg[line_no][last_column] if per_cell_bg else window_bg
+            tail_state = char_state(fg, bg, bold, reverse, default_bg)
+            if char_data == ' ' and not tail_state[1] and tail_state[3] is None:
+                while (tail_column > from_column and
+                       line_data[tail_column-1] == last_cell and
+                       (not per_cell_bg or
+                        window_bg[line_no][tail_column-1] == default_bg)):
+                    tail_column -= 1
+            if to_column - tail_column < _ERASE_MIN_COUNT:
+                tail_column = to_column
+
+        parts = []
+        parts_append = parts.append
+
+        first_state = prev_state = None
+        default_bg = window_bg
+        skip_to_column = from_column
+        stub_column = None
+        for column_no in range(from_column, tail_column):
+            if column_no < skip_to_column:
+                # Rendered with REP.
+                continue
+            cell = line_data[column_no]
+            char_data, fg, bg, bold, _, _, _, reverse = cell
+            # Wide characters are rendered along with their stub cell, drawing
+            # which moves the cursor over both, or not at all, like `compose`.
+            if not char_data:
+                if column_no != stub_column:
+                    char_data = ' '
+            elif char_data >= wide_chars_start and wcwidth(char_data[0]) == 2:
+                if column_no + 1 < to_column and not line_data[column_no+1].data:
+                    stub_column = column_no + 1
+                else:
+                    char_data = ' '
+            if per_cell_bg:
+                default_bg = window_bg[line_no][column_no]
+            state = char_state(fg, bg, bold, reverse, default_bg)
+            # Cached states: identity checks are faster, equality is not needed.
+            if state is not prev_state:
+                if prev_state is None:
+                    first_state = state
+                else:
+                    parts_append(sgr_transition(bt, prev_state, state))
+                prev_state = state
+            # REP only takes the character's low byte: it must be ASCII.
+            if rep and len(char_data) == 1 and char_data < '\x80':
+                skip_to_column = column_no + 1
+                while (skip_to_column < tail_column and
+                       line_data[skip_to_column] == cell and
+                       (not per_cell_bg or
+                        window_bg[line_no][skip_to_column] == default_bg)):
+                    skip_to_column += 1
+                count = skip_to_column - column_no
+                if count >= _REP_MIN_COUNT:
+                    parts_append(bt.rep(ord(char_data), count))
+                    continue
+                char_data *= count
+            parts_append(char_data)
+
+        if tail_column < to_column:
+            if prev_state is None:
+                first_state = tail_state
+            elif tail_state != prev_state:
+                parts_append(sgr_transition(bt, prev_state, tail_state))
+            prev_state = tail_state
+            parts_append(bt.clear_eol)
+
+        return first_state, ''.join(parts).encode(encoding), prev_state
+
+
+    def compose(self, full=False, cursor_only=False, do_cursor=False, spans=None):
+
+        # Like `render`, but copies character cells directly into the parent
+        # Window's screen, with the same end result as feeding it what `render`
+        # produces, without the intermediate escape sequences and re-parsing.
+        # spans: if not None, maps line numbers to lists of (from, to) column
+        # ranges, with `to` excluded, such that only those cells are composed;
+        # expected to be within parent geometry. See common.window_visibility.
+
+        parent_screen = self._parent._screen
+        parent_buffer = parent_screen.buffer
+        parent_dirty = parent_screen.dirty
+        screen = self._screen
+        screen_cursor = screen.cursor
+        screen_buffer = screen.buffer
+        screen_dirty = screen.dirty
+        left = self._left
+        render_left = max(0, left)
+        top = self._top
+        window_bg = self._bg
+        per_cell_bg = hasattr(window_bg, '__getitem__')
+        parent_width = parent_screen.columns
+        parent_height = parent_screen.lines
+
+        compose_colors = _compose_colors
+        Char = pyte.screens.Char
+
+        if cursor_only:
+            line_numbers = ()
+        elif spans is not None:
+            if full:
+                line_numbers = spans
+            else:
+                line_numbers = [line_no for line_no in screen_dirty if line_no in spans]
+        else:
+            # Do not compose lines outside of parent geometry
+            if full:
+                min_line = max(0, -top)
+                max_line = min(self._height, parent_height - top)
+                line_numbers = range(min_line, max_line)
+            else:
+                line_numbers = {
+                    line_no for line_no in screen_dirty
+                    if -top <= line_no < parent_height - top
+                }
+
+        # Do not compose columns outside of parent geometry
+        min_column = max(0, -left)
+        max_column = min(self._width, parent_width - left)
+        line_spans = ((min_column, max_column),)
+
+        overlay_line_no, overlay_cells = self._overlay or (None, None)
+        for line_no in line_numbers:
+            line_data = screen_buffer[line_no]
+            if line_no == overlay_line_no:
+                line_data = _overlaid(line_data, overlay_cells)
+            parent_line = parent_buffer[top+line_no]
+            default_bg = window_bg
+            if spans is not None:
+                line_spans = spans[line_no]
+            for from_column, to_column in line_spans:
+                # Wide characters and their stub cells are composed together,
+                # or not at all, with blanks in their place, like `render`.
+                stub_column = None
+                for column_no in range(from_column, to_column):
+                    char_data, fg, bg, bold, _, _, _, reverse = line_data[column_no]
+                    if not char_data:
+                        if column_no == stub_column:
+                            continue
+                        char_data = ' '
+                    if per_cell_bg:
+                        default_bg = window_bg[line_no][column_no]
+                    parent_fg, parent_bg, bold_colors = compose_colors(fg, bg, default_bg)
+                    parent_char = Char(char_data, parent_fg, parent_bg, bold or bold_colors,
+                                       False, False, False, reverse)
+                    if char_data >= _WIDE_CHARS_START and wcwidth(char_data[0]) == 2:
+                        if column_no + 1 < to_column and not line_data[column_no+1].data:
+                            stub_column = column_no + 1
+                            parent_line[left+stub_column] = parent_char._replace(data='')
+                        else:
+                            parent_char = parent_char._replace(data=' ')
+                    parent_line[left+column_no] = parent_char
+                if from_column >= to_column:
+                    continue
+                # Unlike `render`, blank parent wide characters or stubs left
+                # without their pair: rendering the parent must reproduce it.
+                parent_from = left + from_column
+                parent_to = left + to_column
+                if parent_from > 0:
+                    parent_char = parent_line[parent_from-1]
+                    if (parent_char.data >= _WIDE_CHARS_START and
+                        wcwidth(parent_char.data[0]) == 2):
+                        parent_line[parent_from-1] = parent_char._replace(data=' ')
+                if parent_to < parent_width:
+                    parent_char = parent_line[parent_to]
+                    if not parent_char.data:
+                        parent_line[parent_to] = parent_char._replace(data=' ')
+            parent_dirty.add(top+line_no)
+
+        if line_numbers or cursor_only or do_cursor:
+            # Same cursor handling as `render` output would trigger.
+            parent_screen.select_graphic_rendition(0)
+            parent_screen.cursor_position(max(0, top+screen_cursor.y)+1,
+                                          render_left+screen_cursor.x+1)
+            parent_screen.cursor.hidden = screen_cursor.hidden
+
+        screen_dirty.clear()
+        self._update_last_render_geometry()
 
 
     # These will be used when rendering the pyte.Screen to a blessings generated
@@ -461,23 +825,227 @@ class Window(object):
         _COLORS[v] = i
 
 
-    @functools.lru_cache(maxsize=None)
-    def _char_format(self, bt, fg, bg, bold, reverse, default_bg):
 
-        colors = self._COLORS
-        parts = [bt.normal]
-        parts_append = parts.append
-        if bold:
-            parts_append(bt.bold)
-        if reverse:
-            parts_append(bt.reverse)
-        fg_idx = colors.get(fg)
-        if fg_idx is not None:
-            parts_append(bt.color(fg_idx))
-        bg_idx = colors.get(bg, default_bg)
-        if bg_idx is not None:
-            parts_append(bt.on_color(bg_idx))
-        return ''.join(parts)
+# Character states are (bold, reverse, fg index, bg index) tuples, with None
+# indexes for the default colors; see _sgr_transition.
+
+_NORMAL_STATE = (False, False, None, None)
+
+
+# Character formats are cached, shared by all Windows, and bounded: keys
+# include pyte colors, which can be any of the 24-bit hex strings, and the
+# `bt` being rendered to, such that no terminals are kept alive forever.
+# See _char_state.cache_info() for hit/miss counts, for example.
+
+_CHAR_FORMAT_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=_CHAR_FORMAT_CACHE_SIZE)
+def _char_state(fg, bg, bold, reverse, default_bg):
+
+    colors = Window._COLORS
+    return bool(bold), bool(reverse), colors.get(fg), colors.get(bg, default_bg)
+
+
+
+@functools.lru_cache(maxsize=_CHAR_FORMAT_CACHE_SIZE)
+def _sgr_transition(bt, from_state, to_state):
+
+    # Returns the minimal escape sequences changing the character state from
+    # `from_state`, None if unknown, to `to_state`. Attributes can't be turned
+    # off individually and colors can't be reset to their defaults separately,
+    # with the available capabilities: that requires starting from normal.
+
+    bold, reverse, fg_idx, bg_idx = to_state
+    parts = []
+    parts_append = parts.append
+    if from_state is not None:
+        from_bold, from_reverse, from_fg_idx, from_bg_idx = from_state
+        if ((from_bold and not bold) or (from_reverse and not reverse) or
+            (from_fg_idx is not None and fg_idx is None) or
+            (from_bg_idx is not None and bg_idx is None) or
+            # pyte sets bold on the "bright" aixterm colors: see _compose_color_tables.
+            (from_fg_idx != fg_idx and 8 <= (from_fg_idx or 0) < 16) or
+            (from_bg_idx != bg_idx and 8 <= (from_bg_idx or 0) < 16)):
+            from_state = None
+    if from_state is None:
+        parts_append(bt.normal)
+        from_bold, from_reverse, from_fg_idx, from_bg_idx = _NORMAL_STATE
+    if bold and not from_bold:
+        parts_append(bt.bold)
+    if reverse and not from_reverse:
+        parts_append(bt.reverse)
+    if fg_idx is not None and fg_idx != from_fg_idx:
+        parts_append(bt.color(fg_idx))
+    if bg_idx is not None and bg_idx != from_bg_idx:
+        parts_append(bt.on_color(bg_idx))
+    return ''.join(parts)
+
+
+
+# Encoded control sequences written in between rendered cells: shared by all
+# Windows and bounded, much like character state transitions.
+
+@functools.lru_cache(maxsize=_CHAR_FORMAT_CACHE_SIZE)
+def _encoded_control(bt, encoding, name, *args):
+
+    # Returns the `bt` control sequence `name`, encoded; if `args` are given,
+    # it is a parameterized one, called with them.
+    control = getattr(bt, name)
+    if args:
+        control = control(*args)
+    return control.encode(encoding)
+
+
+@functools.lru_cache(maxsize=_CHAR_FORMAT_CACHE_SIZE)
+def _encoded_sgr_transition(bt, encoding, from_state, to_state):
+
+    return _sgr_transition(bt, from_state, to_state).encode(encoding)
+
+
+
+def _overlaid(line, cells):
+
+    # Returns a copy of the screen buffer `line` with `cells` drawn over it.
+    overlaid = type(line)(line.default)
+    overlaid.update(line)
+    overlaid.update(cells)
+    return overlaid
+
+
+
+# Trailing blanks are erased with EL if there are at least these many, and
+# characters repeated at least these many times are rendered with REP.
+
+_ERASE_MIN_COUNT = 4
+_REP_MIN_COUNT = 6
+
+
+
+# Unchanged cells in between changed ones are re-rendered, instead of moving the
+# cursor over them, if there are no more than these many.
+
+_RUN_MAX_GAP = 4
+
+
+def _changed_runs(cells, front_cells, offset):
+
+    # Returns a list of (from, to) column ranges, with `to` excluded, covering
+    # the `cells` that differ from `front_cells`, both lists of pyte Chars for
+    # the columns starting at `offset`. Wide character stubs are rendered only
+    # along with the wide character to their left, drawing which moves the
+    # cursor over them: runs never start or end in between the two.
+
+    runs = []
+    run_start = None
+    run_end = None
+    changed = False
+    for index, cell in enumerate(cells):
+        start = index
+        if cell.data:
+            changed = cell != front_cells[index]
+        elif not changed and index and cell != front_cells[index]:
+            # Changed stub only: render it along with its wide character.
+            changed = True
+            start = index - 1
+        if not changed:
+            continue
+        if run_end is not None and start - run_end <= _RUN_MAX_GAP:
+            run_end = index + 1
+            continue
+        if run_end is not None:
+            runs.append((offset+run_start, offset+run_end))
+        run_start = start
+        run_end = index + 1
+    if run_end is not None:
+        runs.append((offset+run_start, offset+run_end))
+    return runs
+
+
+
+# Scrolling output TTY lines must save rendering at least these many lines;
+# at most these many candidate scroll amounts are checked, in each direction.
+
+_SCROLL_MIN_LINES = 2
+_SCROLL_MAX_CANDIDATES = 4
+
+
+def _scroll_region(lines, changed, front):
+
+    # Returns a (first, last, shift) tuple such that scrolling the parent lines
+    # from `first` to `last`, included, up by `shift` lines, or down if
+    # negative, has the most `lines` match `front`, both mapping parent line
+    # numbers to cells, where `lines` are the ones being rendered, and
+    # `changed` the sorted ones not matching `front`; returns None if no
+    # scroll saves rendering at least _SCROLL_MIN_LINES lines.
+
+    if len(changed) < _SCROLL_MIN_LINES:
+        return None
+
+    best = None
+    best_gain = _SCROLL_MIN_LINES - 1
+    # Scrolled up content: the first changed line was rendered further down;
+    # scrolled down content: the last changed line was rendered further up.
+    for direction, anchor in ((1, changed[0]), (-1, changed[-1])):
+        anchor_cells = lines[anchor]
+        candidates = 0
+        shift = direction
+        while anchor + shift in lines and candidates < _SCROLL_MAX_CANDIDATES:
+            if front[anchor+shift] == anchor_cells:
+                candidates += 1
+                # Lines matching the front ones `shift` lines away, stopping at
+                # the first exposed one; gain counts the renders saved.
+                line_no = anchor
+                gain = 0
+                while (line_no in lines and line_no + shift in lines and
+                       lines[line_no] == front[line_no+shift]):
+                    gain += lines[line_no] != front[line_no]
+                    line_no += direction
+                exposed = range(line_no, line_no + shift, direction)
+                if all(exposed_no in lines for exposed_no in exposed):
+                    gain -= sum(lines[exposed_no] == front[exposed_no] for exposed_no in exposed)
+                    if gain > best_gain:
+                        first, last = sorted((anchor, line_no + shift - direction))
+                        best = (first, last, shift)
+                        best_gain = gain
+            shift += direction
+    return best
+
+
+
+def _compose_color_tables():
+
+    # Maps color indexes to the (pyte fg/bg color, bold) that result from
+    # feeding a pyte Screen with the escape sequences Window.render produces:
+    # pyte sets bold on the "bright" aixterm colors, for example.
+
+    screen = pyte.Screen(1, 1)
+    stream_feed = pyte.ByteStream(screen).feed
+    bt = _SelfBlessingsTerminal
+    fg_colors = {None: ('default', False)}
+    bg_colors = {None: ('default', False)}
+    for index in range(256):
+        stream_feed(bt.normal.encode() + bt.color(index).encode())
+        fg_colors[index] = (screen.cursor.attrs.fg, screen.cursor.attrs.bold)
+        stream_feed(bt.normal.encode() + bt.on_color(index).encode())
+        bg_colors[index] = (screen.cursor.attrs.bg, screen.cursor.attrs.bold)
+    return fg_colors, bg_colors
+
+_COMPOSE_FG, _COMPOSE_BG = _compose_color_tables()
+
+# No character before this one is wide: avoids most wcwidth calls.
+
+_WIDE_CHARS_START = '\u1100'
+
+
+@functools.lru_cache(maxsize=_CHAR_FORMAT_CACHE_SIZE)
+def _compose_colors(fg, bg, default_bg):
+
+    # Returns (parent fg, parent bg, whether the colors force bold).
+    colors = Window._COLORS
+    parent_fg, fg_bold = _COMPOSE_FG[colors.get(fg)]
+    parent_bg, bg_bold = _COMPOSE_BG[colors.get(bg, default_bg)]
+    return parent_fg, parent_bg, fg_bold or bg_bold
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,263 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+"""
+Window Store
+
+Z-ordered windows supporting amortized O(log n) removal and restacking,
+amortized O(1) insertion on top, and spatially indexed overlap queries. Removed
+windows leave tombstones behind, periodically compacted. Hidden windows keep
+their z-order position, but are not spatially indexed.
+"""
+
+import bisect
+import itertools
+
+
+
+# Grid bucket geometry, in terminal columns/lines: windows are indexed in every
+# bucket they intersect, such that overlap queries only visit nearby windows.
+_CELL_WIDTH = 16
+_CELL_HEIGHT = 8
+
+
+
+class WindowStore(object):
+
+    def __init__(self):
+
+        # Windows in back to front order, from the `_start` index on, and their
+        # increasing z values: each window's position is found via bisect.
+        # Removed windows are None tombstones, never first or last; entries
+        # before `_start` are free, such that moving to the bottom is cheap.
+        self._windows = []
+        self._zs = []
+        self._start = 0
+        self._tombstones = 0
+        # Next z values on top/at the bottom, never reused.
+        self._top_z = 0
+        self._bottom_z = -1
+        # Keys: Windows, Values: their z value.
+        self._z = {}
+
+        # Keys: (column, line) bucket coordinates, Values: dicts with Window
+        # keys and None values, for the windows intersecting that bucket.
+        self._buckets = {}
+        # Keys: Windows, Values: the bucket coordinates they are indexed in.
+        self._window_buckets = {}
+        # Hidden windows, not in buckets: dict with Window keys, None values.
+        self._hidden = {}
+
+        # Incremented on any z-order or window geometry change.
+        self.version = 0
+
+
+    def __repr__(self):
+
+        return f'WindowStore({list(self)!r})'
+
+
+    def __len__(self):
+
+        return len(self._z)
+
+
+    def __iter__(self):
+
+        windows = itertools.islice(self._windows, self._start, None)
+        return (w for w in windows if w is not None)
+
+
+    def __reversed__(self):
+
+        windows = itertools.islice(reversed(self._windows), len(self._windows) - self._start)
+        return (w for w in windows if w is not None)
+
+
+    def __contains__(self, window):
+
+        return window in self._z
+
+
+    def append(self, window):
+
+        # Adds `window` on top of all others.
+        self._push_top(window)
+        self._index(window)
+        window.add_geometry_callback(self._geometry_changed)
+        self.version += 1
+
+
+    def remove(self, window):
+
+        self._remove_z(window)
+        if window in self._hidden:
+            del self._hidden[window]
+        else:
+            self._unindex(window)
+        window.remove_geometry_callback(self._geometry_changed)
+        self.version += 1
+
+
+    def move_to_top(self, window):
+
+        if self._windows[-1] is window:
+            return
+        self._remove_z(window)
+        self._push_top(window)
+        self.version += 1
+
+
+    def move_to_bottom(self, window):
+
+        if self._windows[self._start] is window:
+            return
+        self._remove_z(window)
+        if not self._start:
+            # Free entries for this and as many more moves as there are windows.
+            self._compact(free=len(self._z) + 1)
+        self._start -= 1
+        z = self._bottom_z
+        self._bottom_z -= 1
+        self._windows[self._start] = window
+        self._zs[self._start] = z
+        self._z[window] = z
+        self.version += 1
+
+
+    def hide(self, window):
+
+        # Hidden windows are not returned by `overlapping`.
+        if window in self._hidden:
+            return
+        self._unindex(window)
+        self._hidden[window] = None
+        self.version += 1
+
+
+    def show(self, window):
+
+        if window not in self._hidden:
+            return
+        del self._hidden[window]
+        self._index(window)
+        self.version += 1
+
+
+    def is_hidden(self, window):
+
+        return window in self._hidden
+
+
+    def overlapping(self, min_x, max_x, min_y, max_y):
+
+        # Returns the windows overlapping the given geometry, max values
+        # included, like Window.overlaps_geometry takes, in back to front order.
+
+        buckets = self._buckets
+        candidates = {}
+        for bucket_y in range(min_y // _CELL_HEIGHT, max_y // _CELL_HEIGHT + 1):
+            for bucket_x in range(min_x // _CELL_WIDTH, max_x // _CELL_WIDTH + 1):
+                bucket = buckets.get((bucket_x, bucket_y))
+                if bucket:
+                    candidates.update(bucket)
+        overlapping = [
+            w for w in candidates
+            if w.overlaps_geometry(min_x, max_x, min_y, max_y)
+        ]
+        overlapping.sort(key=self._z.__getitem__)
+        return overlapping
+
+
+    def is_above(self, window, other):
+
+        return self._z[window] > self._z[other]
+
+
+    def _push_top(self, window):
+
+        z = self._top_z
+        self._top_z += 1
+        self._windows.append(window)
+        self._zs.append(z)
+        self._z[window] = z
+
+
+    def _remove_z(self, window):
+
+        # Leaves a tombstone behind, unless first or last, such that both are
+        # always windows: those are removed, along with any tombstones next to
+        # them. Compacts when tombstones and free entries are the majority.
+        z = self._z.pop(window)
+        windows = self._windows
+        zs = self._zs
+        index = bisect.bisect_left(zs, z, self._start)
+        windows[index] = None
+        self._tombstones += 1
+        while len(windows) > self._start and windows[-1] is None:
+            windows.pop()
+            zs.pop()
+            self._tombstones -= 1
+        while self._start < len(windows) and windows[self._start] is None:
+            self._start += 1
+            self._tombstones -= 1
+        if self._tombstones + self._start > 2 * len(self._z):
+            self._compact()
+
+
+    def _compact(self, free=0):
+
+        # Drops tombstones, leaving `free` entries before the first window.
+        windows = [w for w in itertools.islice(self._windows, self._start, None) if w is not None]
+        self._windows = [None] * free + windows
+        self._zs = [0] * free + [self._z[w] for w in windows]
+        self._start = free
+        self._tombstones = 0
+
+
+    def _geometry_changed(self, window):
+
+        if window not in self._hidden:
+            self._unindex(window)
+            self._index(window)
+        self.version += 1
+
+
+    def _index(self, window):
+
+        left = window.left
+        top = window.top
+        if window.width <= 0 or window.height <= 0:
+            coordinates = ()
+        else:
+            coordinates = tuple(
+                (bucket_x, bucket_y)
+                for bucket_y in range(top // _CELL_HEIGHT,
+                                      (top + window.height - 1) // _CELL_HEIGHT + 1)
+                for bucket_x in range(left // _CELL_WIDTH,
+                                      (left + window.width - 1) // _CELL_WIDTH + 1)
+            )
+        buckets = self._buckets
+        for coordinate in coordinates:
+            try:
+                buckets[coordinate][window] = None
+            except KeyError:
+                buckets[coordinate] = {window: None}
+        self._window_buckets[window] = coordinates
+
+
+    def _unindex(self, window):
+
+        buckets = self._buckets
+        for coordinate in self._window_buckets.pop(window):
+            bucket = buckets[coordinate]
+            del bucket[window]
+            if not bucket:
+                del buckets[coordinate]
+
+
+# ----------------------------------------------------------------------------
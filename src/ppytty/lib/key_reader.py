@@ -7,6 +7,7 @@
 
 
 from ppytty.kernel import api
+from ppytty.kernel.exceptions import TrapException
 from . import task
 
 
@@ -16,7 +17,14 @@ class KeyReader(task.Task):
     async def run(self):
 
         while True:
-            keyboard_bytes = await api.key_read()
+            try:
+                keyboard_bytes = await api.key_read()
+            except TrapException:
+                # Terminal input closed: tell the parent, with None, and wait
+                # to be destroyed.
+                await api.message_send(None, None)
+                await api.message_wait()
+                return
             await api.message_send(None, keyboard_bytes)
 
 
@@ -64,6 +64,9 @@ class SlideDeck(task.Task):
             sender, message = await api.message_wait()
             self._log.debug('message from %r: %r', sender, message)
             if sender is self._key_reader:
+                if message is None:
+                    # Terminal input closed: no more navigation.
+                    break
                 action = self._keymap.get(message)
                 if action is None:
                     continue
@@ -80,6 +83,8 @@ class SlideDeck(task.Task):
             else:
                 self._log.error('unexpected sender=%r, message=%r', sender, message)
 
+        await api.task_destroy(self._current_slide)
+        await api.task_wait()
         await api.task_destroy(self._key_reader)
         await api.task_wait()
 
@@ -7,6 +7,8 @@
 
 
 import collections
+import os
+import selectors
 
 from ppytty.kernel import hw
 
@@ -31,6 +33,29 @@ class _FakeInputFile(object):
 
 
 
+class _FakeSelector(object):
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.keys = {}
+
+    def register(self, fd, events, data=None):
+        self.keys[fd] = selectors.SelectorKey(fd, fd, events, data)
+
+    def modify(self, fd, events, data=None):
+        self.keys[fd] = selectors.SelectorKey(fd, fd, events, data)
+
+    def unregister(self, fd):
+        del self.keys[fd]
+
+    def select(self, timeout=None):
+        return self.controller.select(self.keys, timeout)
+
+    def close(self):
+        self.keys.clear()
+
+
+
 class _AutoTimeFakeInputController(object):
 
     def __init__(self, fake_input=None):
@@ -40,15 +65,19 @@ class _AutoTimeFakeInputController(object):
     def time_monotonic(self):
         return self.monotonic
 
-    def select_select(self, rlist, wlist, xlist, timeout=None):
+    def selectors_DefaultSelector(self):
+        return _FakeSelector(self)
+
+    def select(self, keys, timeout=None):
         # timeout=None means forever, for now assume 42
         timeout = 42 if timeout is None else timeout
         self.monotonic += timeout
         if self.fake_input and self.fake_input.buffer:
-            read_fds = (self.fake_input.fileno(),)
+            key = keys[self.fake_input.fileno()]
+            events = [(key, selectors.EVENT_READ)]
         else:
-            read_fds = ()
-        return read_fds, None, None
+            events = []
+        return events
 
     def os_read(self, *args):
         return self.fake_input.buffer.popleft()
@@ -91,7 +120,8 @@ class _Fake_os_write(object):
         self._writes.clear()
 
     def __call__(self, _fd, data):
-        self._writes.append(data)
+        # Like os.write, keep no references to data: callers may reuse it.
+        self._writes.append(bytes(data))
         return len(data)
 
     def written(self):
@@ -99,6 +129,12 @@ class _Fake_os_write(object):
 
 
 
+def _fake_os_open(_path, _flags):
+    # Opened TTY output FDs are written to via the fake os.write, only.
+    return os.open(os.devnull, os.O_WRONLY)
+
+
+
 class NoOutputTestCase(TestCase):
 
     _PATCHES = [
@@ -106,6 +142,8 @@ class NoOutputTestCase(TestCase):
         ('ppytty.kernel.hw.os_write', _Fake_os_write(), None),
         ('ppytty.kernel.hw.termios_tcgetattr', None, mock.DEFAULT),
         ('ppytty.kernel.hw.termios_tcsetattr', None, mock.DEFAULT),
+        ('ppytty.kernel.hw.os_open', mock.Mock(side_effect=_fake_os_open), None),
+        ('ppytty.kernel.hw.os_environ', {}, None),
         ('ppytty.kernel.hw.sys_stdout', None, mock.DEFAULT),
 
         # Patch blessings usage of ioctl to return an 80x25 terminal size.
@@ -237,7 +275,7 @@ class NoOutputAutoTimeTestCase(_ExtraPatchingMixin, NoOutputTestCase):
         self._patches = [
             # Patch ppytty.kernel.hw output related attributes.
             ('ppytty.kernel.hw.time_monotonic', self.auto_time.time_monotonic),
-            ('ppytty.kernel.hw.select_select', self.auto_time.select_select),
+            ('ppytty.kernel.hw.selectors_DefaultSelector', self.auto_time.selectors_DefaultSelector),
         ]
         super().setUp()
 
@@ -254,7 +292,7 @@ class NoOutputAutoTimeControlledInputTestCase(_ExtraPatchingMixin, NoOutputTestC
             # Patch ppytty.kernel.hw output related attributes.
             ('ppytty.kernel.hw.sys_stdin', fake_stdin),
             ('ppytty.kernel.hw.time_monotonic', self.input_control.time_monotonic),
-            ('ppytty.kernel.hw.select_select', self.input_control.select_select),
+            ('ppytty.kernel.hw.selectors_DefaultSelector', self.input_control.selectors_DefaultSelector),
             ('ppytty.kernel.hw.os_read', self.input_control.os_read),
         ]
         super().setUp()
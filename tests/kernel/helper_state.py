@@ -18,6 +18,13 @@ def _assert_is_none(object, attr_name):
         raise AssertionError(f'{attr_name!r} is not None: {value!r}')
 
 
+def _assert_is_false(object, attr_name):
+
+    value = getattr(object, attr_name)
+    if value is not False:
+        raise AssertionError(f'{attr_name!r} is not False: {value!r}')
+
+
 def _assert_empty_list(object, attr_name):
 
     value = getattr(object, attr_name)
@@ -37,6 +44,16 @@ def _assert_empty_dict(object, attr_name):
         raise AssertionError(f'{attr_name!r} with non-zero length: {value!r}')
 
 
+def _assert_empty_timers(object, attr_name):
+
+    value = getattr(object, attr_name)
+    for expected_attr in ('add', 'cancel', 'pop_expired'):
+        if not hasattr(value, expected_attr):
+            raise AssertionError(f'{attr_name!r} not timers-like: no {expected_attr} method')
+    if len(value):
+        raise AssertionError(f'{attr_name!r} with non-zero length: {value!r}')
+
+
 def _assert_none_mapping_dict(object, attr_name):
 
     value = getattr(object, attr_name)
@@ -50,16 +67,6 @@ def _assert_none_mapping_dict(object, attr_name):
         raise AssertionError(f'None not mapped to None')
 
 
-def _assert_empty_set(object, attr_name):
-
-    value = getattr(object, attr_name)
-    for expected_attr in ('add', 'remove', 'update'):
-        if not hasattr(value, expected_attr):
-            raise AssertionError(f'{attr_name!r} not set-like: no {expected_attr} method')
-    if len(value):
-        raise AssertionError(f'{attr_name!r} with non-zero length: {value!r}')
-
-
 # Utility callables to change kernel state.
 
 def _change_scalar(object, attr_name):
@@ -79,10 +86,25 @@ def _change_dict(object, attr_name):
     attr[42] = 42
 
 
-def _change_set(object, attr_name):
+def _change_timers(object, attr_name):
+
+    attr = getattr(object, attr_name)
+    attr.add(42, 42)
+
+
+def _change_window_store(object, attr_name):
+
+    # Appending to a WindowStore requires a Window: bypass that.
+    attr = getattr(object, attr_name)
+    attr._windows.append(42)
+    attr._z[42] = 0
+
+
+def _change_task_queue(object, attr_name):
 
+    # Appending to a TaskQueue requires a tracked task: bypass that.
     attr = getattr(object, attr_name)
-    attr.add(42)
+    attr._queue[42] = None
 
 
 
@@ -95,36 +117,38 @@ STATE_ATTRS = {
     'top_task': (_assert_is_none, _change_scalar),
     'top_task_success': (_assert_is_none, _change_scalar),
     'top_task_result': (_assert_is_none, _change_scalar),
-    'runnable_tasks': (_assert_empty_list, _change_list),
+    'runnable_tasks': (_assert_empty_list, _change_task_queue),
     'completed_tasks': (_assert_empty_dict, _change_dict),
-    'parent_task': (_assert_empty_dict, _change_dict),
-    'child_tasks': (_assert_empty_dict, _change_dict),
-    'tasks_waiting_child': (_assert_empty_list, _change_list),
-    'tasks_waiting_inbox': (_assert_empty_list, _change_list),
-    'tasks_waiting_key': (_assert_empty_list, _change_list),
-    'tasks_waiting_time': (_assert_empty_list, _change_list),
-    'tasks_waiting_time_hq': (_assert_empty_list, _change_list),
-    'tasks_waiting_processes': (_assert_empty_set, _change_set),
-    'user_space_tasks': (_assert_empty_dict, _change_dict),
+    'tasks_waiting_child': (_assert_empty_list, _change_task_queue),
+    'tasks_waiting_inbox': (_assert_empty_list, _change_task_queue),
+    'tasks_waiting_key': (_assert_empty_list, _change_task_queue),
+    'tasks_waiting_time': (_assert_empty_timers, _change_timers),
+    'tasks_waiting_processes': (_assert_empty_list, _change_task_queue),
+    'tasks_waiting_future': (_assert_empty_list, _change_task_queue),
+    'task_futures': (_assert_empty_dict, _change_dict),
+    'tasks_waiting_frame': (_assert_empty_list, _change_task_queue),
+    'tasks': (_assert_empty_dict, _change_dict),
     'kernel_space_tasks': (_assert_empty_dict, _change_dict),
-    'trap_call': (_assert_empty_dict, _change_dict),
-    'trap_success': (_assert_empty_dict, _change_dict),
-    'trap_result': (_assert_empty_dict, _change_dict),
-    'task_inbox': (_assert_empty_dict, _change_dict),
-    'task_windows': (_assert_empty_dict, _change_dict),
-    'all_windows': (_assert_empty_list, _change_list),
+    'all_windows': (_assert_empty_list, _change_window_store),
     'focusable_windows': (_assert_empty_list, _change_list),
+    'window_visibility': (_assert_empty_dict, _change_dict),
+    'window_visibility_key': (_assert_is_none, _change_scalar),
     'focused_window': (_assert_is_none, _change_scalar),
+    'dirty_windows': (_assert_empty_dict, _change_dict),
+    'terminal_resize_time': (_assert_is_none, _change_scalar),
+    'terminal_input_closed': (_assert_is_false, _change_scalar),
+    'terminal_render_pending': (_assert_is_false, _change_scalar),
+    'frame_interval': (_assert_is_none, _change_scalar),
+    'next_frame_time': (_assert_is_none, _change_scalar),
     'process_window': (_assert_empty_dict, _change_dict),
     'window_process': (_assert_none_mapping_dict, _change_dict),
-    'task_processes': (_assert_empty_dict, _change_dict),
     'process_task': (_assert_empty_dict, _change_dict),
     'all_processes': (_assert_empty_dict, _change_dict),
-    'completed_processes': (_assert_empty_dict, _change_dict),
     'in_fds': (_assert_empty_dict, _change_dict),
-    'out_fds': (_assert_empty_list, _change_list),
+    'out_fds': (_assert_empty_dict, _change_dict),
     'close_fd_callables': (_assert_empty_list, _change_list),
     'close_when_done_fds': (_assert_empty_list, _change_list),
+    'selector': (_assert_is_none, _change_scalar),
     'now': (_assert_is_none, _change_scalar),
     'terminal': (_assert_is_none, _change_scalar),
 }
@@ -141,6 +165,8 @@ class StateAssertionsMixin(object):
         'tasks_waiting_key',
         'tasks_waiting_time',
         'tasks_waiting_processes',
+        'tasks_waiting_future',
+        'tasks_waiting_frame',
     )
     def assert_no_tasks(self):
 
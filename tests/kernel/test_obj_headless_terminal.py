@@ -0,0 +1,203 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import random
+from unittest import TestCase
+
+from ppytty.kernel import run, api, HeadlessTerminal
+from ppytty.kernel.exceptions import TrapException
+
+
+
+class Test(TestCase):
+
+    def setUp(self):
+
+        self.t = HeadlessTerminal(40, 10)
+
+
+    def test_geometry(self):
+
+        self.assertEqual(self.t.width, 40)
+        self.assertEqual(self.t.height, 10)
+        self.assertEqual(len(self.t.display), 10)
+        self.assertEqual(len(self.t.display[0]), 40)
+
+
+    def test_resize(self):
+
+        self.t.resize(60, 20)
+        self.assertEqual(self.t.width, 60)
+        self.assertEqual(self.t.height, 20)
+        self.assertEqual(self.t.window.width, 60)
+        self.assertEqual(len(self.t.display), 20)
+
+
+    def test_run_captures_screen(self):
+
+        async def task():
+            window = await api.window_create(2, 1, 20, 5)
+            window.print('hello headless', x=1, y=2)
+            await api.window_render(window)
+            await api.frame_wait()
+            # Completed task windows are destroyed: capture the screen now.
+            return self.t.display[3]
+
+        success, result = run(task, terminal=self.t)
+        self.assertTrue(success)
+        self.assertTrue(self.t.output)
+        self.assertEqual(result[3:17], 'hello headless')
+
+
+    def test_run_feed_input(self):
+
+        async def task():
+            return await api.key_read()
+
+        self.t.feed_input(b'k')
+        success, result = run(task, terminal=self.t)
+        self.assertTrue(success)
+        self.assertEqual(result, b'k')
+
+
+    def test_run_close_input(self):
+
+        async def task():
+            key = await api.key_read()
+            try:
+                await api.key_read()
+            except TrapException as e:
+                return key, e
+
+        self.t.feed_input(b'k')
+        self.t.close_input()
+        success, result = run(task, terminal=self.t)
+        self.assertTrue(success)
+        key, exception = result
+        self.assertEqual(key, b'k')
+        self.assertIsInstance(exception, TrapException)
+
+
+    def _assert_output_reproduces_terminal_window(self, texts, seed=42):
+
+        # The minimal escape sequences written out must reproduce the exact
+        # terminal window contents, including character attributes.
+        rng = random.Random(seed)
+
+        async def task():
+            windows = []
+            for bg in (None, 4, 12, 200):
+                w = await api.window_create(rng.randrange(-5, 35), rng.randrange(-3, 8),
+                                            rng.randrange(5, 30), rng.randrange(3, 8), bg=bg)
+                windows.append(w)
+            mismatches = 0
+            for _ in range(200):
+                w = rng.choice(windows)
+                w.print(rng.choice(texts),
+                        x=rng.randrange(w.width), y=rng.randrange(w.height),
+                        fg=rng.choice((None, 1, 9, 100)), bg=rng.choice((None, 2, 12, 150)))
+                if rng.random() < 0.2:
+                    w.move(dx=rng.randrange(-3, 4), dy=rng.randrange(-2, 3))
+                await api.window_render(w, full=rng.random() < 0.3)
+                await api.frame_wait()
+                captured = self.t._screen.buffer
+                expected = self.t.window._screen.buffer
+                mismatches += any(
+                    captured[y][x] != expected[y][x]
+                    for y in range(self.t.height) for x in range(self.t.width)
+                )
+            return mismatches
+
+        success, result = run(task, terminal=self.t, frame_interval=0)
+        self.assertTrue(success)
+        self.assertEqual(result, 0)
+
+
+    def test_output_reproduces_terminal_window(self):
+
+        self._assert_output_reproduces_terminal_window(['hello', '  ', 'x' * 10, 'abc'])
+
+
+    def test_output_reproduces_terminal_window_wide_chars(self):
+
+        # Wide characters are cut at window edges, by overlapping windows and
+        # overwritten in halves; runs of changed cells must keep their stubs.
+        texts = ['hello', '  ', 'x' * 10, '\u4e2d\u6587', '\uff57\uff49\uff44\uff45', 'a\u4e2db']
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.t = HeadlessTerminal(40, 10)
+                self._assert_output_reproduces_terminal_window(texts, seed=seed)
+
+
+    def test_scrolling_window_output(self):
+
+        # Scrolled lines of full-width windows are moved with a scroll region:
+        # only the exposed line is rendered.
+        async def task():
+            w = await api.window_create(0, 5, 1.0, 5)
+            scroll_sizes = []
+            for n in range(10):
+                w.feed(f'\r\nlog line {n}'.encode())
+                await api.window_render(w)
+                await api.frame_wait()
+                scroll_sizes.append(len(self.t.output))
+                del self.t.output[:]
+            # Reverse index, at the top, scrolls down.
+            w.feed(b'\x1b[H\x1bMtop line')
+            await api.window_render(w)
+            await api.frame_wait()
+            scroll_sizes.append(len(self.t.output))
+            return scroll_sizes, self.t.display[5:]
+
+        success, result = run(task, terminal=self.t)
+        self.assertTrue(success)
+        scroll_sizes, display = result
+        self.assertEqual([line.rstrip() for line in display], [
+            'top line', 'log line 5', 'log line 6', 'log line 7', 'log line 8',
+        ])
+        self.assertIn(b'\x1b[6;10r', self.t.output)
+        self.assertLess(max(scroll_sizes[5:]), 80)
+
+
+    def test_sync_output(self):
+
+        # No terminfo `Sync` capability: frames are wrapped in the DEC private
+        # mode 2026 set/reset sequences, which do not affect the screen.
+        t = HeadlessTerminal(40, 10, sync_output=True)
+        t.feed(b'synchronized')
+        t.render()
+        self.assertTrue(t.output.startswith(b'\x1b[?2026h'))
+        self.assertTrue(t.output.endswith(b'\x1b[?2026l'))
+        self.assertEqual(t.display[0].rstrip(), 'synchronized')
+
+        # Not supported by the default terminal kind.
+        self.t.feed(b'not synchronized')
+        self.t.render()
+        self.assertNotIn(b'\x1b[?2026h', self.t.output)
+
+
+    def test_rep_ascii_only(self):
+
+        # REP repeats a single byte: non-ASCII characters are written out.
+        t = HeadlessTerminal(40, 10, capture_screen=False)
+        self.assertTrue(t._rep)
+        t.feed(('x' * 10 + '\u0436' * 10 + '\u2500' * 10).encode())
+        t.render()
+        self.assertIn(t.bt.rep(ord('x'), 10).encode(), t.output)
+        self.assertIn(('\u0436' * 10 + '\u2500' * 10).encode(), t.output)
+
+
+    def test_no_screen_capture(self):
+
+        t = HeadlessTerminal(40, 10, capture_screen=False)
+        t.render()
+        self.assertTrue(t.output)
+        with self.assertRaises(RuntimeError):
+            t.display
+
+
+# ----------------------------------------------------------------------------
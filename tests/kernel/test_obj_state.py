@@ -7,7 +7,7 @@
 
 import unittest
 
-from ppytty.kernel.state import state
+from ppytty.kernel.state import state, TaskStatus
 
 from . import helper_state
 
@@ -78,4 +78,46 @@ class TestRun(unittest.TestCase):
         _assert_attrs_are_clean('state', state, helper_state.STATE_ATTRS)
 
 
+
+
+class TestTaskQueues(unittest.TestCase):
+
+    def setUp(self):
+
+        state.reset()
+        self.tasks = [state.get_mapped_kernel_task(object()) for _ in range(3)]
+
+
+    def test_append_tracks_task_status(self):
+
+        task1, task2, _ = self.tasks
+        state.runnable_tasks.append(task1)
+        state.tasks_waiting_inbox.append(task2)
+        self.assertIs(state.tasks[task1].status, TaskStatus.RUNNABLE)
+        self.assertIs(state.tasks[task2].status, TaskStatus.WAITING_INBOX)
+
+
+    def test_queue_order_and_removal(self):
+
+        for task in self.tasks:
+            state.runnable_tasks.append(task)
+        task1, task2, task3 = self.tasks
+        state.runnable_tasks.remove(task2)
+        self.assertNotIn(task2, state.runnable_tasks)
+        self.assertEqual(state.runnable_tasks.popleft(), task1)
+        self.assertEqual(state.runnable_tasks.popleft(), task3)
+        self.assertFalse(state.runnable_tasks)
+
+
+    def test_dequeue_task_uses_status(self):
+
+        task1, task2, _ = self.tasks
+        state.tasks_waiting_key.append(task1)
+        state.tasks_waiting_key.append(task2)
+        previous_status = state.dequeue_task(task1)
+        self.assertIs(previous_status, TaskStatus.WAITING_KEY)
+        self.assertIsNone(state.tasks[task1].status)
+        self.assertEqual(list(state.tasks_waiting_key), [task2])
+
+
 # ----------------------------------------------------------------------------
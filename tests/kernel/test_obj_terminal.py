@@ -5,6 +5,9 @@
 # See LICENSE for deatils.
 # ----------------------------------------------------------------------------
 
+import os
+from unittest import mock
+
 from ppytty.kernel import terminal
 
 # For an explanation of what _SlefBlessingsTerminal is, refer to its comment.
@@ -14,6 +17,24 @@ from . import helper_io
 
 
 
+class _Stalled_os_write(object):
+
+    # Accepts up to `room` bytes, then raises BlockingIOError.
+
+    def __init__(self, room=0):
+        self.room = room
+        self.written = bytearray()
+
+    def __call__(self, _fd, data):
+        if not self.room:
+            raise BlockingIOError()
+        data = data[:self.room]
+        self.room -= len(data)
+        self.written.extend(data)
+        return len(data)
+
+
+
 class Test(helper_io.NoOutputTestCase):
 
     # Much like the direct-output trap tests, these tests are checking the
@@ -27,7 +48,8 @@ class Test(helper_io.NoOutputTestCase):
 
     def setUp(self):
 
-        self.t = terminal.Terminal()
+        # Frames not wrapped in synchronized output updates: see sync tests.
+        self.t = terminal.Terminal(sync_output=False)
         self.reset_os_written_bytes()
 
 
@@ -38,8 +60,10 @@ class Test(helper_io.NoOutputTestCase):
             self.fake_tigetstr('civis'),
             self.fake_tparm(self.fake_tigetstr('cup'), 0, 0),
         ]
-        payload = b' ' * 80 * 25
+        # Blank lines are erased, not filled with spaces.
+        payload = b''
         self.bytes_match(written_bytes, prefixes, [], payload, strict=False)
+        self.assertEqual(written_bytes.count(self.fake_tigetstr('el')), 25)
 
 
     def test_render(self):
@@ -68,6 +92,29 @@ class Test(helper_io.NoOutputTestCase):
 
         self._discard_first_render()
 
+        # Output TTY already holds every cell: only the cursor is rendered.
+        self.t.render(full=True)
+        written_bytes = self.get_os_written_bytes()
+        self.assertEqual(self.strip_fake_curses_entries(written_bytes), b'')
+
+
+    def test_direct_clear_then_rerender_full(self):
+
+        self._discard_first_render()
+
+        self.t.direct_clear()
+        self.reset_os_written_bytes()
+
+        self.t.render(full=True)
+        written_bytes = self.get_os_written_bytes()
+        self._assert_blank_terminal_rendered(written_bytes)
+
+
+    def test_resize_then_rerender_full(self):
+
+        self._discard_first_render()
+
+        self.t.resize()
         self.t.render(full=True)
         written_bytes = self.get_os_written_bytes()
         self._assert_blank_terminal_rendered(written_bytes)
@@ -91,10 +138,9 @@ class Test(helper_io.NoOutputTestCase):
             # End by positioning the cursor at (col=len(plain_text), row=0).
             self.fake_tparm(self.fake_tigetstr('cup'), 0, len(plain_text)),
         ]
-        # Payload should be a full line (plain_text is shorter than that): the
-        # test terminal is 80 column wide, so the payload should start with the
-        # plain_text and be filled with spaces.
-        payload = plain_text + b' ' * (80 - len(plain_text))
+        # Payload should be the plain_text only: the remaining cells in the
+        # line were already rendered by the first render.
+        payload = plain_text
 
         # Non-strict means: accept that after validating prefixs and suffixes,
         # the remaining bytes may contain additional fake tigetstr/tparm parts.
@@ -115,22 +161,19 @@ class Test(helper_io.NoOutputTestCase):
         self.t.render()
         written_bytes = self.get_os_written_bytes()
 
-        # render should output the full 80 column terminal row.
+        # render should output only the changed cells in the terminal row.
         prefixes = [
-            # Start by hiding the cursor and putting at (col=0, row=0).
+            # Start by hiding the cursor and putting at (col=COLUMN, row=ROW).
             self.fake_tigetstr('civis'),
-            self.fake_tparm(self.fake_tigetstr('cup'), ROW, 0),
+            self.fake_tparm(self.fake_tigetstr('cup'), ROW, COLUMN),
         ]
         suffixes = [
             # End by positioning the cursor to the right of plain_text.
             self.fake_tparm(self.fake_tigetstr('cup'), ROW, COLUMN+len(plain_text)),
         ]
-        # Payload should be a full line (plain_text is shorter than that): the
-        # test terminal is 80 column wide, so the payload should start with
-        # COLUMN x b' ', then plain_text, then filled to the end with b' '.
-        spaces_before = b' ' * COLUMN
-        spaces_after = b' ' * (80 - len(plain_text) - COLUMN)
-        payload = spaces_before + plain_text + spaces_after
+        # Payload should be the plain_text only: the remaining cells in the
+        # row were already rendered by the first render.
+        payload = plain_text
 
         # Non-strict means: accept that after validating prefixs and suffixes,
         # the remaining bytes may contain additional fake tigetstr/tparm parts.
@@ -146,12 +189,129 @@ class Test(helper_io.NoOutputTestCase):
         written_bytes = self.get_os_written_bytes()
         self.assertEqual(written_bytes, b'', 'no bytes written on re-render')
 
-        # clear will force next render to output a fully blank terminal.
+        # clear will force next render to output the blanks over fed text.
+        plain_text = b'this is the terminal'
+        self.t.feed(plain_text)
+        self.t.render()
+        self.reset_os_written_bytes()
         self.t.clear()
         self.t.render()
         written_bytes = self.get_os_written_bytes()
 
-        self._assert_blank_terminal_rendered(written_bytes)
+        # Blanks are rendered as a repeated character.
+        rep = self.fake_tparm(self.fake_tigetstr('rep'), ord(' '), len(plain_text))
+        self.assertIn(rep, written_bytes)
+        self.bytes_match(written_bytes, [], [], b'', strict=False)
+
+
+
+    def test_active_output_fd_non_blocking(self):
+
+        # While active, output is written to a non-blocking FD opened on the
+        # same TTY: the output FD's file description is shared with others.
+        written_fds = []
+
+        def os_write(fd, data):
+            written_fds.append(fd)
+            return len(data)
+
+        os_open = self.output_mocks['ppytty.kernel.hw.os_open']
+        with mock.patch('ppytty.kernel.hw.os_write', new=os_write):
+            with self.t:
+                self.t.feed(b'this is the terminal')
+                self.t.render()
+                write_fd = self.t._write_fd
+
+        path, flags = os_open.call_args[0]
+        self.assertEqual(path, self.t._ttyname)
+        self.assertTrue(flags & os.O_NONBLOCK)
+        self.assertNotEqual(write_fd, self.t.out_fd)
+        self.assertEqual(written_fds, [self.t.out_fd, write_fd, write_fd])
+        self.assertEqual(self.t._write_fd, self.t.out_fd)
+
+
+    def _stalled_terminal(self, room=0):
+
+        os_write = _Stalled_os_write(room)
+        patch = mock.patch('ppytty.kernel.hw.os_write', new=os_write)
+        patch.start()
+        self.addCleanup(patch.stop)
+        return terminal.Terminal(), os_write
+
+
+    def test_stalled_output_is_queued(self):
+
+        t, os_write = self._stalled_terminal(room=10)
+        t.feed(b'this is the terminal')
+        t.render()
+        self.assertEqual(len(os_write.written), 10)
+        self.assertTrue(t.output_pending)
+
+        # Written once the output TTY is writable, again.
+        os_write.room = 100000
+        t.flush_output()
+        self.assertFalse(t.output_pending)
+        self.assertIn(b'this is the terminal', os_write.written)
+
+
+    def test_stalled_output_frames_superseded(self):
+
+        t, os_write = self._stalled_terminal()
+        t.feed(b'first')
+        t.render()
+        t.feed(b' second')
+        t.render()
+        t.feed(b' third')
+        t.render()
+
+        # Unwritten frames are replaced by a single, full, frame.
+        self.assertEqual(len(t._output_queue), 1)
+        os_write.room = 100000
+        t.flush_output()
+        self.assertFalse(t.output_pending)
+        self.assertIn(b'first second third', os_write.written)
+        self.assertEqual(os_write.written.count(self.fake_tigetstr('civis')), 1)
+
+
+    def test_stalled_output_partial_frame_completed(self):
+
+        t, os_write = self._stalled_terminal(room=5)
+        t.feed(b'first')
+        t.render()
+        t.feed(b' second')
+        t.render()
+
+        # The partially written frame is completed: nothing was dropped and
+        # the next frame is incremental.
+        self.assertEqual(len(t._output_queue), 2)
+        os_write.room = 100000
+        t.flush_output()
+        self.assertFalse(t.output_pending)
+        self.assertIn(b'first', os_write.written)
+        self.assertIn(b'second', os_write.written)
+        self.assertNotIn(b'first second', os_write.written)
+
+
+
+    def test_sync_output_frames(self):
+
+        t = terminal.Terminal(sync_output=True)
+        self.reset_os_written_bytes()
+        t.feed(b'this is the terminal')
+        t.render()
+        written_bytes = self.get_os_written_bytes()
+
+        # One write, with the frame wrapped in the terminfo `Sync` capability.
+        sync = self.fake_tigetstr('Sync')
+        prefixes = [self.fake_tparm(sync, 1), self.fake_tigetstr('civis')]
+        suffixes = [self.fake_tparm(sync, 2)]
+        self.bytes_match(written_bytes, prefixes, suffixes, b'this is the terminal', strict=False)
+        self.assertEqual(len(self._os_write_mock._writes), 1)
+
+        # Nothing to render, nothing written.
+        self.reset_os_written_bytes()
+        t.render()
+        self.assertEqual(self.get_os_written_bytes(), b'')
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from ppytty.kernel import timers
+
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+
+        self.timers = timers.Timers()
+
+
+    def test_expire_in_deadline_order(self):
+
+        self.timers.add('c', 3)
+        self.timers.add('a', 1)
+        self.timers.add('b', 2)
+        self.assertEqual(self.timers.next_deadline, 1)
+        self.assertEqual(self.timers.pop_expired(2), ['a', 'b'])
+        self.assertEqual(self.timers.pop_expired(5), ['c'])
+        self.assertFalse(self.timers)
+        self.assertIsNone(self.timers.next_deadline)
+
+
+    def test_same_deadline_expires_in_insertion_order(self):
+
+        for waiter in 'abc':
+            self.timers.add(waiter, 1)
+        self.assertEqual(self.timers.pop_expired(1), ['a', 'b', 'c'])
+
+
+    def test_cancelled_waiters_do_not_expire(self):
+
+        self.timers.add('a', 1)
+        self.timers.add('b', 2)
+        self.timers.cancel('a')
+        self.assertNotIn('a', self.timers)
+        self.assertEqual(self.timers.next_deadline, 2)
+        self.assertEqual(self.timers.pop_expired(5), ['b'])
+
+
+    def test_readding_replaces_deadline(self):
+
+        self.timers.add('a', 1)
+        self.timers.add('a', 3)
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.timers.pop_expired(2), [])
+        self.assertEqual(self.timers.pop_expired(3), ['a'])
+
+
+    def test_cancel_churn_memory_is_bounded(self):
+
+        self.timers.add('keep', 1_000_000)
+        for n in range(10_000):
+            self.timers.add(n, n)
+            self.timers.cancel(n)
+        self.assertEqual(len(self.timers), 1)
+        self.assertLess(len(self.timers._heap), 200)
+
+
+# ----------------------------------------------------------------------------
@@ -5,8 +5,11 @@
 # See LICENSE for deatils.
 # ----------------------------------------------------------------------------
 
-import unittest
+import gc
+import random
 import types
+import unittest
+import weakref
 
 from ppytty.kernel import window
 
@@ -119,14 +122,13 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
         )
         for line_number in range(1, 15):
             expected.append(
-                # Each other line: move to line, 0 + spaces.
-                self.sbt.move(line_number, 0) + blank_line
+                # Each other line: move to next line start + spaces.
+                self.sbt.cr + self.sbt.move_down + blank_line
             )
         expected_bytes = ''.join(expected).encode('latin1')
 
         expected_suffixes = [
-            # Trailing: normal text attributes + move to 0, 0.
-            self.sbt.normal.encode('latin1'),
+            # Trailing: text attributes already normal + move to 0, 0.
             self.sbt.move(0, 0).encode('latin1'),
         ]
 
@@ -188,8 +190,7 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
         expected_bytes = plain_text_bytes + remaining_spaces
 
         expected_suffixes = [
-            # Normal text attributes expected and curser right after plain_text.
-            self.sbt.normal.encode('latin1'),
+            # Text attributes already normal and cursor right after plain_text.
             self.sbt.move(0, len(plain_text)).encode('latin1'),
         ]
         self.bytes_match(rendered_bytes, expected_prefixes, expected_suffixes, expected_bytes)
@@ -219,8 +220,7 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
         expected_bytes = spaces_before + plain_text_bytes + spaces_after
 
         expected_suffixes = [
-            # Normal text attributes expected and curser right after plain_text.
-            self.sbt.normal.encode('latin1'),
+            # Text attributes already normal and cursor right after plain_text.
             self.sbt.move(ROW, COLUMN+len(plain_text)).encode('latin1'),
         ]
         self.bytes_match(rendered_bytes, expected_prefixes, expected_suffixes, expected_bytes)
@@ -246,8 +246,7 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
         expected = [
             # Spaces before
             ' ' * column,
-            # Set formatting (always starts with normal)
-            self.sbt.normal,
+            # Set formatting (normal already in effect)
             self.sbt.color(fg),
             self.sbt.on_color(bg),
             plain_text,
@@ -259,8 +258,7 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
         expected_bytes = ''.join(expected).encode('latin1')
 
         expected_suffixes = [
-            # Normal text attributes expected and curser right after plain_text.
-            self.sbt.normal.encode('latin1'),
+            # Text attributes already normal and cursor right after plain_text.
             self.sbt.move(row, column+len(plain_text)).encode('latin1'),
         ]
         self.bytes_match(rendered_bytes, expected_prefixes, expected_suffixes, expected_bytes)
@@ -280,4 +278,216 @@ class TestWithHiddenCursor(helper_io.NoOutputTestCase):
                 self._assert_render_positioned_colored_print(column, row, fg, bg)
 
 
+    def test_rendered_window_not_kept_alive(self):
+
+        self.w.print('text in window', fg=7, bg=4)
+        _ = self.w.render()
+        window_ref = weakref.ref(self.w)
+        del self.w
+        gc.collect()
+        self.assertIsNone(window_ref())
+
+
+    def test_sgr_transition_cache_bounded(self):
+
+        cache_info = window._sgr_transition.cache_info()
+        self.assertEqual(cache_info.maxsize, window._CHAR_FORMAT_CACHE_SIZE)
+        self.assertLessEqual(cache_info.currsize, cache_info.maxsize)
+
+
+    def test_char_state_cache_bounded(self):
+
+        # Truecolor SGR sequences produce any of the 24-bit hex string colors.
+        for n in range(window._CHAR_FORMAT_CACHE_SIZE + 100):
+            self.w.feed(b'\x1b[H\x1b[38;2;%d;%d;%dmx' % (n >> 16, (n >> 8) & 0xff, n & 0xff))
+            _ = self.w.render()
+        cache_info = window._char_state.cache_info()
+        self.assertEqual(cache_info.maxsize, window._CHAR_FORMAT_CACHE_SIZE)
+        self.assertLessEqual(cache_info.currsize, cache_info.maxsize)
+
+
+    def test_compose_colors_cache_bounded(self):
+
+        for n in range(window._CHAR_FORMAT_CACHE_SIZE + 100):
+            window._compose_colors(f'{n:06x}', 'default', None)
+        cache_info = window._compose_colors.cache_info()
+        self.assertEqual(cache_info.maxsize, window._CHAR_FORMAT_CACHE_SIZE)
+        self.assertLessEqual(cache_info.currsize, cache_info.maxsize)
+
+
+    def test_cached_lines_rerender_full(self):
+
+        self.w.print('text in window', x=4, y=2, fg=7, bg=4)
+        rendered_bytes = self.w.render(full=True)
+
+        # All lines are unchanged: rendered from the line cache.
+        self.assertEqual(self.w.render(full=True), rendered_bytes)
+
+        # Changed lines are not rendered from the line cache.
+        self.w.print('changed', x=4, y=2)
+        changed_bytes = self.w.render(full=True)
+        self.assertIn(b'changed', changed_bytes)
+        self.w._line_cache.clear()
+        self.assertEqual(self.w.render(full=True), changed_bytes)
+
+        # Neither are lines clipped differently by the parent geometry.
+        self.w.move(dx=-7)
+        moved_bytes = self.w.render(full=True)
+        self.assertNotIn(b'changed', moved_bytes)
+        self.assertIn(b'nged', moved_bytes)
+        self.w._line_cache.clear()
+        self.assertEqual(self.w.render(full=True), moved_bytes)
+
+
+
+class TestCompose(unittest.TestCase):
+
+    # Composing a child window onto its parent must produce the same parent
+    # screen contents as feeding it the child's rendered output.
+
+    WIDTH = 30
+    HEIGHT = 10
+
+    def _parent_window(self):
+
+        terminal = types.SimpleNamespace()
+        terminal.bt = window._SelfBlessingsTerminal
+        terminal.width = self.WIDTH
+        terminal.height = self.HEIGHT
+        return window.Window(terminal, 0, 0, self.WIDTH, self.HEIGHT)
+
+
+    def _child_data(self, seed):
+
+        rng = random.Random(seed)
+        sgrs = ['0', '1', '3', '4', '7', '39', '49', '1;7']
+        sgrs.extend(f'{30+n}' for n in range(8))
+        sgrs.extend(f'{40+n}' for n in range(8))
+        sgrs.extend(f'{90+n}' for n in range(8))
+        sgrs.extend(f'38;5;{n}' for n in range(0, 256, 7))
+        sgrs.extend(f'48;5;{n}' for n in range(0, 256, 11))
+        chunks = []
+        for _ in range(200):
+            chunks.append(f'\x1b[{rng.choice(sgrs)}m')
+            chunks.append(rng.choice(['ab', 'xyz ', '\u65e5\u672c', ' ', '\r\n']))
+        return ''.join(chunks).encode('utf8')
+
+
+    def _assert_same_screens(self, screen1, screen2):
+
+        for y in range(self.HEIGHT):
+            line1 = [screen1.buffer[y][x] for x in range(self.WIDTH)]
+            line2 = [screen2.buffer[y][x] for x in range(self.WIDTH)]
+            self.assertEqual(line1, line2, f'line {y} differs')
+        self.assertEqual(screen1.cursor.x, screen2.cursor.x)
+        self.assertEqual(screen1.cursor.y, screen2.cursor.y)
+        self.assertEqual(screen1.cursor.hidden, screen2.cursor.hidden)
+
+
+    def test_compose_same_as_render(self):
+
+        per_cell_bg = [[(x+y) % 16 for x in range(20)] for y in range(8)]
+        geometries = [
+            (0, 0, 20, 8),
+            (5, 3, 20, 8),
+            (-4, -2, 20, 8),
+            (15, 6, 20, 8),
+        ]
+        for geometry in geometries:
+            for bg in (None, 4, 200, per_cell_bg):
+                for no_cursor in (True, False):
+                    with self.subTest(geometry=geometry, bg=bg, no_cursor=no_cursor):
+                        parent1 = self._parent_window()
+                        parent2 = self._parent_window()
+                        child1 = window.Window(parent1, *geometry, bg=bg, no_cursor=no_cursor)
+                        child2 = window.Window(parent2, *geometry, bg=bg, no_cursor=no_cursor)
+                        for child in (child1, child2):
+                            child.feed(self._child_data(seed=42))
+
+                        parent1.feed(child1.render(full=True))
+                        child2.compose(full=True)
+                        self._assert_same_screens(parent1._screen, parent2._screen)
+
+                        # Partial, dirty lines only, render/compose.
+                        for child in (child1, child2):
+                            child.feed(self._child_data(seed=24)[:300])
+                        parent1.feed(child1.render())
+                        child2.compose()
+                        self._assert_same_screens(parent1._screen, parent2._screen)
+
+
+    def test_highlight_overlay(self):
+
+        # The highlight overlay is composed/rendered over the window contents,
+        # which it leaves untouched; output fed meanwhile is not lost.
+        child = window.Window(self._parent_window(), 0, 0, self.WIDTH, self.HEIGHT)
+        child.title = 'the-title'
+        last_line = self.HEIGHT - 1
+        child.print('x' * self.WIDTH, x=0, y=last_line)
+        child.compose(full=True)
+        buffer_line = dict(child._screen.buffer[last_line])
+
+        child.highlight()
+        self.assertEqual(child._screen.buffer[last_line], buffer_line)
+        self.assertEqual(child._screen.dirty, {last_line})
+        child.compose()
+        composed = child.parent._screen.display[last_line]
+        self.assertEqual(composed, 'the-title' + 'x' * (self.WIDTH - 9))
+
+        rendered = self._parent_window()
+        rendered.feed(child.render(full=True))
+        self.assertEqual(rendered._screen.display[last_line], composed)
+
+        child.print('y', x=self.WIDTH-1, y=last_line)
+        child.highlight(clear=True)
+        child.compose()
+        expected = 'x' * (self.WIDTH - 1) + 'y'
+        self.assertEqual(child.parent._screen.display[last_line], expected)
+
+
+    def test_render_out_appends(self):
+
+        # Rendering to a given bytearray appends to it, returning it.
+        child = window.Window(self._parent_window(), 0, 0, self.WIDTH, self.HEIGHT)
+        child.print('hello out', x=2, y=3)
+        expected = child.render(full=True)
+        out = bytearray(b'prefix')
+        result = child.render(full=True, out=out)
+        self.assertIs(result, out)
+        self.assertEqual(out, b'prefix' + expected)
+
+
+    def test_render_front_same_as_render(self):
+
+        # Rendering only the cells that differ from the `front` cells must
+        # produce the same parent screen contents as fully rendering. Lines are
+        # always fully re-printed: pyte leaves wide character halves behind
+        # when partially overwritten, which full renders do not handle.
+        rng = random.Random(42)
+        # Up to 4 columns wide: 7 tokens per line never wrap.
+        tokens = ['a', 'xyz', '\u65e5\u672c', 'w\u65e5', ' ']
+
+        def random_token():
+            return rng.choice(tokens), rng.randrange(16)
+
+        for bg in (None, 4):
+            with self.subTest(bg=bg):
+                parent1 = self._parent_window()
+                parent2 = self._parent_window()
+                child = window.Window(parent1, 0, 0, self.WIDTH, self.HEIGHT, bg=bg)
+                lines = [[random_token() for _ in range(7)] for _ in range(self.HEIGHT)]
+                front = [None] * self.HEIGHT
+                for step in range(100):
+                    y = rng.randrange(self.HEIGHT)
+                    lines[y][rng.randrange(7)] = random_token()
+                    child.print(' ' * self.WIDTH, x=0, y=y)
+                    child.print('', x=0, y=y)
+                    for text, fg in lines[y]:
+                        child.print(text, fg=fg)
+                    parent1.feed(child.render(full=bool(step % 2), front=front))
+                    parent2.clear()
+                    parent2.feed(child.render(full=True))
+                    self._assert_same_screens(parent1._screen, parent2._screen)
+
+
 # ----------------------------------------------------------------------------
@@ -0,0 +1,173 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import random
+import types
+import unittest
+
+from ppytty.kernel import window
+from ppytty.kernel import window_store
+
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+
+        self.parent = types.SimpleNamespace(width=200, height=100)
+        self.store = window_store.WindowStore()
+
+
+    def _window(self, x, y, w, h):
+
+        return window.Window(self.parent, x, y, w, h)
+
+
+    def test_z_order(self):
+
+        windows = [self._window(n, n, 10, 10) for n in range(5)]
+        for w in windows:
+            self.store.append(w)
+        self.assertEqual(list(self.store), windows)
+        self.assertEqual(list(reversed(self.store)), windows[::-1])
+
+        self.store.remove(windows[2])
+        self.assertNotIn(windows[2], self.store)
+        self.assertEqual(list(self.store), windows[:2] + windows[3:])
+        self.assertEqual(len(self.store), 4)
+        self.assertTrue(self.store.is_above(windows[4], windows[0]))
+
+
+    def test_restack(self):
+
+        windows = [self._window(n, n, 10, 10) for n in range(4)]
+        for w in windows:
+            self.store.append(w)
+
+        self.store.move_to_top(windows[1])
+        self.assertEqual(list(self.store), [windows[0], windows[2], windows[3], windows[1]])
+        self.store.move_to_bottom(windows[3])
+        self.assertEqual(list(self.store), [windows[3], windows[0], windows[2], windows[1]])
+        self.assertTrue(self.store.is_above(windows[0], windows[3]))
+        self.assertEqual(self.store.overlapping(5, 5, 5, 5), list(self.store))
+
+        # Already there: no changes.
+        version = self.store.version
+        self.store.move_to_top(windows[1])
+        self.store.move_to_bottom(windows[3])
+        self.assertEqual(self.store.version, version)
+
+        self.store.remove(windows[3])
+        self.assertEqual(list(self.store), [windows[0], windows[2], windows[1]])
+
+
+    def test_restack_same_as_list(self):
+
+        # Removed windows leave tombstones behind: these never accumulate.
+        rng = random.Random(42)
+        windows = []
+        for step in range(2000):
+            action = rng.randrange(4) if windows else 0
+            if action == 0:
+                w = self._window(0, 0, 10, 10)
+                self.store.append(w)
+                windows.append(w)
+            elif action == 1:
+                w = windows.pop(rng.randrange(len(windows)))
+                self.store.remove(w)
+            elif action == 2:
+                w = windows.pop(rng.randrange(len(windows)))
+                self.store.move_to_top(w)
+                windows.append(w)
+            else:
+                w = windows.pop(rng.randrange(len(windows)))
+                self.store.move_to_bottom(w)
+                windows.insert(0, w)
+            self.assertEqual(list(self.store), windows)
+            self.assertEqual(list(reversed(self.store)), windows[::-1])
+            self.assertEqual(len(self.store), len(windows))
+            self.assertLessEqual(len(self.store._windows), 3 * len(windows) + 1)
+
+
+    def test_hide_show(self):
+
+        below = self._window(0, 0, 10, 10)
+        above = self._window(0, 0, 10, 10)
+        self.store.append(below)
+        self.store.append(above)
+
+        self.store.hide(above)
+        self.assertTrue(self.store.is_hidden(above))
+        self.assertEqual(list(self.store), [below, above])
+        self.assertEqual(self.store.overlapping(0, 0, 0, 0), [below])
+
+        # Hidden windows geometry changes are tracked, once shown again.
+        above.move(x=50)
+        self.store.show(above)
+        self.assertFalse(self.store.is_hidden(above))
+        self.assertEqual(self.store.overlapping(55, 55, 5, 5), [above])
+
+        self.store.hide(below)
+        self.store.remove(below)
+        self.assertEqual(list(self.store), [above])
+
+
+    def test_overlapping(self):
+
+        left = self._window(0, 0, 10, 10)
+        right = self._window(50, 0, 10, 10)
+        big = self._window(0, 0, 100, 50)
+        for w in (big, right, left):
+            self.store.append(w)
+
+        self.assertEqual(self.store.overlapping(5, 5, 5, 5), [big, left])
+        self.assertEqual(self.store.overlapping(55, 70, 0, 0), [big, right])
+        self.assertEqual(self.store.overlapping(150, 160, 0, 10), [])
+        self.assertEqual(self.store.overlapping(-20, -10, -20, -10), [])
+
+
+    def test_overlapping_tracks_geometry_changes(self):
+
+        w = self._window(0, 0, 10, 10)
+        self.store.append(w)
+        version = self.store.version
+
+        w.move(x=100, y=60)
+        self.assertGreater(self.store.version, version)
+        self.assertEqual(self.store.overlapping(0, 9, 0, 9), [])
+        self.assertEqual(self.store.overlapping(105, 105, 65, 65), [w])
+
+        w.resize(w=50)
+        self.assertEqual(self.store.overlapping(140, 140, 65, 65), [w])
+
+        # Removed windows are no longer tracked.
+        self.store.remove(w)
+        version = self.store.version
+        w.move(x=0, y=0)
+        self.assertEqual(self.store.version, version)
+        self.assertEqual(self.store.overlapping(0, 9, 0, 9), [])
+
+
+    def test_overlapping_same_as_linear_scan(self):
+
+        rng = random.Random(42)
+        windows = []
+        for _ in range(100):
+            w = self._window(rng.randrange(-20, 200), rng.randrange(-10, 100),
+                             rng.randrange(1, 40), rng.randrange(1, 20))
+            self.store.append(w)
+            windows.append(w)
+        for _ in range(100):
+            rng.choice(windows).move(dx=rng.randrange(-30, 30), dy=rng.randrange(-10, 10))
+            min_x = rng.randrange(-20, 200)
+            min_y = rng.randrange(-10, 100)
+            geometry = (min_x, min_x + rng.randrange(40), min_y, min_y + rng.randrange(20))
+            expected = [w for w in windows if w.overlaps_geometry(*geometry)]
+            self.assertEqual(self.store.overlapping(*geometry), expected)
+
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+from ppytty.kernel import run, api, traps
+from ppytty.kernel.state import state
+
+from . import helper_io
+
+
+
+class Test(helper_io.NoOutputAutoTimeTestCase):
+
+    # Process output is simulated by calling the same function that process
+    # PTY output callbacks use.
+
+    def test_frame_coalescing(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 10)
+            dirty = []
+
+            # First small echo: rendered right away.
+            traps._render_process_output(w, b'echo')
+            dirty.append(w in state.dirty_windows)
+
+            # Within the same frame interval: deferred.
+            traps._render_process_output(w, b'echo')
+            dirty.append(w in state.dirty_windows)
+            traps._render_process_output(w, b'x' * 4096)
+            dirty.append(w in state.dirty_windows)
+
+            # No time passes: still deferred.
+            await api.sleep(0)
+            dirty.append(w in state.dirty_windows)
+
+            # The kernel loop renders it once the frame interval elapses.
+            await api.sleep(1)
+            dirty.append(w in state.dirty_windows)
+            return dirty
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertEqual(result, [False, True, True, True, False])
+
+
+    def test_written_once_at_tick_end(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 10)
+            await api.sleep(1)
+            self.reset_os_written_bytes()
+            traps._render_process_output(w, b'echo')
+            written_right_away = self.get_os_written_bytes()
+            await api.frame_wait()
+            return written_right_away, self.get_os_written_bytes()
+
+        success, result = run(task)
+        self.assertTrue(success)
+        written_right_away, written_bytes = result
+        self.assertEqual(written_right_away, b'')
+        self.assertIn(b'echo', written_bytes)
+        self.assertEqual(written_bytes.count(self.fake_tigetstr('civis')), 1)
+
+
+    def test_large_output_deferred(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 10)
+            traps._render_process_output(w, b'x' * 4096)
+            return w in state.dirty_windows
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertTrue(result)
+
+
+    def test_destroyed_window_not_rendered(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 10)
+            traps._render_process_output(w, b'x' * 4096)
+            await api.window_destroy(w)
+            return len(state.dirty_windows)
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertEqual(result, 0)
+
+
+    def test_no_frame_interval(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 10)
+            traps._render_process_output(w, b'echo')
+            traps._render_process_output(w, b'echo')
+            return w in state.dirty_windows
+
+        success, result = run(task, frame_interval=0)
+        self.assertTrue(success)
+        self.assertFalse(result)
+
+
+# ----------------------------------------------------------------------------
@@ -97,4 +97,61 @@ class Test(helper_io.NoOutputAutoTimeTestCase):
         self.assertEqual(result, 42)
 
 
+    def test_step_by_step_sliced_task_runs(self):
+
+        ran = []
+
+        async def child(n):
+            ran.append(n)
+
+        async def parent():
+            for n in range(3):
+                await api.task_spawn(child(n))
+            for _ in range(3):
+                await api.task_wait()
+            return 42
+
+        state.prepare_to_run(parent, terminal.Terminal())
+
+        # --------------------------------------------------------------------
+        # Iteration #1
+        # - A single task step per slice: only the parent runs, spawning.
+
+        success, result = loop.loop(once=True, slice_tasks=1)
+        self._assert_not_completed(success, result)
+        self.assertEqual(ran, [], 'children should not have run')
+
+        # --------------------------------------------------------------------
+        # Iteration #2
+        # - A large enough slice: all tasks run to completion, no I/O polling.
+
+        success, result = loop.loop(once=True, slice_tasks=100)
+        self.assertEqual(ran, [0, 1, 2], 'children should have run')
+        self.assertTrue(success)
+        self.assertEqual(result, 42)
+
+
+    def test_step_by_step_slice_deadline_after_io_wait(self):
+
+        ran = []
+
+        async def child(n):
+            ran.append(n)
+
+        async def parent():
+            for n in range(3):
+                await api.task_spawn(child(n))
+
+        state.prepare_to_run(parent, terminal.Terminal())
+        loop.loop(once=True, slice_tasks=1)
+        loop.run_runnable_tasks(1, None)
+
+        # Time passes after state.now is sampled, like while waiting for I/O:
+        # the slice deadline is not already due.
+        state.now = self.auto_time.monotonic
+        self.auto_time.monotonic += 10
+        loop.run_runnable_tasks(100, 0.5)
+        self.assertEqual(ran, [0, 1, 2], 'children should have run')
+
+
 # ----------------------------------------------------------------------------
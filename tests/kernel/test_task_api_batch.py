@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import types
+
+from ppytty.kernel import run, api, window
+from ppytty.kernel.exceptions import TrapException, TrapDoesNotExist, TrapArgCountWrong
+from ppytty.kernel.traps import Trap
+
+from . import helper_io
+
+
+
+class Test(helper_io.NoOutputAutoTimeTestCase):
+
+    def test_empty_batch(self):
+
+        async def task():
+            return await api.batch()
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertEqual(result, [])
+
+
+    def test_batch_window_create_render_destroy(self):
+
+        async def task():
+            w1, w2 = await api.batch(
+                api.window_create(0, 0, 40, 20),
+                api.window_create(40, 0, 40, 20),
+            )
+            render_results = await api.batch(
+                api.window_render(w1, terminal_render=False),
+                api.window_render(w2),
+            )
+            destroy_results = await api.batch(
+                api.window_destroy(w1),
+                api.window_destroy(w2),
+            )
+            return w1, w2, render_results, destroy_results
+
+        success, result = run(task)
+        self.assertTrue(success)
+        w1, w2, render_results, destroy_results = result
+        self.assertIsInstance(w1, window.Window)
+        self.assertIsInstance(w2, window.Window)
+        self.assertEqual(render_results, [None, None])
+        self.assertEqual(destroy_results, [None, None])
+
+
+    def test_batch_failures_are_returned_not_raised(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 40, 20)
+            return await api.batch(
+                api.window_render(42),
+                api.window_render(w),
+            )
+
+        success, result = run(task)
+        self.assertTrue(success)
+        failure, render_result = result
+        self.assertIsInstance(failure, TrapException)
+        self.assertIsNone(render_result)
+
+
+    def test_blocking_traps_cannot_be_batched(self):
+
+        async def task():
+            return await api.batch(
+                api.sleep(1),
+                api.message_wait(),
+            )
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertEqual(len(result), 2)
+        for item in result:
+            self.assertIsInstance(item, TrapException)
+
+
+    def test_malformed_batched_traps(self):
+
+        @types.coroutine
+        def raw_batch(traps):
+            return (yield Trap.BATCH, traps)
+
+        async def task():
+            results = await raw_batch([
+                42,
+                (),
+                ('not-a-trap-id',),
+                (Trap.WINDOW_CREATE,),
+                (Trap.STATE_DUMP, 'batched'),
+            ])
+            try:
+                await raw_batch(42)
+            except TrapException as e:
+                return results, e
+            return results, None
+
+        success, result = run(task)
+        self.assertTrue(success)
+        results, not_iterable = result
+        self.assertEqual(len(results), 5)
+        for item in results[:3]:
+            self.assertIsInstance(item, TrapException)
+        self.assertIsInstance(results[2], TrapDoesNotExist)
+        self.assertIsInstance(results[3], TrapArgCountWrong)
+        self.assertIsNone(results[4])
+        self.assertIsInstance(not_iterable, TrapException)
+
+
+    def test_batch_message_sends(self):
+
+        async def child():
+            messages = []
+            for _ in range(3):
+                _, message = await api.message_wait()
+                messages.append(message)
+            return messages
+
+        async def parent():
+            await api.task_spawn(child)
+            await api.batch(*(
+                api.message_send(child, n) for n in range(3)
+            ))
+            _, _, child_result = await api.task_wait()
+            return child_result
+
+        success, result = run(parent)
+        self.assertTrue(success)
+        self.assertEqual(result, [0, 1, 2])
+
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,130 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import asyncio
+
+from ppytty.kernel import run, run_async, api
+from ppytty.kernel.exceptions import TrapException
+
+from . import helper_io
+from . import helper_state
+
+
+
+class TestAsyncioLoop(helper_io.NoOutputTestCase, helper_state.StateAssertionsMixin):
+
+    def test_run_task(self):
+
+        async def task():
+            await api.sleep(0.01)
+            return 42
+
+        success, result = asyncio.run(run_async(task))
+        self.assertTrue(success)
+        self.assertEqual(result, 42)
+        self.assert_no_tasks()
+
+
+    def test_future_wait_result(self):
+
+        async def task():
+            return await api.future_wait(asyncio.sleep(0.01, result=42))
+
+        success, result = asyncio.run(run_async(task))
+        self.assertTrue(success)
+        self.assertEqual(result, 42)
+
+
+    def test_future_wait_exception(self):
+
+        async def failing():
+            raise ZeroDivisionError()
+
+        async def task():
+            await api.future_wait(failing())
+
+        success, result = asyncio.run(run_async(task))
+        self.assertFalse(success)
+        self.assertIsInstance(result, ZeroDivisionError)
+
+
+    def test_future_wait_not_awaitable(self):
+
+        async def task():
+            await api.future_wait(42)
+
+        success, result = asyncio.run(run_async(task))
+        self.assertFalse(success)
+        self.assertIsInstance(result, TrapException)
+
+
+    def test_asyncio_code_runs_concurrently(self):
+
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.001)
+
+        async def task():
+            await api.sleep(0.05)
+            return len(ticks)
+
+        async def main():
+            ticker_task = asyncio.ensure_future(ticker())
+            try:
+                return await run_async(task)
+            finally:
+                ticker_task.cancel()
+
+        success, result = asyncio.run(main())
+        self.assertTrue(success)
+        self.assertGreater(result, 1)
+
+
+    def test_destroy_task_waiting_future(self):
+
+        event = asyncio.Event()
+        futures = []
+
+        async def waiter():
+            future = asyncio.ensure_future(event.wait())
+            futures.append(future)
+            await api.future_wait(future)
+
+        async def task():
+            await api.task_spawn(waiter)
+            await api.sleep(0.01)
+            await api.task_destroy(waiter)
+            await api.task_wait()
+            return futures[0]
+
+        success, result = asyncio.run(run_async(task))
+        self.assertTrue(success)
+        self.assertTrue(result.cancelled())
+        self.assert_no_tasks()
+
+
+
+class TestSyncLoop(helper_io.NoOutputAutoTimeTestCase):
+
+    def test_future_wait_needs_asyncio_loop(self):
+
+        async def task():
+            coro = asyncio.sleep(0)
+            try:
+                await api.future_wait(coro)
+            finally:
+                coro.close()
+
+        success, result = run(task)
+        self.assertFalse(success)
+        self.assertIsInstance(result, TrapException)
+
+
+# ----------------------------------------------------------------------------
@@ -9,8 +9,9 @@ import os
 import textwrap
 import signal
 import sys
+import time
 
-from ppytty.kernel import run, api
+from ppytty.kernel import run, api, HeadlessTerminal
 
 from . import helper_io
 from . import helper_log
@@ -208,4 +209,37 @@ class TestOddCases(helper_io.NoOutputTestCase):
 
         self._assert_process_running_and_message_logged(process, child_task)
 
+
+
+    def test_output_shown_while_other_windows_animate(self):
+
+        # Windows rendered more often than the frame interval must not keep
+        # process output windows from being composed.
+        terminal = HeadlessTerminal(40, 10, capture_screen=False)
+
+        async def animator():
+            window = await api.window_create(0, 9, 10, 1)
+            frame = 0
+            while True:
+                window.print(f'{frame:>10}', x=0, y=0)
+                await api.window_render(window)
+                await api.sleep(0)
+                frame += 1
+
+        async def task():
+            await api.task_spawn(animator)
+            window = await api.window_create(0, 0, 40, 5)
+            await api.process_spawn(window, ['sh', '-c', 'echo HELLO'])
+            await api.process_wait()
+            give_up_time = time.monotonic() + 1
+            while b'HELLO' not in terminal.output and time.monotonic() < give_up_time:
+                await api.sleep(0.01)
+            await api.task_destroy(animator)
+            await api.task_wait()
+            return b'HELLO' in terminal.output
+
+        success, result = run(task, terminal=terminal)
+        self.assertTrue(success, f'non-success result: {result!r}')
+        self.assertTrue(result)
+
 # ----------------------------------------------------------------------------
@@ -65,4 +65,20 @@ class TestSleep(helper_io.NoOutputAutoTimeTestCase):
                     )
 
 
+    async def _sleeper_until(self, deadline):
+
+        await api.sleep_until(deadline)
+
+
+    def test_sleep_until(self):
+
+        for deadline in (-1, 0, 0.5, 10):
+            with self.subTest(deadline=deadline):
+                self.auto_time.monotonic = 0
+                success, result = run(self._sleeper_until(deadline))
+                self.assertTrue(success)
+                self.assertIsNone(result)
+                self.assertEqual(self.auto_time.monotonic, max(deadline, 0))
+
+
 # ----------------------------------------------------------------------------
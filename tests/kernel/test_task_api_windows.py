@@ -5,7 +5,9 @@
 # See LICENSE for details.
 # ----------------------------------------------------------------------------
 
-from ppytty.kernel import run, api, window
+import random
+
+from ppytty.kernel import run, api, common, hw, window
 from ppytty.kernel.exceptions import TrapException
 from ppytty.kernel.state import state
 
@@ -116,15 +118,17 @@ class Test(helper_io.NoOutputTestCase):
             w = await api.window_create(0, 0, 40, 20)
             w.print('text-in-the-window')
             await api.window_render(w)
+            await api.frame_wait()
             await api.window_destroy(w)
 
         success, result = run(task)
         self.assertTrue(success)
         self.assertIsNone(result)
 
-        # Very simplified test: our window printed string was os.written.
+        # Very simplified test: our window printed string was os.written,
+        # followed by erasing the rest of the line.
         written_bytes = self.get_os_written_bytes()
-        self.assertIn(b'text-in-the-window ', written_bytes)
+        self.assertIn(b'text-in-the-window' + self.fake_tigetstr('el'), written_bytes)
 
 
     def test_complex_windows_print_and_render(self):
@@ -157,17 +161,26 @@ class Test(helper_io.NoOutputTestCase):
             if not top_win.overlaps(bot_win):
                 return False, 'top_win/bot_win do not overlap'
 
-            # rendering bot_win forces the overlapped top_win to render as well
-            await api.window_render(bot_win)
-
-            # rendering pseudo-assertions
+            await api.window_render(top_win)
+            await api.frame_wait()
             written_bytes = self.get_os_written_bytes()
-            if b'bot-win-frst-line' in written_bytes:
-                return False, 'bot-win-frst-line should not be rendered'
-            for expected_render in (b'bot-win-last-line', b'top-win-frst-line',
-                                    b'top-win-last-line',):
+            for expected_render in (b'top-win-frst-line', b'top-win-last-line',):
                 if expected_render not in written_bytes:
                     return False, f'{expected_render} not rendered'
+            self.reset_os_written_bytes()
+
+            # rendering bot_win only renders its parts not covered by top_win
+            await api.window_render(bot_win)
+            await api.frame_wait()
+
+            # rendering pseudo-assertions: terminal output is line based, so
+            # top-win-last-line, sharing a line with bot_win, is output again
+            written_bytes = self.get_os_written_bytes()
+            for not_there in (b'bot-win-frst-line', b'top-win-frst-line',):
+                if not_there in written_bytes:
+                    return False, f'{not_there} should not be rendered'
+            if b'bot-win-last-line' not in written_bytes:
+                return False, 'bot-win-last-line not rendered'
 
             # go for the non-overlapping window checks
             if oth_win.overlaps(top_win):
@@ -181,6 +194,7 @@ class Test(helper_io.NoOutputTestCase):
             # rendering oth_win should not re-render the other windows:
             # even though they are on top, they do not overlap
             await api.window_render(oth_win)
+            await api.frame_wait()
 
             # rendering pseudo-assertions
             written_bytes = self.get_os_written_bytes()
@@ -205,7 +219,9 @@ class Test(helper_io.NoOutputTestCase):
 
         async def child():
             w = await api.window_create(40, 0, 30, 10)
+            w.print('child-window-line', 0, 0)
             await api.window_render(w)
+            await api.frame_wait()
             await api.message_send(None, 'child-rendered')
             await api.message_wait()
 
@@ -224,15 +240,221 @@ class Test(helper_io.NoOutputTestCase):
             self.reset_os_written_bytes()
             await api.message_send(child, 'you-can-terminate')
             await api.task_wait()
+            await api.frame_wait()
+
+            # caller will assert on os written bytes and terminal contents
+            return self.get_os_written_bytes(), state.terminal.window._screen.display
+
+        success, (written_bytes, terminal_display) = run(parent)
+
+        self.assertTrue(success)
+        # The child window area is erased, with repeated blanks.
+        rep = self.fake_tparm(self.fake_tigetstr('rep'), ord(' '), len('child-window-line'))
+        self.assertIn(rep, written_bytes)
+        # The parent window is re-rendered but is unchanged in the output TTY.
+        self.assertNotIn(b'parent-window-frst-line', written_bytes)
+        self.assertNotIn(b'parent-window-last-line', written_bytes)
+        self.assertTrue(terminal_display[0].startswith('parent-window-frst-line'))
+        self.assertTrue(terminal_display[9].startswith('parent-window-last-line'))
+
+
+    def _expected_terminal_chars(self, windows):
+
+        # Painter's algorithm: the topmost window covering each cell wins.
+        t = state.terminal
+        expected = [[' '] * t.width for _ in range(t.height)]
+        for w in windows:
+            for y in range(max(0, w.top), min(t.height, w.top + w.height)):
+                for x in range(max(0, w.left), min(t.width, w.left + w.width)):
+                    expected[y][x] = w._screen.buffer[y-w.top][x-w.left].data
+        return expected
+
+
+    def _actual_terminal_chars(self):
+
+        t = state.terminal
+        buffer = t.window._screen.buffer
+        return [[buffer[y][x].data for x in range(t.width)] for y in range(t.height)]
+
+
+    def test_overlapping_windows_move_and_render(self):
+
+        rng = random.Random(42)
+
+        async def task():
+            windows = []
+            for n, letter in enumerate('abcde'):
+                w = await api.window_create(n*8, n*3, 30, 10)
+                for y in range(w.height):
+                    w.print(letter * w.width, 0, y)
+                windows.append(w)
+                await api.window_render(w)
+            if self._actual_terminal_chars() != self._expected_terminal_chars(windows):
+                return 'bad initial render'
+            for step in range(100):
+                w = rng.choice(windows)
+                w.move(dx=rng.randint(-6, 6), dy=rng.randint(-3, 3))
+                await api.window_render(w)
+                if self._actual_terminal_chars() != self._expected_terminal_chars(windows):
+                    return f'bad render at step {step}'
+            return None
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertIsNone(result)
+
+
+    def test_window_restack_and_render(self):
+
+        rng = random.Random(42)
+        restack_traps = (api.window_raise, api.window_lower, api.window_hide, api.window_show)
+
+        async def task():
+            windows = []
+            for n, letter in enumerate('abcde'):
+                w = await api.window_create(n*8, n*3, 30, 10)
+                for y in range(w.height):
+                    w.print(letter * w.width, 0, y)
+                windows.append(w)
+                await api.window_render(w)
+            for step in range(100):
+                w = rng.choice(windows)
+                if rng.random() < 0.3:
+                    w.move(dx=rng.randint(-6, 6), dy=rng.randint(-3, 3))
+                    await api.window_render(w)
+                await rng.choice(restack_traps)(w)
+                all_windows = state.all_windows
+                shown = [w for w in all_windows if not all_windows.is_hidden(w)]
+                if self._actual_terminal_chars() != self._expected_terminal_chars(shown):
+                    return f'bad render at step {step}'
+            return None
+
+        success, result = run(task)
+        self.assertTrue(success)
+        self.assertIsNone(result)
+
+
+    def test_window_hide_and_show_keep_contents(self):
+
+        async def task():
+            back = await api.window_create(0, 0, 40, 10)
+            back.print('back-window-line', 0, 0)
+            back.print('back-window-covered', 0, 5)
+            await api.window_render(back)
+            popup = await api.window_create(0, 5, 40, 2)
+            popup.print('popup-window-line', 0, 0)
+            await api.window_render(popup)
+            await api.frame_wait()
+
+            self.reset_os_written_bytes()
+            await api.window_hide(popup)
+            await api.frame_wait()
+            hidden_bytes = self.get_os_written_bytes()
+
+            self.reset_os_written_bytes()
+            await api.window_show(popup)
+            await api.frame_wait()
+            shown_bytes = self.get_os_written_bytes()
+            return hidden_bytes, shown_bytes, common.window_visibility()[popup]
+
+        success, result = run(task)
+        self.assertTrue(success)
+        hidden_bytes, shown_bytes, popup_visibility = result
+        # Only the popup's rows are repainted, from the intact window buffers.
+        self.assertIn(b'back-window-covered', hidden_bytes)
+        self.assertNotIn(b'back-window-line', hidden_bytes)
+        self.assertIn(b'popup-window-line', shown_bytes)
+        self.assertNotIn(b'back-window-line', shown_bytes)
+        self.assertEqual(popup_visibility, {0: [(0, 40)], 1: [(0, 40)]})
+
+
+    def test_window_restack_raises_with_bad_argument(self):
+
+        async def task():
+            non_window_object = 42
+            await api.window_hide(non_window_object)
+
+        success, result = run(task)
+        self.assertFalse(success)
+        self.assertIsInstance(result, TrapException)
+        self.assertIn('window', result.args[0])
+
+
+    def test_window_visibility(self):
+
+        async def task():
+            bottom = await api.window_create(0, 0, 20, 10)
+            top = await api.window_create(5, 2, 10, 3)
+            offscreen = await api.window_create(-5, 20, 10, 10)
+            return common.window_visibility(), bottom, top, offscreen
+
+        success, result = run(task)
+        self.assertTrue(success)
+        visibility, bottom, top, offscreen = result
+        self.assertEqual(visibility[top], {0: [(0, 10)], 1: [(0, 10)], 2: [(0, 10)]})
+        self.assertEqual(visibility[bottom][0], [(0, 20)])
+        self.assertEqual(visibility[bottom][2], [(0, 5), (15, 20)])
+        # x=-5 is 5 columns from the right: the right half is off-terminal.
+        self.assertEqual(visibility[offscreen], {n: [(0, 5)] for n in range(5)})
+
+
 
-            # caller will assert that os written bytes include our window
-            return self.get_os_written_bytes()
+    def test_window_renders_output_once_per_tick(self):
+
+        async def task():
+            windows = []
+            for n in range(3):
+                w = await api.window_create(n*10, n*2, 20, 5)
+                w.print(f'window-{n}')
+                windows.append(w)
+            self.reset_os_written_bytes()
+            for w in windows:
+                await api.window_render(w)
+            nothing_written = self.get_os_written_bytes() == b''
+            await api.frame_wait()
+            return nothing_written, self.get_os_written_bytes()
+
+        success, (nothing_written, written_bytes) = run(task)
+        self.assertTrue(success)
+        self.assertTrue(nothing_written)
+        # All windows, output in one terminal render.
+        for n in range(3):
+            self.assertIn(f'window-{n}'.encode(), written_bytes)
+        self.assertEqual(written_bytes.count(self.fake_tigetstr('civis')), 1)
 
-        success, written_bytes = run(parent)
 
+
+class TestFrameWait(helper_io.NoOutputAutoTimeTestCase):
+
+    def test_frame_wait_paced(self):
+
+        async def task():
+            w = await api.window_create(0, 0, 20, 5)
+            frame_times = []
+            for n in range(5):
+                w.print(f'frame-{n}', x=0, y=n)
+                await api.window_render(w)
+                await api.frame_wait()
+                frame_times.append(hw.time_monotonic())
+            return frame_times, self.get_os_written_bytes()
+
+        self.reset_os_written_bytes()
+        success, (frame_times, written_bytes) = run(task, frame_interval=0.5)
+        self.assertTrue(success)
+        self.assertTrue(all(t2 - t1 >= 0.5 for t1, t2 in zip(frame_times, frame_times[1:])))
+        self.assertIn(b'frame-4', written_bytes)
+
+
+    def test_frame_wait_with_nothing_rendered(self):
+
+        async def task():
+            await api.frame_wait()
+            await api.frame_wait()
+            return hw.time_monotonic()
+
+        success, result = run(task, frame_interval=0.5)
         self.assertTrue(success)
-        self.assertIn(b'parent-window-frst-line', written_bytes)
-        self.assertIn(b'parent-window-last-line', written_bytes)
+        self.assertGreaterEqual(result, 0.5)
 
 
 # ----------------------------------------------------------------------------
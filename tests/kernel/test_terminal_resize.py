@@ -0,0 +1,50 @@
+# ----------------------------------------------------------------------------
+# ppytty
+# ----------------------------------------------------------------------------
+# Copyright (c) Tiago Montes.
+# See LICENSE for details.
+# ----------------------------------------------------------------------------
+
+import os
+import signal
+from unittest import TestCase
+
+from ppytty.kernel import run, api, signals, HeadlessTerminal
+
+
+
+class Test(TestCase):
+
+    def test_resize_storm_coalesced(self):
+
+        t = HeadlessTerminal(40, 10)
+
+        async def task():
+            relative = await api.window_create(0, 0, 0.5, 0.5)
+            fixed = await api.window_create(0, 0, 10, 5)
+            resizes = []
+            relative.add_resize_callback(resizes.append)
+            fixed.add_resize_callback(resizes.append)
+
+            # The output terminal geometry changes, with a SIGWINCH storm.
+            t._fixed_width = 60
+            t._fixed_height = 20
+            for _ in range(20):
+                os.kill(os.getpid(), signal.SIGWINCH)
+                await api.sleep(0)
+            storming = (t.width, relative.width, len(resizes))
+
+            await api.sleep(signals.RESIZE_SETTLE_SECONDS * 2)
+            settled = (t.width, t.height, relative.width, relative.height, resizes)
+            return storming, settled, relative
+
+        success, result = run(task, terminal=t)
+        self.assertTrue(success)
+        storming, settled, relative = result
+        self.assertEqual(storming, (40, 20, 0))
+        # Resized once; windows with fixed geometry are not resized.
+        self.assertEqual(settled, (60, 20, 30, 10, [relative]))
+        self.assertEqual(t.display[0], ' ' * 60)
+
+
+# ----------------------------------------------------------------------------